@@ -8,13 +8,16 @@ import sys
 import json
 import traceback
 import copy
+import itertools
 from datetime import datetime
 from inventory import Inventory
 from market import Market
+from marketdepth import MarketDepth
 from clock import Duration
 from valuestream import ValueStream
 from configuration import load_datafile, load_yamlfile
-from graphnode import GraphNode
+from graphnode import GraphNode, GraphSite
+from graphoutput import CsvWriter, ColumnWriter
 import yaml
 try:
     from yaml import CLoader as Loader, CDumper as Dumper
@@ -27,6 +30,20 @@ def extract_args(argv):
         sys.exit(1)
     return argv[1:]
 
+""" Variants output: only the production trees combining non-dominated source options,
+    or every production tree on request
+"""
+VARIANTS = ['all', 'pruned']
+
+""" Supply costs are solved until no cost moves by more than the tolerance, or the passes run out
+"""
+DEFAULT_TOLERANCE = 1e-6
+DEFAULT_MAX_PASSES = 50
+
+""" Sites the production trees are costed at, unless the run file lists its own
+"""
+DEFAULT_SITES = ['Promitor']
+
 """  Load update the configuration object from the file
 """
 def load_config(args, timestamp):
@@ -36,7 +53,7 @@ def load_config(args, timestamp):
     # update config-date specific fields
     for key in config_file.keys():
         field = config_file[key]
-        if '{date}' in field:
+        if isinstance(field, str) and '{date}' in field:
             config_file[key] = field.replace('{date}', config_date)
 
     description = config_file['description']
@@ -48,6 +65,15 @@ def load_config(args, timestamp):
     currency = config_file['currency']
     csv_out_file = config_file['output-csv']
     logfile = config_file['logfile']
+    columns_file = config_file.get('output-columns')
+    sites = config_file.get('sites', DEFAULT_SITES)
+    if isinstance(sites, str):
+        sites = [sites]
+    variants = config_file.get('variants', 'pruned')
+    tolerance = float(config_file.get('tolerance', DEFAULT_TOLERANCE))
+    max_passes = int(config_file.get('max-passes', DEFAULT_MAX_PASSES))
+    if variants not in VARIANTS:
+        raise Exception('variants must be one of {}, not {}'.format(VARIANTS, variants))
 
     csvout = open(csv_out_file, 'w')
     logout = open(logfile, 'w')
@@ -63,12 +89,23 @@ def load_config(args, timestamp):
     print('  currency       : {}'.format(currency))
     print('  csv outfile   : {}'.format(csv_out_file))
     print('  log outfile   : {}'.format(logfile))
+    if columns_file is not None:
+        print('  columns outfile: {}'.format(columns_file))
+    print('  sites          : {}'.format(', '.join(sites)))
+    print('  variants       : {}'.format(variants))
+    print('  tolerance      : {} within {} passes'.format(tolerance, max_passes))
 
     templates = load_yamlfile(template_file)
     buildings = load_yamlfile(building_file)
     efficiency = load_yamlfile(efficiency_file)
     workers = load_yamlfile(worker_file)
     market = Market(load_yamlfile(exchange_file), currency)
+    depth = None
+    if 'market-depth' in config_file:
+        depth_config = config_file['market-depth'] or {}
+        depth = MarketDepth(market, depth_config.get('turnover', MarketDepth.DEFAULT_TURNOVER),
+                            depth_config.get('impact', MarketDepth.DEFAULT_IMPACT))
+        print('  market depth   : turnover {} impact {}'.format(depth.turnover, depth.impact))
 
     return {
         'config-date': config_date,
@@ -77,7 +114,13 @@ def load_config(args, timestamp):
         'efficiency': efficiency,
         'workers': workers,
         'market': market,
+        'market-depth': depth,
+        'sites': sites,
+        'variants': variants,
+        'tolerance': tolerance,
+        'max-passes': max_passes,
         'csv-out': csvout,
+        'columns-out': columns_file,
         'log': logout
     }
 
@@ -118,73 +161,242 @@ def create_source_map(config):
                 source_map[ticker] = [ticker + ".MKT", key]
     return source_map
 
-""" Builds all input combinations for templates 
-    Takes multiple sources into account for each input
-    Options are input as Lists of Source Option Lists 
-    
+""" Creates the templates in dependency order, grouped in their strongly connected components
+    A template depends on the templates producing its inputs. Each component holds templates
+    that depend on each other through a cycle of their inputs, or a single template, and
+    follows every component it depends on
+"""
+def create_component_list(config):
+    templates = config['templates']
+    sources = config['sources']
+    edges = {}
+    for key in templates.keys():
+        edges[key] = [source for input in templates[key]['inputs']
+                      for source in sources[input['id']] if source in templates]
+
+    # iterative Tarjan: a component is complete once its root has been left
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    components = []
+    for root in templates.keys():
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(edges[root]))]
+        while len(work) > 0:
+            key, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = low[child] = len(index)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(edges[child])))
+                    break
+                if child in on_stack:
+                    low[key] = min(low[key], index[child])
+            else:
+                work.pop()
+                if len(work) > 0:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[key])
+                if low[key] == index[key]:
+                    component = []
+                    member = None
+                    while member != key:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                    components.append(sorted(component, key=lambda member: index[member]))
+    return components
+
+""" Creates a map of the templates in a cycle to the position of their component
+    A component is a cycle when it holds several templates, or a template consuming its own output
+"""
+def create_cycle_map(config):
+    templates = config['templates']
+    sources = config['sources']
+    cycles = {}
+    for position, component in enumerate(config['components']):
+        key = component[0]
+        if len(component) > 1 or any(key in sources[input['id']] for input in templates[key]['inputs']):
+            for member in component:
+                cycles[member] = position
+    return cycles
+
+""" True when the source of an input of the key is a template in the same cycle as the key
+    The key is then built on the source's cheapest tree from the previous pass over the cycle
+"""
+def in_cycle(config, key, source):
+    cycles = config['cycles']
+    return key in cycles and cycles.get(source) == cycles[key]
+
+""" Counts the variants of the full enumeration of production trees for a key
+    A template without inputs, a market source and a source in the key's cycle each count as a single variant
+"""
+TREE_COUNTS = {}
+
+def count_prod_trees(config, key):
+    if '.MKT' in key:
+        return 1
+    if key in TREE_COUNTS:
+        return TREE_COUNTS[key]
+    count = 1
+    for input in config['templates'][key]['inputs']:
+        count = count * count_input_trees(config, key, input['id'])
+    TREE_COUNTS[key] = count
+    return count
+
+def count_input_trees(config, key, material):
+    return sum([1 if in_cycle(config, key, source) else count_prod_trees(config, source)
+                for source in config['sources'][material]])
+
+""" Iterates all variants of production trees for the provided key, in variant order
+    Variants are created as they are consumed: the input combinations are walked one input
+    at a time, the sources of the first input running slowest, and the trees of each input
+    source are iterated afresh under every combination of the inputs before it. Only the
+    trees along the current combination are held, at the cost of rebuilding input trees
+
     Example:
     Template that takes two inputs with 3 and 2 sourcing options respectively:
        options = [[A, B, C], [M, N]]
-    Results in 6 input combinations returned: 
-       result = [ [A,M], [A,N], [B,M], [B,N], [C,M], [C, N] ] 
+    Yields 6 input combinations: 
+       [A,M], [A,N], [B,M], [B,N], [C,M], [C, N]
 """
-def combine_options(options):
-    combos = []
-    if len(options) == 0:
-        return []
-    options = copy.copy(options)
-    head = options.pop(0)
-    if len(options) > 0:
-        subcombos = combine_options(options)
-        for option in head:
-            for subcombo in subcombos: 
-                combo = [option]
-                combo.extend(subcombo)
-                combos.append(combo)
-    else:
-        for option in head:
-            combo = [option]
-            combos.append(combo)
-    return combos
+def iter_prod_trees(config, key):
+    if '.MKT' in key or len(config['templates'][key]['inputs']) == 0:
+        yield GraphNode(config, key, 0, [])
+        return
+    variant = 0
+    for combo in iter_input_combos(config, key, []):
+        yield GraphNode(config, key, variant, combo)
+        variant = variant + 1
+
+""" Iterates the combinations of trees for the inputs of the key following the combo, each extending the combo
+"""
+def iter_input_combos(config, key, combo):
+    inputs = config['templates'][key]['inputs']
+    if len(combo) == len(inputs):
+        yield combo
+        return
+    for source in config['sources'][inputs[len(combo)]['id']]:
+        if in_cycle(config, key, source):
+            trees = cycle_trees(config, source)
+        else:
+            trees = iter_prod_trees(config, source)
+        for node in trees:
+            yield from iter_input_combos(config, key, combo + [node])
+
+""" The cheapest tree of a template in a cycle from the last pass over the cycle, as a list of none or one
+"""
+CYCLE_CACHE = {}
+
+def cycle_trees(config, key):
+    if (config['site'], key) in CYCLE_CACHE:
+        return [CYCLE_CACHE[(config['site'], key)]]
+    return []
+
+""" Source options of a material consumed by the key at the config's site, pruned to the production trees
+    not dominated by another
+    A tree is dominated when another costs no more per unit and takes no longer per unit of the
+    material, so the cheapest tree of the material is always kept. Options are (index, node) pairs,
+    the index being the position of the tree among the full enumeration of the material's sources.
+    Sources in the key's cycle offer their cheapest tree from the last pass over the cycle
+"""
+OPTION_CACHE = {}
+
+def source_options(config, material, key):
+    option_key = (config['site'], material, config['cycles'].get(key))
+    if option_key in OPTION_CACHE:
+        return OPTION_CACHE[option_key]
+    candidates = []
+    offset = 0
+    for source in config['sources'][material]:
+        if in_cycle(config, key, source):
+            for node in cycle_trees(config, source):
+                time = node.time_mod_mins / node.outputs[material]
+                candidates.append((node.total_cost_per_unit, time, offset, node))
+            offset = offset + 1
+            continue
+        for node in build_prod_tree(config, source):
+            time = node.time_mod_mins / node.outputs[material]
+            candidates.append((node.total_cost_per_unit, time, offset + node.variant, node))
+        offset = offset + count_prod_trees(config, source)
+    candidates.sort(key=lambda candidate: candidate[:3])
+    options = []
+    for cost, time, index, node in candidates:
+        if len(options) == 0 or time < options[-1][0]:
+            options.append((time, index, node))
+    OPTION_CACHE[option_key] = [(index, node) for time, index, node in options]
+    return OPTION_CACHE[option_key]
 
 TREE_CACHE = {}
 
-""" Builds production trees for the provided key (aka template id)
-    Returns all variants of possible production treess for a given template
+""" Builds production trees for the provided key (aka template id) at the config's site
+    Returns the variants combining the pruned source options of each input, numbered
+    as in the full enumeration
 """
 def build_prod_tree(config, key):
     if '.MKT' in key:
         return [ GraphNode(config, key, 0, []) ]
-    if key in TREE_CACHE:
-        return TREE_CACHE[key]
+    if (config['site'], key) in TREE_CACHE:
+        return TREE_CACHE[(config['site'], key)]
 
     trees = []
-    sources = config['sources']
     template = config['templates'][key]
 
     if len(template['inputs']) == 0:
         trees.append(GraphNode(config, key, 0, []))
     else:
-        # identify all input combinations and production trees
+        # position of each input in the mixed radix variant numbering
         input_options = []
+        radixes = []
         for input in template['inputs']:
-            input_trees = []
-            for source in sources[input['id']]:
-                source_chain = build_prod_tree(config, source)
-                input_trees.extend(source_chain)
-            input_options.append(input_trees)
-        input_combos = combine_options(input_options) 
+            input_options.append(source_options(config, input['id'], key))
+            radixes.append(count_input_trees(config, key, input['id']))
 
         # create a production tree root for each variation
-        variant = 0
-        for combo in input_combos:
-            combo_node = GraphNode(config, key, variant, combo)
-            trees.append(combo_node)
-            variant = variant + 1
+        for combo in itertools.product(*input_options):
+            variant = 0
+            for (index, node), radix in zip(combo, radixes):
+                variant = variant * radix + index
+            trees.append(GraphNode(config, key, variant, [node for index, node in combo]))
 
-    TREE_CACHE[key] = trees
+    TREE_CACHE[(config['site'], key)] = trees
     return trees
 
+""" Solves the production trees of a component whose templates consume each other's outputs
+    Each pass builds the templates on the cheapest trees of the previous pass for the sources in
+    the cycle, the first pass on the sources outside the cycle alone, until no cheapest tree moves
+    by more than the tolerance per unit. Returns the number of passes
+"""
+def solve_cycle(config, component):
+    site = config['site']
+    members = set(component)
+    for key in component:
+        CYCLE_CACHE.pop((site, key), None)
+    passes = 0
+    while True:
+        passes = passes + 1
+        invalidate_trees(config, members)
+        changed = 0
+        for key in component:
+            best = min(build_prod_tree(config, key), key=lambda node: node.total_cost_per_unit)
+            last = CYCLE_CACHE.get((site, key))
+            if last is None or abs(best.total_cost_per_unit - last.total_cost_per_unit) > config['tolerance']:
+                changed = changed + 1
+            CYCLE_CACHE[(site, key)] = best
+        print('cycle {}: pass {}, {} costs changed'.format('+'.join(component), passes, changed),
+              file=config['log'])
+        if changed == 0:
+            return passes
+        if passes >= config['max-passes']:
+            print('cycle {} not converged after {} passes'.format('+'.join(component), passes))
+            return passes
+
 """ creates a new instance of supply based on calculated values from nodes
 """
 def update_supply(config, nodes):
@@ -195,22 +407,109 @@ def update_supply(config, nodes):
         primary_output = template.split(".")[0]
         if primary_output in orig_supply: 
             for variant in nodes[template]:
-                if variant["total_cost_per_unit"] < new_supply[primary_output]:
-                    new_supply[primary_output] = variant["total_cost_per_unit"]
+                if variant.total_cost_per_unit < new_supply[primary_output]:
+                    new_supply[primary_output] = variant.total_cost_per_unit
     return new_supply
 
-""" write the production trees out as a cvs file
+""" Creates a map of the templates consuming the outputs of each template
+"""
+def create_dependent_map(config):
+    templates = config['templates']
+    sources = config['sources']
+    dependents = {key: set() for key in templates.keys()}
+    for key in templates.keys():
+        for input in templates[key]['inputs']:
+            for source in sources[input['id']]:
+                if source in dependents:
+                    dependents[source].add(key)
+    return dependents
+
+""" Creates a map of the templates whose workers consume each supply material at the config's site
 """
-def write_csv(config, nodes):
-    csvout = config['csv-out']
-    header_written = False
+def create_supply_user_map(config):
+    templates = config['templates']
+    site = GraphSite.get(config, config['site'])
+    users = {ticker: set() for ticker in config['supply'].keys()}
+    for key in templates.keys():
+        for ticker, rate, count, basis in site.line_supply_needs(templates[key]['line']):
+            users[ticker].add(key)
+    return users
+
+""" Drops the cached trees of the dirty templates at the config's site and the source options built from them
+"""
+def invalidate_trees(config, dirty):
+    for key in dirty:
+        TREE_CACHE.pop((config['site'], key), None)
+    for option_key in list(OPTION_CACHE.keys()):
+        site, material, cycle = option_key
+        if site == config['site'] and not dirty.isdisjoint(config['sources'][material]):
+            del OPTION_CACHE[option_key]
+
+""" Solves the supply costs at the config's site for their fixed point, returning the production trees
+    Supply costs depend on the trees producing the supplies, which consume supplies in turn, so the
+    trees are rebuilt until the costs settle. A pass only rebuilds the templates whose workers consume
+    a supply whose cost moved, and the templates consuming their outputs, the remaining trees are
+    reused from the cache. Templates are built a component at a time in dependency order, a single
+    template once, the templates of a cycle until their costs settle
+"""
+def solve_supply(config):
+    templates = config['templates']
+    dependents = create_dependent_map(config)
+    supply_users = create_supply_user_map(config)
+    nodes = {}
+    dirty = set(templates.keys())
+    passes = 0
+    rebuilt = 0
+    while len(dirty) > 0:
+        passes = passes + 1
+        invalidate_trees(config, dirty)
+        for component in config['components']:
+            if component[0] not in config['cycles']:
+                build_prod_tree(config, component[0])
+            elif not dirty.isdisjoint(component):
+                solve_cycle(config, component)
+        for key in templates.keys():
+            nodes[key] = build_prod_tree(config, key)
+        rebuilt = rebuilt + len(dirty)
+        new_supply = update_supply(config, nodes)
+        changed = [ticker for ticker in new_supply
+                   if abs(new_supply[ticker] - config['supply'][ticker]) > config['tolerance']]
+        if len(changed) > 0:
+            # a settled pass keeps the supply costs its trees were built with
+            config['supply'] = new_supply
+        print('pass {}: {} templates rebuilt, {} supply costs changed'.format(passes, len(dirty), len(changed)),
+              file=config['log'])
+
+        # the supply users and everything downstream of them
+        dirty = set()
+        pending = [key for ticker in changed for key in supply_users[ticker]]
+        while len(pending) > 0:
+            key = pending.pop()
+            if key not in dirty:
+                dirty.add(key)
+                pending.extend(dependents[key])
+        if len(dirty) > 0 and passes >= config['max-passes']:
+            print('supply costs not converged after {} passes'.format(passes))
+            break
+    print('{} passes, {} template rebuilds'.format(passes, rebuilt))
+    return nodes
+
+""" write the production trees out as they are produced, to the csv file and the columnar file if configured
+    nodes map each template to an iterable of its trees, returns the number of trees written
+"""
+def write_outputs(config, nodes):
+    writers = [CsvWriter(config['csv-out'])]
+    if config['columns-out'] is not None:
+        writers.append(ColumnWriter(config['columns-out'], GraphNode.OUTPUT_FIELDS, GraphNode.OUTPUT_TYPES))
+    count = 0
     for template in nodes.keys():
-        node_set = nodes[template]
-        for node in node_set:
-            if not header_written:
-                print(node.to_csv_header(), file=csvout)
-                header_written = True
-            print(node.to_csv_record(), file=csvout)
+        for node in nodes[template]:
+            for writer in writers:
+                writer.write(node)
+            count = count + 1
+    for writer in writers:
+        writer.close()
+    return count
 
 """ runtime entrypoint 
 """
@@ -222,47 +521,55 @@ def main(argv):
         config = load_config(args, timestamp)
         config['supply'] = create_supply_map(config)
         config['sources'] = create_source_map(config)
+        config['components'] = create_component_list(config)
+        config['cycles'] = create_cycle_map(config)
     
         sources_out = json.dumps(config['sources'], indent=2)
         print('sources:\n{}'.format(sources_out), file=config['log'])
         print("", file=config['log'])
         supply_out = json.dumps(config['supply'], indent=2)
         print('starting supply:\n{}'.format(supply_out), file=config['log'])
+        for component in config['components']:
+            if component[0] in config['cycles']:
+                print('cycle: {}'.format('+'.join(component)), file=config['log'])
 
         # process input files to produce the graph
-        # make multiple passes until supply costs stabilize
-        processing = True
+        # solve supply costs at each site until they stabilize, the site independent
+        # values of each template are computed once and shared by every site
         templates = config['templates']
         start = datetime.utcnow().timestamp()
         print('start processing: {}'.format(start))
+        site_configs = []
         nodes = {}
-        cnt = 0
-        while (processing):
-            cnt = cnt + 1
-            # supply_out = json.dumps(config['supply'])
-            # print('pass {} supply:\n{}'.format(cnt, supply_out), file=config['log'])
+        for site in config['sites']:
+            site_config = copy.copy(config)
+            site_config['site'] = site
+            print('site {}:'.format(site), file=config['log'])
+            site_nodes = solve_supply(site_config)
             for key in templates.keys():
-                nodes[key] = build_prod_tree(config, key)
-            new_supply = update_supply(config, nodes)
-            config['supply'] = new_supply
-            if cnt >= 5:
-                processing = False
-            
-        supply_out = json.dumps(config['supply'], indent=2)
-        print('ending supply:\n{}'.format(supply_out), file=config['log'])
+                nodes[(site, key)] = site_nodes[key]
+            site_configs.append(site_config)
+
+            supply_out = json.dumps(site_config['supply'], indent=2)
+            print('ending supply at {}:\n{}'.format(site, supply_out), file=config['log'])
 
         end = datetime.utcnow().timestamp()
         delta = end - start
         print('end processing: {} \u0394 {:8.6f}'.format(end, delta))
 
-        write_csv(config, nodes)
+        if config['variants'] == 'all':
+            outputs = {(site_config['site'], key): iter_prod_trees(site_config, key)
+                       for site_config in site_configs for key in templates.keys()}
+        else:
+            outputs = nodes
+        tree_count = write_outputs(config, outputs)
 
         done = datetime.utcnow().timestamp()
         delta = done - end
         print('outputs done: {} \u0394 {:8.6f}'.format(done, delta))
 
-        tree_count = sum(map(lambda x: len(nodes[x]), nodes.keys()))
-        print('{} production trees identified'.format(tree_count))
+        pruned_count = sum(map(lambda x: len(nodes[x]), nodes.keys()))
+        print('{} production trees identified, {} after pruning'.format(tree_count, pruned_count))
 
         print("done")
 
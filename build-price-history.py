@@ -0,0 +1,46 @@
+#!/usr/bin/python3
+""" append dated exchange files to the price history
+"""
+import os
+import re
+import sys
+import traceback
+import yaml
+try:
+    from yaml import CLoader as Loader, CDumper as Dumper
+except ImportError:
+    from yaml import Loader, Dumper
+from pricehistory import PriceHistory
+
+EXCHANGE_FILE = re.compile(r'exchange-(\d{4}-\d{2}-\d{2})\.yaml$')
+
+def extract_args(argv):
+    if len(argv) < 3:
+        print('usage: {} <history-file> <exchange-file> [<exchange-file> ...]'.format(argv[0]))
+        raise Exception("missing parms")
+    return argv[1:]
+
+def load_yaml(filename):
+    with open(filename, 'r') as infile:
+        return yaml.load(infile, Loader=Loader)
+
+def main(argv):
+    """ runtime entrypoint """
+    try:
+        args = extract_args(argv)
+        history = PriceHistory(args[0])
+        for exchange_file in sorted(args[1:]):
+            match = EXCHANGE_FILE.search(os.path.basename(exchange_file))
+            if not match:
+                raise Exception('{} is not named exchange-YYYY-MM-DD.yaml'.format(exchange_file))
+            added = history.add_exchanges(match.group(1), load_yaml(exchange_file))
+            print('{} {}: {} prices added'.format(match.group(1), exchange_file, added))
+        print('{}: {} prices over {} dates'.format(args[0], len(history), len(history.dates())))
+        return 0
+
+    except Exception:
+        traceback.print_exc()
+        return 100
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -30,9 +30,10 @@ def main(argv):
         exchanges = load_yaml(args[1])
         outfile = open(args[2], "w")
 
-        ica_market = Market(exchanges, "IC1")
-        ncc_market = Market(exchanges, "NC1")
-        cis_market = Market(exchanges, "CI1")
+        market = Market(exchanges)
+        ica_market = market.view("IC1")
+        ncc_market = market.view("NC1")
+        cis_market = market.view("CI1")
 
         inventory.output_summary("List Cost (ICA)", ica_market, outfile)
         inventory.output_summary("List Cost (NCC)", ncc_market, outfile)
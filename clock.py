@@ -6,124 +6,125 @@ HOURS = 1
 MINUTES = 2
 SECONDS = 3
 
-class Duration(object):
-    """ Duration Class
-    Note: Truncates seconds after normalizing hours and minutes
+MINUTES_PER_HOUR = 60
+MINUTES_PER_DAY = 24 * MINUTES_PER_HOUR
+
+def _split_minutes(minutes, seconds=0):
+    days, minutes = divmod(minutes, MINUTES_PER_DAY)
+    hours, minutes = divmod(minutes, MINUTES_PER_HOUR)
+    return [days, hours, minutes, seconds]
+
+def minutes_to_str(minutes):
+    """ formats a minute count using the same DD:HH:MM:SS layout as the clocks """
+    return '{:02d}:{:02d}:{:02d}:{:02d}'.format(*_split_minutes(minutes))
+
+class MinuteCounter(object):
+    """ MinuteCounter Class
+    Base for durations and clocks, holds a single integer minute count
+    The D:H:M:S view and its string form are derived lazily and cached per minute
     """
-    def __init__(self, duration_str):
-        self.vals = list(map(int, duration_str.split(":")))
-        if len(self.vals) > 4: 
-            raise Exception('error: invalid duration {}'.format(duration_str))
-        self._normalize()
+    __slots__ = ('minutes', 'seconds', '_view')
+
+    def __init__(self, minutes=0, seconds=0):
+        self.minutes = minutes
+        self.seconds = seconds
+        self._view = None
+
+    def _get_view(self):
+        view = self._view
+        if view is None or view[0] != self.minutes or view[1] != self.seconds:
+            vals = _split_minutes(self.minutes, self.seconds)
+            text = '{:02d}:{:02d}:{:02d}:{:02d}'.format(*vals)
+            view = (self.minutes, self.seconds, vals, text)
+            self._view = view
+        return view
+
+    @property
+    def vals(self):
+        """
+        a copy of the [days, hours, minutes, seconds] view, changing the list does not move the
+        counter, assign a whole list to vals (or set minutes) to do that
+        """
+        return list(self._get_view()[2])
+
+    @vals.setter
+    def vals(self, vals):
+        self.minutes = vals[DAYS] * MINUTES_PER_DAY + vals[HOURS] * MINUTES_PER_HOUR + vals[MINUTES]
+        self.seconds = vals[SECONDS]
 
     def __str__(self):
-        return '{:02d}:{:02d}:{:02d}:{:02d}'.format(self.vals[DAYS], self.vals[HOURS], self.vals[MINUTES], self.vals[SECONDS])
+        return self._get_view()[3]
 
     def __repr__(self):
-        return '{:02d}:{:02d}:{:02d}:{:02d}'.format(self.vals[DAYS], self.vals[HOURS], self.vals[MINUTES], self.vals[SECONDS])
+        return self._get_view()[3]
+
+    def to_minutes(self):
+        return self.minutes
+
+class Duration(MinuteCounter):
+    """ Duration Class
+    Note: Truncates seconds after normalizing hours and minutes
+    """
+    __slots__ = ()
+
+    def __init__(self, duration_str):
+        vals = list(map(int, duration_str.split(":")))
+        if len(vals) > 4:
+            raise Exception('error: invalid duration {}'.format(duration_str))
+        while len(vals) < 4:
+            vals.insert(0,0)
 
-    def _normalize(self):
-        while len(self.vals) < 4:
-            self.vals.insert(0,0)
-        
         # move excess (>=60) seconds to minutes, round remainder to nearest min
-        if self.vals[SECONDS] >= 60:
-            mins = self.vals[SECONDS] // 60
-            secs = self.vals[SECONDS] % 60
-            if secs >= 30:
+        seconds = vals[SECONDS]
+        minutes = vals[DAYS] * MINUTES_PER_DAY + vals[HOURS] * MINUTES_PER_HOUR + vals[MINUTES]
+        if seconds >= 60:
+            mins = seconds // 60
+            if seconds % 60 >= 30:
                 mins = mins + 1
-            self.vals[MINUTES] = self.vals[MINUTES] + mins
-            self.vals[SECONDS] = 0
-        # move excess (>=60) minutes to hours
-        if self.vals[MINUTES] >= 60:
-            hrs = self.vals[MINUTES] // 60
-            mins = self.vals[MINUTES] % 60
-            self.vals[HOURS] = self.vals[HOURS] + hrs
-            self.vals[MINUTES] = mins
-        # move excess (>=24) hours to days
-        if self.vals[HOURS] >= 24:
-            days = self.vals[HOURS] // 24
-            hrs = self.vals[HOURS] % 24
-            self.vals[DAYS] = self.vals[DAYS] + days
-            self.vals[HOURS] = hrs
+            minutes = minutes + mins
+            seconds = 0
+        MinuteCounter.__init__(self, minutes, seconds)
 
     def to_days(self):
-        return float(self.vals[DAYS]) + self.vals[HOURS]/24.0 + self.vals[MINUTES]/1440.0
-
-    def to_minutes(self):
-        return self.vals[DAYS] * 24 * 60 + self.vals[HOURS] * 60 + self.vals[MINUTES]
+        vals = self._get_view()[2]
+        return float(vals[DAYS]) + vals[HOURS]/24.0 + vals[MINUTES]/1440.0
 
     def apply_efficiency(self, efficiency):
-        mins = float(self.to_minutes()) / efficiency
-        self.vals[DAYS] = 0
-        self.vals[HOURS] = 0
-        self.vals[MINUTES] = int(mins)
-        self._normalize()
+        self.minutes = int(float(self.minutes) / efficiency)
 
     def apply_multiplier(self, multiplier):
-        mins = self.to_minutes() * multiplier
-        self.vals[DAYS] = 0
-        self.vals[HOURS] = 0
-        self.vals[MINUTES] = int(mins)
-        self._normalize()
-
-class IncrClock(object):
-    """ An Incrementing Clock 
+        self.minutes = int(self.minutes * multiplier)
+
+class IncrClock(MinuteCounter):
+    """ An Incrementing Clock
     Increments from 00:00:00 to the provided Duration
     """
+    __slots__ = ('duration',)
 
     def __init__(self, duration):
-        self.vals=[0,0,0,0]
+        MinuteCounter.__init__(self)
         self.duration = duration
 
-    def __str__(self):
-        return '{:02d}:{:02d}:{:02d}:{:02d}'.format(self.vals[DAYS], self.vals[HOURS], self.vals[MINUTES], self.vals[SECONDS])
-
-    def __repr__(self):
-        return '{:02d}:{:02d}:{:02d}:{:02d}'.format(self.vals[DAYS], self.vals[HOURS], self.vals[MINUTES], self.vals[SECONDS])
+    def step(self):
+        self.minutes = self.minutes + 1
+        return self.minutes < self.duration.minutes
 
-    def to_minutes(self):
-        return self.vals[DAYS] * 24 * 60 + self.vals[HOURS] * 60 + self.vals[MINUTES]
+    def jump_to(self, minutes):
+        """ moves the clock directly to the provided minute """
+        self.minutes = minutes
+        return self.minutes < self.duration.minutes
 
-    def step(self):
-        if self.vals[HOURS] >= 23 and self.vals[MINUTES] == 59:
-            self.vals[MINUTES] = 0
-            self.vals[HOURS] = 0
-            self.vals[DAYS] = self.vals[DAYS] + 1
-        elif self.vals[MINUTES] == 59:
-            self.vals[MINUTES] = 0
-            self.vals[HOURS] = self.vals[HOURS] + 1
-        else:
-            self.vals[MINUTES] = self.vals[MINUTES] + 1
-        return self.to_minutes() < self.duration.to_minutes()
-
-class DecrClock(object):
-    """ A Decrementing Clock 
+class DecrClock(MinuteCounter):
+    """ A Decrementing Clock
     Decrements from provided Duration to 00:00:00
     """
+    __slots__ = ('duration',)
 
     def __init__(self, duration):
-        self.vals=duration.vals
+        MinuteCounter.__init__(self, duration.minutes, duration.seconds)
         self.duration = duration
 
-    def __str__(self):
-        return '{:02d}:{:02d}:{:02d}:{:02d}'.format(self.vals[DAYS], self.vals[HOURS], self.vals[MINUTES], self.vals[SECONDS])
-
-    def __repr__(self):
-        return '{:02d}:{:02d}:{:02d}:{:02d}'.format(self.vals[DAYS], self.vals[HOURS], self.vals[MINUTES], self.vals[SECONDS])
-
-    def to_minutes(self):
-        return self.vals[DAYS] * 24 * 60 + self.vals[HOURS] * 60 + self.vals[MINUTES]
-
     def step(self):
-        if self.vals[HOURS] > 0 and self.vals[MINUTES] == 0:
-            self.vals[MINUTES] = 59
-            self.vals[HOURS] = self.vals[HOURS] - 1
-        elif self.vals[DAYS] > 0 and self.vals[MINUTES] == 0:
-            self.vals[MINUTES] = 59
-            self.vals[HOURS] = 23
-            self.vals[DAYS] = self.vals[DAYS] - 1
-        elif self.vals[MINUTES] > 0:
-            self.vals[MINUTES] = self.vals[MINUTES] - 1
-        return self.to_minutes() > 0
-
+        if self.minutes > 0:
+            self.minutes = self.minutes - 1
+        return self.minutes > 0
@@ -17,6 +17,7 @@ def main(argv):
         dt_tag = args[0]
         source = 'data/extract-{}.json'.format(dt_tag)
         exchange = 'data/exchange-{}.yaml'.format(dt_tag)
+        history = 'data/price-history.dat'
         inventory = 'data/inventory-{}.yaml'.format(dt_tag)
         sites = 'data/sites-{}.yaml'.format(dt_tag)
         templates = 'data/templates-{}.yaml'.format(dt_tag)
@@ -31,6 +32,9 @@ def main(argv):
         status = os.system('src/extract-broker-data.py {} > {}'.format(source, exchange))
         print('extract exchange data, exit code={}'.format(status))
 
+        status = os.system('src/build-price-history.py {} {}'.format(history, exchange))
+        print('append price history, exit code={}'.format(status))
+
         status = os.system('src/extract-inventory-data.py {} > {}'.format(source, inventory))
         print('extract inventory data, exit code={}'.format(status))
 
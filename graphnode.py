@@ -1,93 +1,122 @@
 """ Class representing a production tree graph node
 """
 
-import sys
-import json
-from clock import Duration
+import operator
+from clock import Duration, MINUTES_PER_DAY
 
-class GraphNode(dict):
-    def __init__(self, config, key, variant, input_nodes):
-        dict.__init__(self, 
-            template = key,
-            variant = variant,
-            description = "",
-            inputs = {},
-            outputs = {},
-            efficiency = 1.0,
-            time_base_mins = 0.0,
-            time_mod_mins = 0.0,
-            gross_value = 0.0,
-            supply_cost = 0.0,
-            input_cost = 0.0,
-            total_cost = 0.0,
-            net_value = 0.0,
-            gross_value_per_unit = 0.0,
-            supply_cost_per_unit = 0.0,
-            input_cost_per_unit = 0.0,
-            total_cost_per_unit = 0.0,
-            net_value_per_unit = 0.0,
-            gross_value_per_min = 0.0,
-            supply_cost_per_min = 0.0,
-            input_cost_per_min = 0.0,
-            total_cost_per_min = 0.0,
-            net_value_per_min = 0.0
-        )    
-        self._init_node(config, input_nodes)
-
-    def _init_node(self, config, input_nodes):
-        ticker = self['template'].split('.')[0]
+def calc_site_efficiency(building, site_efficiency):
+    """ efficiency of a building at a site from its COGC bonuses, experts and soil fertility """
+    value = 1.0
+    expertise = building['expertise']
+
+    # COGC Worker Efficiencies
+    for worker in building['workers']:
+        factor = 1.0 + site_efficiency['cogc-worker-bonus'][worker['type']]
+        value = value * factor
+
+    # COGC Industry Efficiencies
+    factor = 1.0 + site_efficiency['cogc-industry-bonus'][expertise]
+    value = value * factor
+
+    # Expert Efficiencies
+    experts = site_efficiency['experts'][expertise]
+    factor = 1.0 + site_efficiency['expert-factors'][experts]
+    value = value * factor
+
+    # Soil Fertility Efficiencies
+    if expertise == 'AGRICULTURE':
+        factor = 1.0 + site_efficiency['soil-fertility']
+        value = value * factor
+
+    return value
+
+SITE_CACHE = {}
+TEMPLATE_CACHE = {}
+SITE_TEMPLATE_CACHE = {}
+
+class GraphSite(object):
+    """ GraphSite Class
+    The efficiency and worker supply needs of each building line at a site, computed the first
+    time a template of the line is costed at the site
+    """
+    __slots__ = ('name', 'buildings', 'site_efficiency', 'workers', 'efficiencies', 'needs')
+
+    def __init__(self, config, name):
+        if name not in config['efficiency']:
+            raise Exception('site {} has no efficiency data'.format(name))
+        if name not in config['workers']:
+            raise Exception('site {} has no worker data'.format(name))
+        self.name = name
+        self.buildings = config['buildings']
+        self.site_efficiency = config['efficiency'][name]
+        self.workers = config['workers'][name]
+        self.efficiencies = {}
+        self.needs = {}
+
+    @staticmethod
+    def get(config, name):
+        """ the site, cached for the run """
+        if name not in SITE_CACHE:
+            SITE_CACHE[name] = GraphSite(config, name)
+        return SITE_CACHE[name]
+
+    def line_efficiency(self, line):
+        if line not in self.efficiencies:
+            self.efficiencies[line] = calc_site_efficiency(self.buildings[line], self.site_efficiency)
+        return self.efficiencies[line]
+
+    def line_supply_needs(self, line):
+        """ the (ticker, rate, count, basis) supply needs of the line's workers, in consumption order """
+        if line not in self.needs:
+            needs = []
+            for workertype in self.buildings[line]['workers']:
+                wcount = workertype['count']
+                worker = self.workers[workertype['type']]
+                # sum up daily consumption for both essential and non-essential supplies
+                # TODO consider separate valuation for essentials only
+                for need in worker['needs']:
+                    needs.append((need['id'], need['rate'], float(wcount), float(need['basis'])))
+            self.needs[line] = needs
+        return self.needs[line]
+
+class GraphTemplate(object):
+    """ GraphTemplate Class
+    Values of a template that do not depend on the site: its outputs, base time and gross value,
+    computed once per run and shared by the templates of every site
+    """
+    __slots__ = ('key', 'market', 'template', 'outputs', 'num_units', 'time_base_mins', 'gross_value',
+                 'input_cost')
+
+    def __init__(self, config, key):
+        ticker = key.split('.')[0]
         market = config['market']
-        supply = config['supply']
-        buildings = config['buildings']
-        efficiency = config['efficiency']
-        workers = config['workers']
-
-        if '.MKT' in self['template']:
-            price = market.price(ticker)
-            self['description'] = self['template']
-            self['outputs'][ticker] = 1
-            self["input_cost"] = price.avg
-            self["input_cost_per_unit"] = price.avg
-            self["input_cost_per_min"] = price.avg
-        else: 
-            template = config['templates'][self['template']]
-            self['description'] = self._init_description(template, input_nodes)
-            self['inputs'] = self._init_inputs(template, input_nodes)
-            self['outputs'] = self._init_outputs(template)
-            self['efficiency'] = self._init_efficiency(template, buildings, efficiency)
-            self['time_base_mins'] = Duration(template['time']).to_minutes()
-            self['time_mod_mins'] = Duration(template['time']).to_minutes() / self['efficiency']
-            self['gross_value'] = self._calc_gross_value(template, market)
-            self['gross_value_per_unit'] = self._calc_gross_value_per_unit()
-            self['gross_value_per_min'] = self._calc_gross_value_per_min(template)
-            self['input_cost'] = self._calc_input_cost()
-            self['input_cost_per_unit'] = self._calc_input_cost_per_unit()
-            self['input_cost_per_min'] = self._calc_input_cost_per_min(template)
-            self['supply_cost'] = self._calc_supply_cost(template, supply, buildings, workers)
-            self['supply_cost_per_unit'] = self._calc_supply_cost_per_unit()
-            self['supply_cost_per_min'] = self._calc_supply_cost_per_min(template)
-
-        self['total_cost'] = self['supply_cost'] + self['input_cost']
-        self['total_cost_per_unit'] = self['supply_cost_per_unit'] + self['input_cost_per_unit']
-        self['total_cost_per_min'] = self['supply_cost_per_min'] + self['input_cost_per_min']
-        self['net_value'] = self['gross_value'] - self['total_cost']
-        self['net_value_per_unit'] = self['gross_value_per_unit'] - self['total_cost_per_unit']
-        self['net_value_per_min'] = self['gross_value_per_min'] - self['total_cost_per_min']
-
-    def _init_description(self, template, input_nodes):
-        return '{}.{}<-{}'.format(self['template'], self['variant'], 
-            '+'.join(map(lambda node: node['template'] + '.' + str(node['variant']), input_nodes)))
-
-    def _init_inputs(self, template, input_nodes): 
-        inputs = {}
-        for input in template['inputs']:
-            for in_node in input_nodes:
-                if input['id'] in in_node['outputs']:
-                    inputs[input['id']] = {
-                        'count': input['count'],
-                        'node': in_node
-                    }
-        return inputs
+        self.key = key
+        self.market = '.MKT' in key
+        self.template = None
+        self.outputs = {}
+        self.num_units = 0
+        self.time_base_mins = 0.0
+        self.gross_value = 0.0
+        self.input_cost = 0.0
+
+        if self.market:
+            self.outputs[ticker] = 1
+            self.input_cost = market.price(ticker).avg
+        else:
+            template = config['templates'][key]
+            self.template = template
+            self.outputs = self._init_outputs(template)
+            for output in self.outputs.keys():
+                self.num_units = self.num_units + self.outputs[output]
+            self.time_base_mins = Duration(template['time']).to_minutes()
+            self.gross_value = self._calc_gross_value(template, market)
+
+    @staticmethod
+    def get(config, key):
+        """ the site independent values of the template, cached for the run """
+        if key not in TEMPLATE_CACHE:
+            TEMPLATE_CACHE[key] = GraphTemplate(config, key)
+        return TEMPLATE_CACHE[key]
 
     def _init_outputs(self, template):
         outputs = {}
@@ -95,35 +124,6 @@ class GraphNode(dict):
             outputs[output['id']] = output['count']
         return outputs
 
-    def _init_efficiency(self, template, buildings, efficiency):
-        value = 1.0
-        prodline = template['line']
-        building = buildings[prodline]
-        expertise = building['expertise']
-        # TODO fix hard code for Promitor
-        site_efficiency = efficiency['Promitor']
-
-        # COGC Worker Efficiencies
-        for worker in building['workers']:
-            factor = 1.0 + site_efficiency['cogc-worker-bonus'][worker['type']]
-            value = value * factor
-            
-        # COGC Industry Efficiencies
-        factor = 1.0 + site_efficiency['cogc-industry-bonus'][expertise]
-        value = value * factor
-
-        # Expert Efficiencies
-        experts = site_efficiency['experts'][expertise]
-        factor = 1.0 + site_efficiency['expert-factors'][experts]
-        value = value * factor
-
-        # Soil Fertility Efficiencies
-        if expertise == 'AGRICULTURE':
-            factor = 1.0 + site_efficiency['soil-fertility']
-            value = value * factor
-
-        return value
-        
     def _calc_gross_value(self, template, market):
         value = 0.0
         for output in template['outputs']:
@@ -131,84 +131,245 @@ class GraphNode(dict):
             value = value + price.avg * output['count']
         return value
 
-    def _calc_gross_value_per_unit(self):
-        value = self['gross_value']
-        num_units = 0
-        for output in self['outputs'].keys():
-            num_units = num_units + self['outputs'][output]
-        return value / float(num_units)
-
-    def _calc_gross_value_per_min(self, template):
-        value = self['gross_value']
-        duration = Duration(template['time'])
-        efficiency = self['efficiency']
-        num_mins = duration.to_minutes() / efficiency
-        return value / float(num_mins)
-
-    def _calc_input_cost(self): 
-        cost = 0.0
-        for ticker in self['inputs']:
-            input = self['inputs'][ticker]
-            cost = cost + input['count'] * input['node']['total_cost_per_unit']
-        return cost
+class SiteTemplate(object):
+    """ SiteTemplate Class
+    Values shared by every production tree of a template at a site: the site independent values
+    with the efficiency, times and sell-through at the site. The supply cost is kept for the last
+    supply map it was computed for, since every tree of a pass is valued against the same supply map
+    """
+    __slots__ = ('site', 'key', 'market', 'template', 'outputs', 'num_units', 'efficiency', 'time_base_mins',
+                 'time_mod_mins', 'gross_value', 'sell_through', 'input_cost', 'supply_needs',
+                 'supply', 'supply_cost')
+
+    def __init__(self, config, site, shared):
+        self.site = site.name
+        self.key = shared.key
+        self.market = shared.market
+        self.template = shared.template
+        self.outputs = shared.outputs
+        self.num_units = shared.num_units
+        self.efficiency = 1.0
+        self.time_base_mins = shared.time_base_mins
+        self.time_mod_mins = 0.0
+        self.gross_value = shared.gross_value
+        self.sell_through = 1.0
+        self.input_cost = shared.input_cost
+        self.supply_needs = []
+        self.supply = None
+        self.supply_cost = 0.0
+
+        if not self.market:
+            line = self.template['line']
+            self.efficiency = site.line_efficiency(line)
+            self.time_mod_mins = self.time_base_mins / self.efficiency
+            self.supply_needs = site.line_supply_needs(line)
+            # a single building producing around the clock, its outputs sold at the depth of the exchange
+            runs_per_day = MINUTES_PER_DAY / self.time_mod_mins
+            self.sell_through = self._calc_sell_through(self.template, config['market'],
+                                                        config.get('market-depth'), runs_per_day)
+
+    @staticmethod
+    def get(config, key):
+        """ the values of the template at the config's site, cached for the run """
+        site = config['site']
+        if (site, key) not in SITE_TEMPLATE_CACHE:
+            SITE_TEMPLATE_CACHE[(site, key)] = SiteTemplate(config, GraphSite.get(config, site),
+                                                            GraphTemplate.get(config, key))
+        return SITE_TEMPLATE_CACHE[(site, key)]
+
+    def _calc_sell_through(self, template, market, depth, runs_per_day):
+        """ the fraction of the gross value per day realized within the depth of the exchange """
+        if depth is None:
+            return 1.0
+        gross = 0.0
+        realized = 0.0
+        for output in template['outputs']:
+            price = market.price(output['id'])
+            units = output['count'] * runs_per_day
+            gross = gross + price.avg * units
+            realized = realized + price.avg * depth.sellable(output['id'], units)
+        if gross <= 0.0:
+            return 1.0
+        return realized / gross
+
+    def calc_supply_cost(self, supply):
+        """ the cost of the worker supplies consumed over a production cycle """
+        if self.market:
+            return 0.0
+        if supply is not self.supply:
+            time_factor = self.time_mod_mins / (24 * 60)
+            cost = 0.0
+            for ticker, rate, wcount, basis in self.supply_needs:
+                cost = cost + supply[ticker] * rate * wcount / basis * time_factor
+            self.supply = supply
+            self.supply_cost = cost
+        return self.supply_cost
+
+class GraphNode(object):
+    """ GraphNode Class
+    A production tree variant of a template at a site, holding only its variant number, input trees
+    and costs; every other value is derived from the shared site template values when read
+    """
+    __slots__ = ('shared', 'variant', 'input_nodes', 'input_cost', 'supply_cost')
+
+    def __init__(self, config, key, variant, input_nodes):
+        self.shared = SiteTemplate.get(config, key)
+        self.variant = variant
+        self.input_nodes = tuple(input_nodes)
+        self.input_cost = self.shared.input_cost
+        if not self.shared.market:
+            self.input_cost = self._calc_input_cost()
+        self.supply_cost = self.shared.calc_supply_cost(config['supply'])
 
-    def _calc_input_cost_per_unit(self):
-        value = self['input_cost']
-        num_units = 0
-        for output in self['outputs'].keys():
-            num_units = num_units + self['outputs'][output]
-        return value / float(num_units)
-
-    def _calc_input_cost_per_min(self, template):
-        value = self['input_cost']
-        duration = Duration(template['time'])
-        efficiency = self['efficiency']
-        num_mins = duration.to_minutes() / efficiency
-        return value / float(num_mins)
-
-    def _calc_supply_cost(self, template, supply, buildings, workers): 
+    def _calc_input_cost(self):
         cost = 0.0
-        prodline = template['line']
-        building = buildings[prodline]
-        workertypes = building['workers']
-
-        # identify time factor
-        duration = Duration(template['time'])
-        efficiency = self['efficiency']
-        num_mins = duration.to_minutes() / efficiency
-        time_factor = num_mins / (24 * 60)
-
-        # sum up supply costs for all supplies for all workers for 24 hours
-        for workertype in workertypes:
-            wtype = workertype['type']
-            wcount = workertype['count']
-            # TODO handle location correctly (don't hardcode Prom)
-            worker = workers['Promitor'][wtype]
-            # sum up daily consumption for both essential and non-essential supplies
-            # TODO consider separate valuation for essentials only
-            for need in worker['needs']:
-                rate = need['rate']
-                basis = need['basis']
-                ticker = need['id']
-                price = supply[ticker]
-                supply_cost = price * rate * float(wcount) / float(basis) * time_factor
-                cost = cost + supply_cost 
-        
+        inputs = self.inputs
+        for ticker in inputs:
+            input = inputs[ticker]
+            cost = cost + input['count'] * input['node'].total_cost_per_unit
         return cost
 
-    def _calc_supply_cost_per_unit(self):
-        value = self['supply_cost']
-        num_units = 0
-        for output in self['outputs'].keys():
-            num_units = num_units + self['outputs'][output]
-        return value / float(num_units)
+    @property
+    def template(self):
+        return self.shared.key
+
+    @property
+    def site(self):
+        return self.shared.site
+
+    @property
+    def description(self):
+        if self.shared.market:
+            return self.shared.key
+        return '{}.{}<-{}'.format(self.shared.key, self.variant,
+            '+'.join(map(lambda node: node.template + '.' + str(node.variant), self.input_nodes)))
+
+    @property
+    def inputs(self):
+        inputs = {}
+        if self.shared.market:
+            return inputs
+        for input in self.shared.template['inputs']:
+            for in_node in self.input_nodes:
+                if input['id'] in in_node.outputs:
+                    inputs[input['id']] = {
+                        'count': input['count'],
+                        'node': in_node
+                    }
+        return inputs
+
+    @property
+    def outputs(self):
+        return self.shared.outputs
+
+    @property
+    def efficiency(self):
+        return self.shared.efficiency
+
+    @property
+    def time_base_mins(self):
+        return self.shared.time_base_mins
+
+    @property
+    def time_mod_mins(self):
+        return self.shared.time_mod_mins
+
+    @property
+    def gross_value(self):
+        return self.shared.gross_value
 
-    def _calc_supply_cost_per_min(self, template):
-        value = self['supply_cost']
-        duration = Duration(template['time'])
-        efficiency = self['efficiency']
-        num_mins = duration.to_minutes() / efficiency
-        return value / float(num_mins)
+    @property
+    def total_cost(self):
+        return self.supply_cost + self.input_cost
+
+    @property
+    def net_value(self):
+        return self.shared.gross_value - (self.supply_cost + self.input_cost)
+
+    # the per unit and per minute values divide each value before summing, market nodes are
+    # bought per unit and carry only their input cost
+
+    @property
+    def gross_value_per_unit(self):
+        shared = self.shared
+        return 0.0 if shared.market else shared.gross_value / float(shared.num_units)
+
+    @property
+    def supply_cost_per_unit(self):
+        shared = self.shared
+        return 0.0 if shared.market else self.supply_cost / float(shared.num_units)
+
+    @property
+    def input_cost_per_unit(self):
+        shared = self.shared
+        return self.input_cost if shared.market else self.input_cost / float(shared.num_units)
+
+    @property
+    def total_cost_per_unit(self):
+        shared = self.shared
+        if shared.market:
+            return self.input_cost
+        units = float(shared.num_units)
+        return self.supply_cost / units + self.input_cost / units
+
+    @property
+    def net_value_per_unit(self):
+        shared = self.shared
+        if shared.market:
+            return 0.0 - self.input_cost
+        units = float(shared.num_units)
+        return shared.gross_value / units - (self.supply_cost / units + self.input_cost / units)
+
+    @property
+    def gross_value_per_min(self):
+        shared = self.shared
+        return 0.0 if shared.market else shared.gross_value / float(shared.time_mod_mins)
+
+    @property
+    def supply_cost_per_min(self):
+        shared = self.shared
+        return 0.0 if shared.market else self.supply_cost / float(shared.time_mod_mins)
+
+    @property
+    def input_cost_per_min(self):
+        shared = self.shared
+        return self.input_cost if shared.market else self.input_cost / float(shared.time_mod_mins)
+
+    @property
+    def total_cost_per_min(self):
+        shared = self.shared
+        if shared.market:
+            return self.input_cost
+        mins = float(shared.time_mod_mins)
+        return self.supply_cost / mins + self.input_cost / mins
+
+    @property
+    def net_value_per_min(self):
+        shared = self.shared
+        if shared.market:
+            return 0.0 - self.input_cost
+        mins = float(shared.time_mod_mins)
+        return shared.gross_value / mins - (self.supply_cost / mins + self.input_cost / mins)
+
+    @property
+    def units_per_day(self):
+        shared = self.shared
+        if shared.market:
+            return 0.0
+        return sum(shared.outputs.values()) * (MINUTES_PER_DAY / shared.time_mod_mins)
+
+    @property
+    def sell_through(self):
+        return self.shared.sell_through
+
+    @property
+    def net_value_per_day(self):
+        shared = self.shared
+        if shared.market:
+            return 0.0
+        mins = float(shared.time_mod_mins)
+        return (shared.gross_value / mins * shared.sell_through
+                - (self.supply_cost / mins + self.input_cost / mins)) * MINUTES_PER_DAY
 
     OUTPUT_FIELDS = [
         'outputs',
@@ -232,17 +393,29 @@ class GraphNode(dict):
         'supply_cost_per_min',
         'input_cost_per_min',
         'total_cost_per_min',
-        'net_value_per_min'
+        'net_value_per_min',
+        'units_per_day',
+        'sell_through',
+        'net_value_per_day',
+        'site'
     ]
 
+    # column types of the fields for typed outputs, variants of pruned trees may exceed 64 bits
+    OUTPUT_TYPES = dict([(field, 'd') for field in OUTPUT_FIELDS],
+        outputs = 's', template = 's', variant = 's', description = 's', site = 's')
+
+    # the properties of every field read in a single call
+    OUTPUT_GETTER = operator.attrgetter(*OUTPUT_FIELDS)
+    OUTPUTS_COLUMN = OUTPUT_FIELDS.index('outputs')
+
     def to_csv_header(self):
         return ",".join(GraphNode.OUTPUT_FIELDS)
 
+    def to_values(self):
+        """ the values of the OUTPUT_FIELDS, read through the properties, the outputs as dotted tickers """
+        values = list(GraphNode.OUTPUT_GETTER(self))
+        values[GraphNode.OUTPUTS_COLUMN] = '.'.join(values[GraphNode.OUTPUTS_COLUMN])
+        return values
+
     def to_csv_record(self):
-        values = []
-        for field in GraphNode.OUTPUT_FIELDS:
-            if field == 'outputs':
-                values.append('.'.join(self['outputs']))
-            else:
-                values.append(str(self[field]))
-        return ",".join(values)
\ No newline at end of file
+        return ",".join(map(str, self.to_values()))
@@ -0,0 +1,151 @@
+""" streamed outputs of production trees """
+
+import sys
+import struct
+from array import array
+
+class CsvWriter(object):
+    """ CsvWriter Class
+    Writes production trees as csv records, buffering the records of a block of trees
+    into a single write
+    """
+    DEFAULT_BLOCK_ROWS = 4096
+
+    def __init__(self, outfile, block_rows=DEFAULT_BLOCK_ROWS):
+        self.outfile = outfile
+        self.block_rows = block_rows
+        self.header_written = False
+        self.lines = []
+
+    def write(self, node):
+        if not self.header_written:
+            self.lines.append(node.to_csv_header())
+            self.header_written = True
+        self.lines.append(node.to_csv_record())
+        if len(self.lines) >= self.block_rows:
+            self.flush()
+
+    def flush(self):
+        if len(self.lines) > 0:
+            self.outfile.write('\n'.join(self.lines) + '\n')
+            self.lines = []
+        self.outfile.flush()
+
+    def close(self):
+        self.flush()
+
+class ColumnWriter(object):
+    """ ColumnWriter Class
+    Writes production trees to a compact columnar file, typed per column: 'd' columns as
+    little-endian doubles, 's' columns as utf-8 text after the byte length of each value.
+    Trees are written in blocks holding each column contiguously, every column prefixed by
+    its size, so a reader loads only the columns it needs by skipping over the others
+    """
+    MAGIC = b'PUGC0001'
+    TYPES = ('d', 's')
+    COLUMN = struct.Struct('<BH')
+    BLOCK = struct.Struct('<I')
+    SIZE = struct.Struct('<Q')
+    DEFAULT_BLOCK_ROWS = 16384
+
+    def __init__(self, path, fields, types, block_rows=DEFAULT_BLOCK_ROWS):
+        for field in fields:
+            if types[field] not in ColumnWriter.TYPES:
+                raise Exception('column {} has unknown type {}'.format(field, types[field]))
+        self.path = path
+        self.fields = fields
+        self.types = [types[field] for field in fields]
+        self.block_rows = block_rows
+        self.columns = [[] for field in fields]
+        self.rows = 0
+        self.outfile = open(path, 'wb')
+        self.outfile.write(ColumnWriter.MAGIC)
+        self.outfile.write(ColumnWriter.BLOCK.pack(len(fields)))
+        for field, ftype in zip(self.fields, self.types):
+            name = field.encode()
+            self.outfile.write(ColumnWriter.COLUMN.pack(ord(ftype), len(name)))
+            self.outfile.write(name)
+
+    def write(self, node):
+        for column, value in zip(self.columns, node.to_values()):
+            column.append(value)
+        self.rows = self.rows + 1
+        if self.rows >= self.block_rows:
+            self.flush()
+
+    def flush(self):
+        if self.rows == 0:
+            return
+        self.outfile.write(ColumnWriter.BLOCK.pack(self.rows))
+        for column, ftype in zip(self.columns, self.types):
+            if ftype == 'd':
+                data = _to_bytes(array('d', column))
+            else:
+                text = [str(value).encode() for value in column]
+                data = _to_bytes(array('I', map(len, text))) + b''.join(text)
+            self.outfile.write(ColumnWriter.SIZE.pack(len(data)))
+            self.outfile.write(data)
+        self.columns = [[] for field in self.fields]
+        self.rows = 0
+
+    def close(self):
+        self.flush()
+        self.outfile.close()
+
+def _to_bytes(values):
+    """ the little-endian bytes of an array """
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+def _from_bytes(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+def read_columns(path, columns=None):
+    """
+    loads the named columns of a columnar production tree file, all of them by default,
+    returns a mapping of column name to an array of doubles or a list of text values
+    """
+    with open(path, 'rb') as infile:
+        if infile.read(len(ColumnWriter.MAGIC)) != ColumnWriter.MAGIC:
+            raise Exception('{} is not a columnar production tree file'.format(path))
+        (count,) = ColumnWriter.BLOCK.unpack(infile.read(ColumnWriter.BLOCK.size))
+        fields = []
+        for cnum in range(count):
+            ftype, length = ColumnWriter.COLUMN.unpack(infile.read(ColumnWriter.COLUMN.size))
+            fields.append((infile.read(length).decode(), chr(ftype)))
+        names = [name for name, ftype in fields]
+        if columns is None:
+            columns = names
+        for name in columns:
+            if name not in names:
+                raise Exception('{} has no column {}'.format(path, name))
+        result = {name: array('d') if ftype == 'd' else [] for name, ftype in fields if name in columns}
+
+        header = infile.read(ColumnWriter.BLOCK.size)
+        while len(header) == ColumnWriter.BLOCK.size:
+            (rows,) = ColumnWriter.BLOCK.unpack(header)
+            for name, ftype in fields:
+                (size,) = ColumnWriter.SIZE.unpack(infile.read(ColumnWriter.SIZE.size))
+                if name not in result:
+                    infile.seek(size, 1)
+                    continue
+                data = infile.read(size)
+                if len(data) != size:
+                    raise Exception('{} is truncated'.format(path))
+                if ftype == 'd':
+                    result[name].extend(_from_bytes('d', data))
+                else:
+                    lengths = _from_bytes('I', data[:rows * 4])
+                    pos = rows * 4
+                    for length in lengths:
+                        result[name].append(data[pos:pos + length].decode())
+                        pos = pos + length
+            header = infile.read(ColumnWriter.BLOCK.size)
+        if len(header) != 0:
+            raise Exception('{} is truncated'.format(path))
+    return result
@@ -2,80 +2,250 @@
 
 import sys
 import json
+from array import array
+from materials import Materials
+from market import PriceAccumulator
 from report import Report
 
 class Inventory(object):
-    """ Inventory Class 
+    """ Inventory Class
     Container for managing the current inventory
+    Counts are held in a float array indexed by the shared material registry, the
+    held list keeps the materials in the order they were first added for reporting.
+    Snapshots share the arrays until either inventory is next changed
     """
 
     def __init__(self, inventory):
-        self.items = {}
+        self.counts = array('d')
+        self.held = bytearray()
+        self.order = []
+        self.shared = False
         for key in inventory.keys():
-            self.items[key] = inventory[key]
+            idx = self._index(key)
+            self.counts[idx] = inventory[key]
 
     def __str__(self):
         return json.dumps(self.items)
 
+    @property
+    def items(self):
+        """ the inventory as a ticker to count dictionary """
+        counts = self.counts
+        return {Materials.ticker(idx): counts[idx] for idx in self.order}
+
+    def _own(self):
+        """ copies the arrays shared with a snapshot before they are changed """
+        self.counts = array('d', self.counts)
+        self.held = bytearray(self.held)
+        self.order = list(self.order)
+        self.shared = False
+
+    def _grow(self):
+        missing = len(Materials) - len(self.counts)
+        if missing > 0:
+            self.counts.extend(array('d', bytes(8 * missing)))
+            self.held.extend(bytes(missing))
+
+    def _hold(self, idx):
+        """ makes sure the material at idx is held, returning idx """
+        if self.shared:
+            self._own()
+        if idx >= len(self.counts):
+            self._grow()
+        if not self.held[idx]:
+            self.held[idx] = 1
+            self.order.append(idx)
+        return idx
+
+    def _index(self, item):
+        return self._hold(Materials.index(item))
+
+    def snapshot(self):
+        """ a copy of the inventory sharing the arrays until either is changed """
+        copy = Inventory.__new__(Inventory)
+        copy.counts = self.counts
+        copy.held = self.held
+        copy.order = self.order
+        copy.shared = True
+        self.shared = True
+        return copy
+
     def count(self, item):
-        if item in self.items:
-            return self.items[item]
-        return 0.0
+        idx = Materials.find(item)
+        if idx is None or idx >= len(self.held) or not self.held[idx]:
+            return 0.0
+        return self.counts[idx]
 
     def has(self, item, count):
-        if item in self.items and self.items[item] >= count:
-            return True
-        return False
+        idx = Materials.find(item)
+        if idx is None or idx >= len(self.held) or not self.held[idx]:
+            return False
+        return self.counts[idx] >= count
 
     def add(self, item, count):
-        if item not in self.items:
-            self.items[item] = float(count)
-        else:
-            self.items[item] = self.items[item] + float(count)
+        idx = self._index(item)
+        self.counts[idx] = self.counts[idx] + float(count)
         return True
 
     def remove(self, item, count):
-        if item in self.items and self.items[item] >= count:
-            self.items[item] = self.items[item] - count
-            return True
-        return False
+        if not self.has(item, count):
+            return False
+        if self.shared:
+            self._own()
+        idx = Materials.find(item)
+        self.counts[idx] = self.counts[idx] - count
+        return True
+
+    def has_all(self, vector):
+        """ true when every (material index, count) pair of the vector is in stock """
+        counts = self.counts
+        held = self.held
+        size = len(held)
+        for idx, count in vector:
+            if idx >= size or not held[idx] or counts[idx] < count:
+                return False
+        return True
+
+    def remove_all(self, vector):
+        """ removes every (material index, count) pair of the vector, or nothing if any is short """
+        if not self.has_all(vector):
+            return False
+        if self.shared:
+            self._own()
+        counts = self.counts
+        for idx, count in vector:
+            counts[idx] = counts[idx] - count
+        return True
 
     def diff(self, other):
-        net = {}
-        for key in self.items.keys(): 
-            start_val = other.count(key)
-            net[key] = self.items[key] - start_val
-        return Inventory(net)
+        net = Inventory({})
+        for idx in self.order:
+            net._hold(idx)
+            other_count = 0.0
+            if idx < len(other.held) and other.held[idx]:
+                other_count = other.counts[idx]
+            net.counts[idx] = self.counts[idx] - other_count
+        return net
 
     def add_all(self, materials):
+        """ adds a ticker to count dictionary or another inventory """
+        if isinstance(materials, Inventory):
+            for idx in materials.order:
+                self._hold(idx)
+                self.counts[idx] = self.counts[idx] + materials.counts[idx]
+            return
         for key in materials.keys():
             self.add(key, materials[key])
 
+    def value(self, market):
+        """ the total value of the inventory at the market, valued as a whole count array """
+        total = PriceAccumulator()
+        market.accumulate(total, self.counts, self.order)
+        return total.total()
+
     def output_summary(self, label, market, outfile):
         summary = self.summarize_inventory(market)
 
         report = Report(outfile)
         report.start()
-        report.output_value_table(summary['inventory'], label) 
+        report.output_value_table(summary['inventory'], label)
         report.end()
 
     def summarize_inventory(self, market):
+        items = self.items
+        values = market.value(items)['values']
         inventory = {}
-        for product in self.items.keys(): 
-            count = self.items[product]
-            price = market.price(product)
-            value = price.multiply(count)
-
-            if product in inventory:
-                inventory[product]['count'] = inventory[product]['count'] + count
-                inventory[product]['value'] = inventory[product]['value'].add(value)
-            else:
-                inventory[product] = {}
-                inventory[product]['count'] = count
-                inventory[product]['value'] = value
+        for product, count in items.items():
+            inventory[product] = {'count': count, 'value': values[product]}
 
         return {
             'inventory': inventory
         }
-            
-        
\ No newline at end of file
+
+EMPTY_INVENTORY = Inventory({})
+
+class SiteInventories(object):
+    """ SiteInventories Class
+    Inventories partitioned by site-name, production lines draw from and produce to the
+    inventory of their own site. Every site inventory is indexed by the shared material
+    registry, so the balance of a material at a site is a single array lookup.
+    An inventory file without sites is one inventory shared by every site
+    """
+
+    def __init__(self, inventories):
+        self.sites = {}
+        self.shared = None
+        if SiteInventories.is_partitioned(inventories):
+            for site_name in inventories.keys():
+                self.sites[site_name] = Inventory(inventories[site_name])
+        else:
+            self.shared = Inventory(inventories)
+
+    @staticmethod
+    def is_partitioned(inventories):
+        """ true for inventory data keyed by site-name, each site holding its own materials """
+        values = list(inventories.values())
+        return len(values) > 0 and all(isinstance(value, dict) for value in values)
+
+    def __str__(self):
+        if self.shared is not None:
+            return str(self.shared)
+        return json.dumps({site_name: inventory.items for site_name, inventory in self.sites.items()})
+
+    def partitioned(self):
+        return self.shared is None
+
+    def site(self, site_name):
+        """ the inventory a site draws from, sites without an inventory start empty """
+        if self.shared is not None:
+            return self.shared
+        if site_name not in self.sites:
+            self.sites[site_name] = Inventory({})
+        return self.sites[site_name]
+
+    def site_names(self):
+        return list(self.sites.keys())
+
+    def balance(self, site_name, item):
+        return self.lookup(site_name).count(item)
+
+    def balances(self, item):
+        """ the balance of the material at every site """
+        if self.shared is not None:
+            return {None: self.shared.count(item)}
+        return {site_name: inventory.count(item) for site_name, inventory in self.sites.items()}
+
+    def total(self, item):
+        return sum(self.balances(item).values())
+
+    def snapshot(self):
+        copy = SiteInventories({})
+        if self.shared is not None:
+            copy.shared = self.shared.snapshot()
+        else:
+            copy.shared = None
+            copy.sites = {site_name: inventory.snapshot() for site_name, inventory in self.sites.items()}
+        return copy
+
+    def lookup(self, site_name):
+        """ the inventory of a site without adding one, sites without an inventory are empty """
+        if self.shared is not None:
+            return self.shared
+        return self.sites.get(site_name, EMPTY_INVENTORY)
+
+    def diff(self, other):
+        net = SiteInventories({})
+        if self.shared is not None:
+            net.shared = self.shared.diff(other.lookup(None))
+        else:
+            net.shared = None
+            net.sites = {site_name: inventory.diff(other.lookup(site_name))
+                         for site_name, inventory in self.sites.items()}
+        return net
+
+    def output_summary(self, label, market, outfile):
+        if self.shared is not None:
+            self.shared.output_summary(label, market, outfile)
+            return
+        for site_name, inventory in self.sites.items():
+            inventory.output_summary('{} ({})'.format(label, site_name), market, outfile)
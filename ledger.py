@@ -2,12 +2,71 @@
 """
 
 import json
-from market import Price
+from array import array
+from market import Price, PriceAccumulator
 from report import Report
+from clock import minutes_to_str
+from materials import Materials
 from configuration import Buildings
 
+class RunLengths(object):
+    """ RunLengths Class
+    Run-length encoded per-minute ledger values, stored as (start minute, end minute, 
+    value, description) intervals with both ends inclusive.
+    Minute count, value total and min/max are maintained as intervals are added
+    """
+
+    def __init__(self):
+        self.starts = array('l')
+        self.ends = array('l')
+        self.values = array('d')
+        self.descriptions = array('H')
+        self.total = 0
+        self.weighted_total = 0.0
+        self.min = None
+        self.max = None
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, start, end, value, description):
+        """ adds a span, extending the last interval when it continues with the same value """
+        last = len(self.starts) - 1
+        if last >= 0 and self.ends[last] == start - 1 and self.values[last] == value \
+           and self.descriptions[last] == description:
+            self.ends[last] = end
+        else:
+            self.starts.append(start)
+            self.ends.append(end)
+            self.values.append(value)
+            self.descriptions.append(description)
+        self._update_totals(end - start + 1, value * (end - start + 1), value, value)
+
+    def merge(self, runs):
+        """ adds the totals of another set of run lengths, the intervals are not copied """
+        if runs.total > 0:
+            self._update_totals(runs.total, runs.weighted_total, runs.min, runs.max)
+
+    def _update_totals(self, minutes, weighted, low, high):
+        self.total = self.total + minutes
+        self.weighted_total = self.weighted_total + weighted
+        if self.min is None or low < self.min:
+            self.min = low
+        if self.max is None or high > self.max:
+            self.max = high
+
 class Ledger(object):
     """ Ledger Class
+    Entries are stored column-wise in typed arrays (minute, type, description, product, 
+    count, value) with products interned through the shared material registry; 
+    any other entry fields are kept per row in the details map.
+    The per-minute STATUS and EFFICIENCY entries are stored as run lengths.
+    Counts per (type, product) and the missing/purchase messages are kept as running
+    totals, so summaries and merges cost O(products) rather than a pass over the entries.
+    With a price curve each totaled entry is also valued at the price in effect at its
+    minute, and summaries use those running values instead of the static market price.
+    With a market depth the value of each output is scaled by its sell-through.
+    Entries added with a cost, such as bulk purchases, are valued at that cost
     """
     INPUT = "input"
     OUTPUT = "output"
@@ -17,43 +76,169 @@ class Ledger(object):
     MISSING_SUPPLY = "missing_supply"
     PURCHASE_INPUT = "purchase_input"
     PURCHASE_SUPPLY = "purchase_supply"
+    SHIPMENT = "shipment"
+    DELIVERY = "delivery"
+    PROCURE_SUPPLY = "procure_supply"
+
+    TYPES = [INPUT, OUTPUT, STATUS, EFFICIENCY, MISSING_INPUT, MISSING_SUPPLY, PURCHASE_INPUT, PURCHASE_SUPPLY,
+             SHIPMENT, DELIVERY, PROCURE_SUPPLY]
+    TYPE_CODES = {itemtype: code for code, itemtype in enumerate(TYPES)}
+    DESCRIPTIONS = []
+    DESCRIPTION_CODES = {}
+    NO_PRODUCT = -1
+    RUN_LENGTH_TYPES = [EFFICIENCY, STATUS]
+    TOTALED_TYPES = [OUTPUT, INPUT, PURCHASE_INPUT, PURCHASE_SUPPLY, PROCURE_SUPPLY]
+    MESSAGES = {
+        PURCHASE_INPUT: ('missing_inputs', '{0[clock]} {0[line]}.{0[bnum]} purchased {0[count]:4.2f} ' +\
+                         '{0[product]} (need {0[need]:4.2f} have {0[available]:4.2f})'),
+        PURCHASE_SUPPLY: ('missing_supplies', '{0[clock]} {0[line]} purchased {0[count]:4.2f} ' +\
+                          '{0[product]} (need {0[need]:4.2f} have {0[available]:4.2f})'),
+        MISSING_INPUT: ('missing_inputs', '{0[clock]} {0[line]}.{0[bnum]} missing {0[count]:4.2f} ' +\
+                        '{0[ticker]} (need {0[need]:4.2f} have {0[available]:4.2f})'),
+        MISSING_SUPPLY: ('missing_supplies', '{0[clock]} {0[line]} missing {0[count]:4.2f} ' +\
+                         '{0[ticker]} (need {0[need]:4.2f} have {0[available]:4.2f})')
+    }
 
     ACTIVE = 1
     INACTIVE = 0
 
-    def __init__(self, stream_id, line_id, line_type, building_count, market):
+    def __init__(self, stream_id, line_id, line_type, building_count, market, curve=None, depth=None):
         self.stream_id = stream_id
         self.line_id = line_id
         self.line_type = line_type
         self.building_count = building_count
         self.market = market
-        self.entries = []
+        self.curve = curve
+        self.depth = depth
+        self.minutes = array('l')
+        self.types = array('b')
+        self.descriptions = array('H')
+        self.products = array('l')
+        self.counts = array('d')
+        self.values = array('d')
+        self.details = {}
+        self.runs = {itemtype: RunLengths() for itemtype in Ledger.RUN_LENGTH_TYPES}
+        self.totals = {}
+        self.valued = {}
+        self.messages = {'missing_inputs': [], 'missing_supplies': []}
         self.start_efficiency = None
         self.end_efficiency = None
 
     def __str__(self):
         return json.dumps({'line_id': self.line_id, 'entries': self.entries})
 
-    def add(self, clock, itemtype, description, **kwargs):
-        """ adds items to the ledger """
+    def __len__(self):
+        return len(self.types) + sum(map(len, self.runs.values()))
+
+    @property
+    def entries(self):
+        """ the ledger entries in their dictionary form, run lengths expanded per minute """
+        entries = [(self.minutes[row], self.entry(row)) for row in range(0, len(self.types))]
+        for itemtype in Ledger.RUN_LENGTH_TYPES:
+            runs = self.runs[itemtype]
+            for start, end, value, description in \
+                    zip(runs.starts, runs.ends, runs.values, runs.descriptions):
+                for minute in range(start, end + 1):
+                    entry = {
+                        'clock': minutes_to_str(minute),
+                        'type': itemtype,
+                        'description': Ledger.DESCRIPTIONS[description],
+                    }
+                    if itemtype == Ledger.STATUS:
+                        entry['state'] = int(value)
+                    else:
+                        entry['value'] = value
+                    entries.append((minute, entry))
+        entries.sort(key=lambda item: item[0])
+        return [entry for minute, entry in entries]
+
+    def entry(self, row):
+        """ rebuilds the dictionary form of a single ledger entry """
         entry = {
-            'clock': str(clock),
-            'type': itemtype,
-            'description': description,
+            'clock': minutes_to_str(self.minutes[row]),
+            'type': Ledger.TYPES[self.types[row]],
+            'description': Ledger.DESCRIPTIONS[self.descriptions[row]],
+            'count': self.counts[row]
         }
-        for key, value in kwargs.items():
-            entry[key] = value
-        self.entries.append(entry)
+        if self.products[row] != Ledger.NO_PRODUCT:
+            entry['product'] = Materials.ticker(self.products[row])
+        if row in self.details:
+            entry.update(self.details[row])
+        return entry
 
-        # update efficiency summary
-        if entry['type'] == Ledger.EFFICIENCY and self.start_efficiency is None:
-            self.start_efficiency = entry['value']
-        if entry['type'] == Ledger.EFFICIENCY:
-            self.end_efficiency = entry['value']
+    def add(self, clock, itemtype, description, **kwargs):
+        """ adds items to the ledger """
+        self.add_minute(clock.to_minutes(), itemtype, description, **kwargs)
+
+    def add_minute(self, minute, itemtype, description, product=None, count=0.0, 
+                   value=0.0, state=0, cost=None, **kwargs):
+        """ 
+        adds items to the ledger at the provided clock minute
+        a cost is the amount actually paid for the items, valuing them instead of the market price
+        """
+        if itemtype in self.runs:
+            self.add_span(minute, minute, itemtype, description, value=value, state=state)
+            return
+
+        if kwargs:
+            self.details[len(self.types)] = kwargs
+        self.minutes.append(minute)
+        self.types.append(Ledger.TYPE_CODES[itemtype])
+        self.descriptions.append(self._description_code(description))
+        if product is None:
+            self.products.append(Ledger.NO_PRODUCT)
+        else:
+            self.products.append(Materials.index(product))
+        self.counts.append(count)
+        self.values.append(value)
+
+        # update running totals
+        if itemtype in Ledger.TOTALED_TYPES:
+            key = (itemtype, product)
+            self.totals[key] = self.totals.get(key, 0.0) + count
+            if cost is not None:
+                if key not in self.valued:
+                    self.valued[key] = PriceAccumulator()
+                self.valued[key].add(Price.of(cost, cost, cost, cost))
+            elif self.curve is not None:
+                if key not in self.valued:
+                    self.valued[key] = PriceAccumulator()
+                self.valued[key].add_multiple(self.curve.price(product, minute), count)
+        if itemtype in Ledger.MESSAGES:
+            messages, fmt = Ledger.MESSAGES[itemtype]
+            self.messages[messages].append(fmt.format(self.entry(len(self.types) - 1)))
+
+    def add_span(self, start, end, itemtype, description, value=0.0, state=0):
+        """ adds a STATUS or EFFICIENCY value holding for every minute from start to end """
+        if itemtype == Ledger.STATUS:
+            value = state
+        self.runs[itemtype].add(start, end, value, self._description_code(description))
 
+        # update efficiency summary
+        if itemtype == Ledger.EFFICIENCY and self.start_efficiency is None:
+            self.start_efficiency = value
+        if itemtype == Ledger.EFFICIENCY:
+            self.end_efficiency = value
+
+    def price(self, product, minute):
+        """ the price of the product at the run minute, from the price curve when there is one """
+        if self.curve is not None:
+            return self.curve.price(product, minute)
+        return self.market.price(product)
+
+    def _description_code(self, description):
+        code = Ledger.DESCRIPTION_CODES.get(description)
+        if code is None:
+            code = len(Ledger.DESCRIPTIONS)
+            Ledger.DESCRIPTION_CODES[description] = code
+            Ledger.DESCRIPTIONS.append(description)
+        return code
 
     def add_ledger(self, ledger):
-        """ merges two ledgers, adding one to the current instance """
+        """ 
+        merges two ledgers, adding the running totals of one to the current instance 
+        the entries themselves are not copied
+        """
         # merge efficiency numbers between the ledgers
         if self.start_efficiency is None:
             self.start_efficiency = ledger.start_efficiency
@@ -63,8 +248,17 @@ class Ledger(object):
             self.end_efficiency = ledger.end_efficiency
         elif ledger.end_efficiency is not None:
             self.end_efficiency = (self.end_efficiency + ledger.end_efficiency)/2
-        # add the passed ledger to self
-        self.entries.extend(ledger.entries)
+        # add the totals of the passed ledger to self
+        for key, count in ledger.totals.items():
+            self.totals[key] = self.totals.get(key, 0.0) + count
+        for key, value in ledger.valued.items():
+            if key not in self.valued:
+                self.valued[key] = PriceAccumulator()
+            self.valued[key].add(value)
+        for messages in ledger.messages.keys():
+            self.messages[messages].extend(ledger.messages[messages])
+        for itemtype in Ledger.RUN_LENGTH_TYPES:
+            self.runs[itemtype].merge(ledger.runs[itemtype])
 
     def output_summary(self, duration, outfile):
         """ outputs a summary of the ledger to the provided outfile """
@@ -125,6 +319,12 @@ class Ledger(object):
                 report.output_general(missing)
 
         report.end()
+        return self.metrics(summary)
+
+    def metrics(self, summary=None):
+        """ headline metrics of the ledger, net gain/loss, uptime and efficiencies """
+        if summary is None:
+            summary = self.summarize_ledger()
         return {
             'net': summary['total_gain_loss'].avg,
             'uptime': summary['uptime_percent'],
@@ -132,129 +332,70 @@ class Ledger(object):
             'e-delta': summary['efficiencies']['delta']
         }
 
+    def snapshot(self):
+        """ compact summary of the running totals, suitable for streaming as JSON """
+        summary = self.summarize_ledger()
+        net_production = {}
+        for product in summary['net_production'].keys():
+            net_production[product] = summary['net_production'][product]['count']
+        return {
+            'line': self.line_id,
+            'uptime': summary['uptime_percent'],
+            'efficiencies': summary['efficiencies'],
+            'net_production': net_production,
+            'gain_loss': summary['total_gain_loss'].avg
+        }
+
     def summarize_ledger(self):
         """ generates summary metrics for the ledger """
-        total_cycles = 0
-        active_cycles = 0
-        efficiencies = []
         production = {}
         consumption = {}
         net_production = {}
         purchases = {}
-        total_production_value = Price()
-        total_production_cost = Price()
-        total_purchases = Price()
-        missing_inputs = []
-        missing_supplies = []
-
-        for entry in self.entries:
-            if entry['type'] == Ledger.STATUS:
-                total_cycles = total_cycles + 1
-                active_cycles = active_cycles + entry['state']
-
-            elif entry['type'] == Ledger.EFFICIENCY:
-                efficiencies.append(entry['value'])
-
-            elif entry['type'] == Ledger.OUTPUT:
-                product = entry['product']
-                count = entry['count']
-                price = self.market.price(product)
-                value = price.multiply(count)
-                total_production_value = total_production_value.add(value)
-
-                if product in production:
-                    production[product]['count'] = production[product]['count'] + count
-                    production[product]['value'] = production[product]['value'].add(value)
-                else:
-                    production[product] = {}
-                    production[product]['count'] = count
-                    production[product]['value'] = value
-
-                if product in net_production:
-                    net_production[product]['count'] = net_production[product]['count'] + count
-                    net_production[product]['value'] = net_production[product]['value'].add(value)
-                else:
-                    net_production[product] = {}
-                    net_production[product]['count'] = count
-                    net_production[product]['value'] = value
-
-            elif entry['type'] == Ledger.INPUT:
-                product = entry['product']
-                count = -entry['count']
-                price = self.market.price(product)
-                value = price.multiply(count)
-                total_production_cost = total_production_cost.add(value)
-
-                if product in consumption:
-                    consumption[product]['count'] = consumption[product]['count'] + count
-                    consumption[product]['value'] = consumption[product]['value'].add(value)
-                else:
-                    consumption[product] = {}
-                    consumption[product]['count'] = count
-                    consumption[product]['value'] = value
-
-                if product in net_production:
-                    net_production[product]['count'] = net_production[product]['count'] + count
-                    net_production[product]['value'] = net_production[product]['value'].add(value)
-                else:
-                    net_production[product] = {}
-                    net_production[product]['count'] = -count
-                    net_production[product]['value'] = value
-
-            elif entry['type'] == Ledger.PURCHASE_INPUT:
-                product = entry['product']
-                count = entry['count']
-                price = self.market.price(product)
-                value = price.multiply(count)
-                total_purchases = total_purchases.add(value)
-
-                fmt = '{0[clock]} {0[line]}.{0[bnum]} purchased {0[count]:4.2f} {0[product]} ' +\
-                      '(need {0[need]:4.2f} have {0[available]:4.2f})'
-                missing_inputs.append(fmt.format(entry))
-
-                if product in purchases:
-                    purchases[product]['count'] = purchases[product]['count'] + count
-                    purchases[product]['value'] = purchases[product]['value'].add(value)
-                else:
-                    purchases[product] = {}
-                    purchases[product]['count'] = count
-                    purchases[product]['value'] = value
-
-            elif entry['type'] == Ledger.PURCHASE_SUPPLY:
-                product = entry['product']
-                count = entry['count']
-                price = self.market.price(product)
-                value = price.multiply(count)
-                total_purchases = total_purchases.add(value)
-
-                fmt = '{0[clock]} {0[line]} purchased {0[count]:4.2f} {0[product]} ' +\
-                      '(need {0[need]:4.2f} have {0[available]:4.2f})'
-                missing_supplies.append(fmt.format(entry))
-
-                if product in purchases:
-                    purchases[product]['count'] = purchases[product]['count'] + count
-                    purchases[product]['value'] = purchases[product]['value'].add(value)
-                else:
-                    purchases[product] = {}
-                    purchases[product]['count'] = count
-                    purchases[product]['value'] = value
-
-            elif entry['type'] == Ledger.MISSING_INPUT:
-                fmt = '{0[clock]} {0[line]}.{0[bnum]} missing {0[count]:4.2f} {0[ticker]} ' +\
-                      '(need {0[need]:4.2f} have {0[available]:4.2f})'
-                missing_inputs.append(fmt.format(entry))
-
-            elif entry['type'] == Ledger.MISSING_SUPPLY:
-                fmt = '{0[clock]} {0[line]} missing {0[count]:4.2f} {0[ticker]} ' +\
-                      '(need {0[need]:4.2f} have {0[available]:4.2f})'
-                missing_supplies.append(fmt.format(entry))
-
+        production_value = PriceAccumulator()
+        production_cost = PriceAccumulator()
+        purchases_cost = PriceAccumulator()
+
+        states = self.runs[Ledger.STATUS]
+        total_cycles = states.total
+        active_cycles = int(states.weighted_total)
+
+        for (itemtype, product), count in self.totals.items():
+            valued = self.valued.get((itemtype, product))
+            if itemtype == Ledger.INPUT:
+                count = -count
+            if valued is not None:
+                value = valued.total()
+                if itemtype == Ledger.INPUT:
+                    value = value.multiply(-1)
+            else:
+                value = self.market.price(product).multiply(count)
+            if itemtype == Ledger.OUTPUT and self.depth is not None:
+                sell_through = self.depth.sell_through(product)
+                if sell_through < 1.0:
+                    value = value.multiply(sell_through)
+
+            if itemtype == Ledger.OUTPUT:
+                production_value.add(value)
+                self._add_to_summary(production, product, count, value)
+                self._add_to_summary(net_production, product, count, value)
+            elif itemtype == Ledger.INPUT:
+                production_cost.add(value)
+                self._add_to_summary(consumption, product, count, value)
+                self._add_to_summary(net_production, product, count, value)
+            else:
+                purchases_cost.add(value)
+                self._add_to_summary(purchases, product, count, value)
+
+        total_production_value = production_value.total()
+        total_production_cost = production_cost.total()
+        total_purchases = purchases_cost.total()
         total_gain_loss = total_production_value.add(total_production_cost)
         return {
             'total_cycles': total_cycles,
             'active_cycles': active_cycles,
             'uptime_percent': float(active_cycles)/float(total_cycles),
-            'efficiencies': self._summarize_efficiencies(efficiencies),
+            'efficiencies': self._summarize_efficiencies(self.runs[Ledger.EFFICIENCY]),
             'production': production,
             'consumption': consumption,
             'net_production': net_production,
@@ -263,16 +404,25 @@ class Ledger(object):
             'total_production_cost': total_production_cost,
             'total_gain_loss': total_gain_loss,
             'total_purchases': total_purchases,
-            'missing_inputs': missing_inputs,
-            'missing_supplies': missing_supplies
+            'missing_inputs': list(self.messages['missing_inputs']),
+            'missing_supplies': list(self.messages['missing_supplies'])
         }
 
+    def _add_to_summary(self, summary, product, count, value):
+        if product in summary:
+            summary[product]['count'] = summary[product]['count'] + count
+            summary[product]['value'] = summary[product]['value'].add(value)
+        else:
+            summary[product] = {}
+            summary[product]['count'] = count
+            summary[product]['value'] = value
+
     def _summarize_efficiencies(self, efficiencies):
         result = {}
-        if len(efficiencies) > 0:
-            result['mean'] = sum(efficiencies)/len(efficiencies)
-            result['min'] = min(efficiencies)
-            result['max'] = max(efficiencies)
+        if efficiencies.total > 0:
+            result['mean'] = efficiencies.weighted_total/efficiencies.total
+            result['min'] = efficiencies.min
+            result['max'] = efficiencies.max
             result['start'] = self.start_efficiency
             result['end'] = self.end_efficiency
             result['delta'] = self.end_efficiency - self.start_efficiency
@@ -1,13 +1,20 @@
 """ class for representing the market """
 
 import sys
+import copy
+import math
 import json
+import operator
+from array import array
+from materials import Materials
 
 class Price(object):
     """ Price Class
+    Immutable last/ask/bid/avg quote, missing values are treated as 0.0 in arithmetic.
+    Price data may be a price dictionary or a [last, ask, bid, avg] vector
     """
     HEADER_FMT = '{:>12s} {:>12s} {:>12s} {:>12s}'.format('Last', 'Ask', 'Bid', 'Avg')
-
+    __slots__ = ('last', 'ask', 'bid', 'avg', 'supply', 'demand')
 
     def __init__(self, pricedata=None):
         self.last = 0
@@ -16,7 +23,9 @@ class Price(object):
         self.bid = 0
         self.supply = 0
         self.demand = 0
-        if pricedata:
+        if isinstance(pricedata, (list, tuple)):
+            self.last, self.ask, self.bid, self.avg = pricedata
+        elif pricedata:
             self.last = pricedata['last']
             self.avg = pricedata['avg']
             self.ask = pricedata['ask']
@@ -24,6 +33,18 @@ class Price(object):
             self.supply = pricedata['supply']
             self.demand = pricedata['demand']
 
+    @classmethod
+    def of(cls, last, ask, bid, avg, supply=0, demand=0):
+        """ builds a price from its values without going through a price dictionary """
+        price = object.__new__(cls)
+        price.last = last
+        price.ask = ask
+        price.bid = bid
+        price.avg = avg
+        price.supply = supply
+        price.demand = demand
+        return price
+
     def _format_value(self, value):
         if value:
             return '{:>12.2f}'.format(value)
@@ -46,44 +67,116 @@ class Price(object):
             'demand': self.demand
         })
 
-    def _handle_none(self, val):
-        if (val): 
-            return val
-        return 0.0
+    @property
+    def values(self):
+        """ the (last, ask, bid, avg) vector with missing values as 0.0 """
+        return (self.last or 0.0, self.ask or 0.0, self.bid or 0.0, self.avg or 0.0)
 
     def multiply(self, factor):
-        newprice = {
-            'last': self._handle_none(self.last) * factor,
-            'ask': self._handle_none(self.ask) * factor,
-            'bid': self._handle_none(self.bid) * factor,
-            'avg': self._handle_none(self.avg) * factor,
-            'supply': self.supply,
-            'demand': self.demand
-        }
-        return Price(newprice)
+        return Price.of((self.last or 0.0) * factor, (self.ask or 0.0) * factor,
+                        (self.bid or 0.0) * factor, (self.avg or 0.0) * factor,
+                        self.supply, self.demand)
 
     def add(self, price):
-        newprice = {
-            'last': self._handle_none(self.last) + self._handle_none(price.last),
-            'ask': self._handle_none(self.ask) + self._handle_none(price.ask),
-            'bid': self._handle_none(self.bid) + self._handle_none(price.bid),
-            'avg': self._handle_none(self.avg) + self._handle_none(price.avg),
-            'supply': self.supply,
-            'demand': self.demand
-        }
-        return Price(newprice)
+        return Price.of((self.last or 0.0) + (price.last or 0.0), (self.ask or 0.0) + (price.ask or 0.0),
+                        (self.bid or 0.0) + (price.bid or 0.0), (self.avg or 0.0) + (price.avg or 0.0),
+                        self.supply, self.demand)
+
+class PriceAccumulator(object):
+    """ PriceAccumulator Class
+    Mutable running total of prices, summing in place rather than building a Price per step
+    """
+    __slots__ = ('last', 'ask', 'bid', 'avg')
+
+    def __init__(self):
+        self.last = 0.0
+        self.ask = 0.0
+        self.bid = 0.0
+        self.avg = 0.0
+
+    def add(self, price):
+        self.last = self.last + (price.last or 0.0)
+        self.ask = self.ask + (price.ask or 0.0)
+        self.bid = self.bid + (price.bid or 0.0)
+        self.avg = self.avg + (price.avg or 0.0)
+
+    def add_multiple(self, price, count):
+        """ adds the price of count units, the same as add(price.multiply(count)) """
+        self.last = self.last + (price.last or 0.0) * count
+        self.ask = self.ask + (price.ask or 0.0) * count
+        self.bid = self.bid + (price.bid or 0.0) * count
+        self.avg = self.avg + (price.avg or 0.0) * count
+
+    def total(self):
+        return Price.of(self.last, self.ask, self.bid, self.avg)
 
 class Market(object):
     """ Market Class 
+    Indexes every exchange of the exchange data. Bare tickers (H2O) are priced on the
+    default exchange, qualified tickers (H2O.IC1 or H2O.ICA) on the named exchange or currency.
+    Quotes are also kept in a material x exchange x field matrix of floats, NaN when missing,
+    so cross exchange queries read one row of the matrix, and the matrix is sliced into a
+    price column per field for each exchange so count arrays are valued column by column
     """
-    def __init__(self, marketdata, exchange):
+    FIELDS = ('last', 'ask', 'bid', 'avg')
+    LAST = 0
+    ASK = 1
+    BID = 2
+    AVG = 3
+
+    def __init__(self, marketdata, exchange=None):
+        self.exchanges = list(marketdata.keys())
+        self.exchange_index = {}
+        self.by_exchange = {}
+        self.qualified = {}
+        for eidx, code in enumerate(self.exchanges):
+            self.exchange_index[code] = eidx
+            currency = marketdata[code].get('currency')
+            if currency:
+                self.exchange_index.setdefault(currency, eidx)
+            prices = {}
+            for product in marketdata[code]['prices'].keys():
+                pricedata = marketdata[code]['prices'][product]    
+                prices[product] = Price(pricedata)
+            self.by_exchange[code] = prices
+        for alias, eidx in self.exchange_index.items():
+            for product, price in self.by_exchange[self.exchanges[eidx]].items():
+                self.qualified['{}.{}'.format(product, alias)] = price
+
+        # material x exchange x field matrix
+        width = len(self.exchanges) * len(Market.FIELDS)
+        for prices in self.by_exchange.values():
+            for product in prices.keys():
+                Materials.index(product)
+        self.materials = len(Materials)
+        self.matrix = array('d', [math.nan]) * (self.materials * width)
+        for eidx, code in enumerate(self.exchanges):
+            for product, price in self.by_exchange[code].items():
+                base = Materials.find(product) * width + eidx * len(Market.FIELDS)
+                for fidx, field in enumerate(Market.FIELDS):
+                    value = getattr(price, field)
+                    if value is not None:
+                        self.matrix[base + fidx] = value
+
+        self.columns = {}
+        self.exchange = None
         self.prices = {}
-        for product in marketdata[exchange]['prices'].keys():
-            pricedata = marketdata[exchange]['prices'][product]    
-            self.prices[product] = Price(pricedata)
+        self._set_exchange(exchange or self.exchanges[0])
+
+    def _set_exchange(self, exchange):
+        if exchange not in self.exchange_index:
+            raise Exception('exchange {} not found in market'.format(exchange))
+        self.exchange = exchange
+        self.prices = self.by_exchange[self.exchanges[self.exchange_index[exchange]]]
+
+    def view(self, exchange):
+        """ the market with bare tickers priced on the provided exchange, sharing all quotes """
+        market = copy.copy(self)
+        market._set_exchange(exchange)
+        return market
 
     def __str__(self):
-        return json.dumps(self.prices)
+        return json.dumps(self.prices, default=lambda price: json.loads(repr(price)))
 
     def __repr__(self): 
         return str(self.prices)
@@ -91,9 +184,100 @@ class Market(object):
     def price(self, product): 
         if product in self.prices: 
             return self.prices[product]
+        if product in self.qualified:
+            return self.qualified[product]
         raise Exception('price for {} not found in market'.format(product))
 
+    def quotes(self, product):
+        """ the price of the product on every exchange quoting it """
+        return {code: self.by_exchange[code][product] for code in self.exchanges 
+                if product in self.by_exchange[code]}
+
+    def _row(self, product):
+        idx = Materials.find(product)
+        if idx is None or idx >= self.materials:
+            raise Exception('price for {} not found in market'.format(product))
+        width = len(self.exchanges) * len(Market.FIELDS)
+        return self.matrix[idx * width:(idx + 1) * width]
+
+    def best(self, product):
+        """ 
+        the lowest ask and highest bid for the product across exchanges, 
+        with the exchange quoting each, None when no exchange quotes it
+        """
+        row = self._row(product)
+        best = {'ask': None, 'ask-exchange': None, 'bid': None, 'bid-exchange': None}
+        for eidx, code in enumerate(self.exchanges):
+            ask = row[eidx * len(Market.FIELDS) + Market.ASK]
+            bid = row[eidx * len(Market.FIELDS) + Market.BID]
+            if not math.isnan(ask) and (best['ask'] is None or ask < best['ask']):
+                best['ask'] = ask
+                best['ask-exchange'] = code
+            if not math.isnan(bid) and (best['bid'] is None or bid > best['bid']):
+                best['bid'] = bid
+                best['bid-exchange'] = code
+        return best
+
+    def arbitrage(self, min_margin=0.0):
+        """ products that can be bought on one exchange and sold on another for more than min_margin """
+        opportunities = []
+        for product in sorted(set().union(*[prices.keys() for prices in self.by_exchange.values()])):
+            best = self.best(product)
+            if best['ask'] is None or best['bid'] is None:
+                continue
+            margin = best['bid'] - best['ask']
+            if margin > min_margin and best['ask-exchange'] != best['bid-exchange']:
+                opportunities.append(dict(best, ticker=product, margin=margin))
+        return opportunities
+
+    def _columns(self):
+        """
+        the last, ask, bid and avg price columns of the default exchange indexed by material,
+        missing quotes as 0.0, and a flag per material quoted on the exchange
+        """
+        eidx = self.exchange_index[self.exchange]
+        if eidx not in self.columns:
+            width = len(self.exchanges) * len(Market.FIELDS)
+            columns = [array('d', bytes(8 * self.materials)) for field in Market.FIELDS]
+            quoted = bytearray(self.materials)
+            for product in self.by_exchange[self.exchanges[eidx]].keys():
+                idx = Materials.find(product)
+                quoted[idx] = 1
+                base = idx * width + eidx * len(Market.FIELDS)
+                for fidx, column in enumerate(columns):
+                    value = self.matrix[base + fidx]
+                    if not math.isnan(value):
+                        column[idx] = value
+            self.columns[eidx] = (columns, quoted)
+        return self.columns[eidx]
 
+    def accumulate(self, total, counts, held, factor=1.0):
+        """
+        adds the value of a count array indexed by the material registry, times the factor,
+        to the price accumulator, summing each price column against the counts rather than
+        building a Price per material. held lists the indices of the counts in use, the counts
+        of every other material must be 0.0
+        """
+        columns, quoted = self._columns()
+        for idx in held:
+            if idx >= self.materials or not quoted[idx]:
+                # qualified tickers and materials this exchange does not quote
+                total.add_multiple(self.price(Materials.ticker(idx)), counts[idx] * factor)
+        last, ask, bid, avg = [sum(map(operator.mul, counts, column)) for column in columns]
+        total.last = total.last + last * factor
+        total.ask = total.ask + ask * factor
+        total.bid = total.bid + bid * factor
+        total.avg = total.avg + avg * factor
 
-            
-        
\ No newline at end of file
+    def value(self, counts):
+        """ 
+        prices a ticker to count mapping, returning the value of each product
+        and the total value as a dictionary of Prices
+        """
+        values = {}
+        total = PriceAccumulator()
+        for product, count in counts.items():
+            value = self.price(product).multiply(count)
+            values[product] = value
+            total.add(value)
+        return {'values': values, 'total': total.total()}
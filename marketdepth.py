@@ -0,0 +1,69 @@
+""" market depth and sell-through limits
+"""
+
+from report import Report
+
+class MarketDepth(object):
+    """ MarketDepth Class
+    Caps how much of each product the exchange absorbs per day at the quoted price.
+    The depth of a product is its quoted demand times the turnover, the units of demand
+    the exchange renews each day. Units sold beyond the depth take a linear price impact,
+    the price falling by the impact for each further depth's worth sold, until nothing more sells.
+    Only the surplus of a product over what the value stream consumes itself is sold
+    """
+    DEFAULT_TURNOVER = 1.0
+    DEFAULT_IMPACT = 1.0
+
+    def __init__(self, market, turnover=DEFAULT_TURNOVER, impact=DEFAULT_IMPACT):
+        self.market = market
+        self.turnover = turnover
+        self.impact = impact
+        self.sold = {}
+        self.factors = {}
+
+    def depth(self, product):
+        """ the units per day sold at the quoted price """
+        return float(self.market.price(product).demand or 0) * self.turnover
+
+    def sellable(self, product, units):
+        """ the units at the quoted price the units sold per day are worth """
+        depth = self.depth(product)
+        if units <= depth or self.impact <= 0:
+            return units
+        scale = max(depth, 1.0)
+        excess = min(units - depth, scale / self.impact)
+        return depth + excess - self.impact * excess * excess / (2.0 * scale)
+
+    def observe(self, outputs, inputs):
+        """
+        sets the sell-through of each product from the units produced and consumed per day,
+        the fraction of the value of every unit produced that is realized on the exchange
+        """
+        self.sold = {}
+        self.factors = {}
+        for product, produced in outputs.items():
+            if produced <= 0:
+                continue
+            sold = max(produced - inputs.get(product, 0.0), 0.0)
+            self.sold[product] = sold
+            self.factors[product] = 1.0 - (sold - self.sellable(product, sold)) / produced
+
+    def sell_through(self, product):
+        return self.factors.get(product, 1.0)
+
+    def output_summary(self, outfile):
+        """ outputs the products sold beyond the depth of the exchange """
+        report = Report(outfile)
+        report.start()
+        report.output_general('{:<6} {:>12} {:>12} {:>12}'.format('Item', 'Sold/Day', 'Depth/Day', 'Sell-Through'))
+        report.minor_break()
+        limited = 0
+        for product in sorted(self.factors.keys()):
+            if self.factors[product] >= 1.0:
+                continue
+            limited = limited + 1
+            report.output_general('{:<6} {:>12.2f} {:>12.2f} {:>12.2%}'.format(
+                product, self.sold[product], self.depth(product), self.factors[product]))
+        if limited == 0:
+            report.output_general('every product sells within the depth of the exchange')
+        report.end()
@@ -0,0 +1,32 @@
+""" shared registry of interned material tickers """
+
+class MaterialRegistry(object):
+    """ MaterialRegistry Class
+    Assigns each ticker a stable integer index, shared by ledgers and inventories
+    so material columns can be stored as compact integer arrays
+    """
+
+    def __init__(self):
+        self.tickers = []
+        self.indices = {}
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def index(self, ticker):
+        """ returns the index for the ticker, registering it if needed """
+        idx = self.indices.get(ticker)
+        if idx is None:
+            idx = len(self.tickers)
+            self.indices[ticker] = idx
+            self.tickers.append(ticker)
+        return idx
+
+    def find(self, ticker):
+        """ returns the index for the ticker, or None when it was never registered """
+        return self.indices.get(ticker)
+
+    def ticker(self, idx):
+        return self.tickers[idx]
+
+Materials = MaterialRegistry()
@@ -0,0 +1,150 @@
+#!/usr/bin/python3
+""" model a batch of value streams in parallel and rank the results
+Static data (buildings, recipes, workers) and every referenced data file are
+loaded once in the parent process and shared with the worker processes
+"""
+import os
+import sys
+import glob
+import traceback
+from datetime import datetime
+from valuestream import ValueStream
+from runconfig import DataCache, load_run_config, resolve_files, create_pool, pool_size
+from configuration import load_yamlfile
+from report import Report
+
+CACHE = DataCache()
+
+RANK_HEAD = '{:>4} {:>12} {:>8} {:>8} {:>8}  {}'.format('Rank', 'Net', 'Uptime', 'E-Start', 'E-Delta', 'Run')
+RANK_FMT = '{rank:>4d} {net:>12.2f} {uptime:>8.2%} {e-start:>8.2%} {e-delta:>8.2%}  {name}'
+RANK_NAME_WIDTH = Report.TABLE_WIDTH - 4 - len(RANK_HEAD) + len('Run')
+
+def extract_args(argv):
+    if len(argv) < 5:
+        print('usage: {} <base-run-file> <date> <comparison-file> <valstream-or-run-file> [...]'.format(argv[0]))
+        print('       file arguments may be glob patterns, e.g. "data/valstream-*.yaml"')
+        sys.exit(1)
+    return argv[1:]
+
+def expand_files(patterns):
+    """ expands glob patterns, keeping the order the patterns were provided in """
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        if len(matches) == 0:
+            raise Exception('no files match {}'.format(pattern))
+        files.extend(matches)
+    return files
+
+def derive_output(template, name):
+    root, ext = os.path.splitext(template)
+    return '{}-{}{}'.format(root, name, ext)
+
+def build_run(base, path):
+    """
+    creates the run settings for a batch entry
+    run files override the base run file, valstream files are run with the base settings
+    and write to an output file named after the valstream
+    """
+    data = CACHE.load(path)
+    run = dict(base)
+    if 'productionLines' in data:
+        name = os.path.splitext(os.path.basename(path))[0]
+        run['valstream'] = path
+        run['output'] = derive_output(base['output'], name)
+        if 'snapshot-output' in base:
+            run['snapshot-output'] = derive_output(base['snapshot-output'], name)
+    elif 'valstream' in data:
+        run.update(data)
+    else:
+        raise Exception('{} is neither a run file nor a valstream file'.format(path))
+    return run
+
+def preload(runs, config_date):
+    """ parses every data file referenced by the runs so workers share the parsed data """
+    for run in runs:
+        files = resolve_files(run, config_date)
+        for key in files.keys():
+            CACHE.load(files[key])
+        CACHE.run_market(run, config_date)
+
+def run_one(job):
+    """ runs a single value stream, returning its summary """
+    name, run, config_date, timestamp = job
+    try:
+        config = load_run_config(run, config_date, timestamp, CACHE, verbose=False)
+        summary = ValueStream(config).run()
+        config['outfile'].close()
+        if config['snapshotfile']:
+            config['snapshotfile'].close()
+        summary['name'] = name
+        summary['output'] = run['output']
+        return summary
+    except Exception:
+        return {'name': name, 'output': run['output'], 'error': traceback.format_exc()}
+
+def write_comparison(summaries, outfile):
+    """ writes the runs ranked by net gain/loss """
+    completed = [summary for summary in summaries if 'error' not in summary]
+    failed = [summary for summary in summaries if 'error' in summary]
+    completed.sort(key=lambda summary: summary['net'], reverse=True)
+
+    report = Report(outfile)
+    report.start()
+    report.output_general('Batch Comparison: {} runs, {} failed'.format(len(summaries), len(failed)))
+    report.major_break()
+    report.output_general(RANK_HEAD)
+    report.minor_break()
+    rank = 0
+    for summary in completed:
+        rank = rank + 1
+        report.output_general(RANK_FMT.format(rank=rank, **dict(summary, name=summary['name'][-RANK_NAME_WIDTH:])))
+        report.output_general('     {}'.format(summary['fp'][:Report.TABLE_WIDTH - 9]))
+    if len(failed) > 0:
+        report.major_break()
+        report.output_general('Failed Runs:')
+        report.minor_break()
+        for summary in failed:
+            report.output_general(summary['name'][-(Report.TABLE_WIDTH - 4):])
+    report.end()
+
+def main(argv):
+    """ runtime entrypoint """
+    try:
+        args = extract_args(argv)
+        timestamp = datetime.now()
+        base = load_yamlfile(args[0])
+        config_date = args[1]
+        comparison_file = args[2]
+        files = expand_files(args[3:])
+
+        runs = [build_run(base, path) for path in files]
+        preload(runs, config_date)
+        jobs = [(path, run, config_date, timestamp) for path, run in zip(files, runs)]
+
+        processes = pool_size(len(jobs))
+        print('model batch started {}'.format(timestamp))
+        print('  base run       : {}'.format(args[0]))
+        print('  config date    : {}'.format(config_date))
+        print('  runs           : {}'.format(len(jobs)))
+        print('  processes      : {}'.format(processes))
+        print('  comparison     : {}'.format(comparison_file))
+
+        with create_pool(processes) as pool:
+            summaries = pool.map(run_one, jobs)
+
+        for summary in summaries:
+            if 'error' in summary:
+                print('{} failed:\n{}'.format(summary['name'], summary['error']))
+
+        with open(comparison_file, 'w') as outfile:
+            write_comparison(summaries, outfile)
+        print("done")
+        return 0
+
+    except Exception:
+        traceback.print_exc()
+        return 100
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -11,7 +11,8 @@ try:
 except ImportError:
     from yaml import Loader, Dumper
 from environment import DATA_DIR
-from configuration import Buildings, Workers
+from configuration import Buildings
+from sites import WORKFORCE_HDR, identify_worker_state, calc_area
 from market import Market, Price
 from inventory import Inventory
 from report import Report
@@ -29,62 +30,6 @@ def load_yaml(filename):
     with open(filename, 'r') as infile:
         return yaml.load(infile, Loader=Loader)    
 
-WORKFORCE = ["PIONEER", "SETTLER", "TECHNICIAN", "ENGINEER", "SCIENTIST"]
-WORKFORCE_HDR = list(map(lambda x: x[:3], WORKFORCE))
-
-def format_building_workers(workers):
-    workforce = [0,0,0,0,0]
-    for worker in workers: 
-        i = WORKFORCE.index(worker['type'])
-        workforce[i] = workforce[i] + worker['count']
-    return workforce 
-
-def get_worker_consumption(site, demand):
-    site_name = site['address']['planet-name']
-    inventory = Inventory({})
-    i = 0
-    for worker_count in demand: 
-        if worker_count > 0:
-            worker_type = WORKFORCE[i]
-            worker_spec = Workers[site_name][worker_type]
-            for product in worker_spec['needs']:
-                ticker = product['id']
-                amount = float(worker_count)/product['basis'] * product['rate']
-                inventory.add(ticker, amount)
-        i = i + 1
-    return inventory
-        
-def identify_worker_state(site):
-    workforce = {
-        'capacity': [0,0,0,0,0],
-        'demand': [0,0,0,0,0],
-    }
-    for building in site['buildings']:
-        ticker = building['ticker']
-        if ticker in Buildings:
-            building_data = Buildings[ticker]
-            building_type = building_data['type'] 
-            workers = format_building_workers(building_data['workers'])
-            if building_type == "HABITATION":
-                workforce['capacity'] = list(map(lambda x,y: x+y, workforce['capacity'], workers))
-            else:
-                workforce['demand'] = list(map(lambda x,y: x+y, workforce['demand'], workers))
-    workforce['surplus'] = list(map(lambda x,y: x-y, workforce['capacity'], workforce['demand']))
-    workforce['consumption'] = get_worker_consumption(site, workforce['demand'])
-    return workforce
-
-def calc_area(site):
-    consumed = 0
-    total = site['area']['total']
-    for building in site['buildings']:
-        consumed = consumed + building['area']
-    available = total - consumed
-    return {
-        "available": available,
-        "consumed": consumed,
-        "total": total
-    }
-
 def create_building_summary(site): 
     buildings = {}
     for building in site['buildings']:
@@ -157,7 +102,7 @@ def execute_actions(goal, sites, exchange):
         report.output_general('{} {} at {}'.format(action, ticker, site_name))
         if action == 'build': 
             consumption = build(site, ticker, exchange)
-            goal['consumption'].add_all(consumption.items)
+            goal['consumption'].add_all(consumption)
     return goal['consumption']
 
 def execute_goals(goals, sites, exchange):
@@ -176,7 +121,7 @@ def execute_goals(goals, sites, exchange):
 
         consumption = execute_actions(goal, sites, exchange)
         summary = consumption.summarize_inventory(exchange)
-        total_consumption.add_all(consumption.items)
+        total_consumption.add_all(consumption)
 
         report.major_break()
         report.output_value_table(summary['inventory'], "Goal Consumption Summary") 
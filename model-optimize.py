@@ -0,0 +1,326 @@
+#!/usr/bin/python3
+""" search the production line queues and building counts for the best value stream layouts
+Candidate layouts are checked against the site area and workforce, simulated in parallel
+with the static data shared by the worker processes, and layouts beaten by another layout
+using no more area or workers are pruned before the top layouts are reported
+"""
+import os
+import sys
+import itertools
+import traceback
+from datetime import datetime
+import yaml
+try:
+    from yaml import CDumper as Dumper
+except ImportError:
+    from yaml import Dumper
+from valuestream import ValueStream
+from runconfig import DataCache, load_run_config, resolve_files, create_pool, pool_size
+from configuration import Buildings, Recipes, load_yamlfile
+from sites import format_building_workers, identify_worker_state, calc_area
+from clock import Duration
+from report import Report
+
+CACHE = DataCache()
+
+RANK_HEAD = '{:>4} {:>12} {:>8} {:>6} {:>7}  {}'.format('Rank', 'Net/Day', 'Uptime', 'Area', 'Workers', 'Layout')
+RANK_FMT = '{rank:>4d} {per-day:>12.2f} {uptime:>8.2%} {area:>6d} {workers:>7d}  {fp}'
+RANK_FP_WIDTH = Report.TABLE_WIDTH - 4 - len(RANK_HEAD) + len('Layout')
+
+def extract_args(argv):
+    if len(argv) < 5:
+        print('usage: {} <base-run-file> <date> <optimizer-file> <output-file>'.format(argv[0]))
+        sys.exit(1)
+    return argv[1:]
+
+def queue_options(line_type, spec):
+    """
+    queue compositions for a line, each recipe appears at most once per queue
+    and the orderings of the same entries are only generated once
+    """
+    for recipe in spec['recipes']:
+        if recipe not in Recipes:
+            raise Exception('recipe {} not found'.format(recipe))
+        if Recipes[recipe]['line'] != line_type:
+            raise Exception('recipe {} is not produced by {}'.format(recipe, line_type))
+    max_entries = min(spec.get('max-entries', 1), len(spec['recipes']))
+    options = []
+    for size in range(1, max_entries + 1):
+        for recipes in itertools.combinations(spec['recipes'], size):
+            for counts in itertools.product(spec['batch-counts'], repeat=size):
+                options.append([{'recipe': recipe, 'count': count} for recipe, count in zip(recipes, counts)])
+    return options
+
+def line_options(line, spec):
+    """ every (building count, queue) layout to try for a production line """
+    queues = queue_options(line['line-type'], spec)
+    counts = spec.get('building-counts', [line['buildingCount']])
+    return [{'buildingCount': count, 'queue': queue} for count in counts for queue in queues]
+
+def build_choices(valstream, optimizer):
+    """ returns the indices of the modeled lines and the layouts to try for each """
+    positions = {}
+    for i, line in enumerate(valstream['productionLines']):
+        positions[line['line-id']] = i
+    modeled = []
+    choices = []
+    for spec in optimizer['lines']:
+        if spec['line-id'] not in positions:
+            raise Exception('line {} not found in the value stream'.format(spec['line-id']))
+        i = positions[spec['line-id']]
+        modeled.append(i)
+        choices.append(line_options(valstream['productionLines'][i], spec))
+    return modeled, choices
+
+def build_valstream(valstream, modeled, choices, key):
+    """ the value stream with the layout selected by key applied to the modeled lines """
+    lines = list(valstream['productionLines'])
+    for i, option in zip(modeled, [choices[n][j] for n, j in enumerate(key)]):
+        line = dict(lines[i])
+        line['buildingCount'] = option['buildingCount']
+        line['queue'] = option['queue']
+        lines[i] = line
+    return dict(valstream, productionLines=lines)
+
+def footprint(valstream):
+    """ area and workers used by the production lines """
+    area = 0
+    workers = 0
+    for line in valstream['productionLines']:
+        building = Buildings[line['line-type']]
+        area = area + building['area'] * line['buildingCount']
+        workers = workers + sum(format_building_workers(building['workers'])) * line['buildingCount']
+    return {'area': area, 'workers': workers}
+
+def site_feasible(valstream, modeled, sites):
+    """
+    checks the layout fits the sites, the site buildings of each modeled line type
+    are replaced by the buildings the value stream needs and the area and workforce
+    of the resulting site must not be exceeded
+    """
+    modeled_types = {}
+    for i in modeled:
+        line = valstream['productionLines'][i]
+        modeled_types.setdefault(line['site-name'], set()).add(line['line-type'])
+    for site_name in modeled_types:
+        if site_name not in sites:
+            raise Exception('site {} not found'.format(site_name))
+        site = sites[site_name]
+        line_types = modeled_types[site_name]
+        buildings = [building for building in site['buildings'] if building['ticker'] not in line_types]
+        for line in valstream['productionLines']:
+            if line['site-name'] == site_name and line['line-type'] in line_types:
+                building = {'ticker': line['line-type'], 'area': Buildings[line['line-type']]['area']}
+                buildings.extend([building] * line['buildingCount'])
+        candidate = dict(site, buildings=buildings)
+        if calc_area(candidate)['available'] < 0:
+            return False
+        if min(identify_worker_state(candidate)['surplus']) < 0:
+            return False
+    return True
+
+def evaluate(job):
+    """ simulates a single candidate layout, returning its metrics """
+    key, run, config_date, timestamp, valstream = job
+    try:
+        config = load_run_config(run, config_date, timestamp, CACHE, verbose=False)
+        config['valstream'] = valstream
+        metrics = ValueStream(config).evaluate()
+        config['outfile'].close()
+        metrics['key'] = key
+        return metrics
+    except Exception:
+        return {'key': key, 'error': traceback.format_exc()}
+
+class Search(object):
+    """ Search Class
+    Evaluates candidate layouts in batches on the worker pool, remembering every result
+    so layouts revisited by the greedy search are only simulated once
+    """
+
+    def __init__(self, pool, run, config_date, timestamp, valstream, modeled, choices, sites):
+        self.pool = pool
+        self.run = run
+        self.config_date = config_date
+        self.timestamp = timestamp
+        self.valstream = valstream
+        self.modeled = modeled
+        self.choices = choices
+        self.sites = sites
+        self.days = max(Duration(run['duration']).to_days(), 1.0/1440)
+        self.results = {}
+        self.infeasible = 0
+
+    def evaluate(self, keys):
+        """ evaluates the keys not seen before, returning the feasible results for all keys """
+        jobs = []
+        for key in keys:
+            if key in self.results:
+                continue
+            valstream = build_valstream(self.valstream, self.modeled, self.choices, key)
+            if self.sites is not None and not site_feasible(valstream, self.modeled, self.sites):
+                self.results[key] = None
+                self.infeasible = self.infeasible + 1
+                continue
+            self.results[key] = footprint(valstream)
+            jobs.append((key, self.run, self.config_date, self.timestamp, valstream))
+        for metrics in self.pool.imap_unordered(evaluate, jobs, chunksize=max(1, len(jobs) // 64)):
+            result = self.results[metrics['key']]
+            result.update(metrics)
+            if 'error' not in metrics:
+                result['per-day'] = metrics['net'] / self.days
+        return [self.results[key] for key in keys
+                if self.results[key] is not None and 'per-day' in self.results[key]]
+
+    def exhaustive(self):
+        return self.evaluate(list(itertools.product(*[range(len(options)) for options in self.choices])))
+
+    def greedy(self, start):
+        """ coordinate descent, improving one line at a time until no line improves """
+        current = start
+        best = None
+        improved = True
+        while improved:
+            improved = False
+            for n in range(len(self.choices)):
+                keys = [current[:n] + (j,) + current[n+1:] for j in range(len(self.choices[n]))]
+                for result in self.evaluate(keys):
+                    if best is None or result['per-day'] > best['per-day']:
+                        if result['key'] != current:
+                            improved = True
+                        best = result
+                        current = result['key']
+        return [result for result in self.results.values() if result is not None and 'per-day' in result]
+
+    def errors(self):
+        return [result for result in self.results.values() if result is not None and 'error' in result]
+
+def start_key(valstream, modeled, choices):
+    """ the layout of the base value stream when it is one of the options, else the first options """
+    key = []
+    for i, options in zip(modeled, choices):
+        line = valstream['productionLines'][i]
+        current = {'buildingCount': line['buildingCount'], 'queue': line['queue']}
+        key.append(options.index(current) if current in options else 0)
+    return tuple(key)
+
+def prune_dominated(results):
+    """ drops layouts matched or beaten on net per day by a layout using no more area and workers """
+    ranked = sorted(results, key=lambda result: (-result['per-day'], result['area'], result['workers']))
+    kept = []
+    for result in ranked:
+        dominated = False
+        for other in kept:
+            if other['area'] <= result['area'] and other['workers'] <= result['workers']:
+                dominated = True
+                break
+        if not dominated:
+            kept.append(result)
+    return kept
+
+def layout(valstream, modeled, choices, result):
+    """ the modeled production lines of a result, as valstream entries """
+    candidate = build_valstream(valstream, modeled, choices, result['key'])
+    lines = [candidate['productionLines'][i] for i in modeled]
+    # copy the shared queue entries so the layouts are written without yaml aliases
+    return [dict(line, queue=[dict(entry) for entry in line['queue']]) for line in lines]
+
+def write_results(optimizer, search, ranked, total, outfile):
+    report = Report(outfile)
+    report.start()
+    report.output_general('Layout Optimization: {}'.format(optimizer['description']))
+    report.output_general('Candidates : {} layouts, {} over site limits, {} simulated, {} failed'
+                          .format(total, search.infeasible, len(search.results) - search.infeasible, len(search.errors())))
+    report.output_general('Pareto     : {} layouts not dominated on net/day, area and workers'.format(len(ranked)))
+    report.major_break()
+    report.output_general(RANK_HEAD)
+    report.minor_break()
+    rank = 0
+    for result in ranked[:optimizer.get('top', 10)]:
+        rank = rank + 1
+        report.output_general(RANK_FMT.format(rank=rank, **dict(result, fp=result['fp'][:RANK_FP_WIDTH])))
+        fp = result['fp'][RANK_FP_WIDTH:]
+        while len(fp) > 0:
+            report.output_general('     {}'.format(fp[:Report.TABLE_WIDTH - 9]))
+            fp = fp[Report.TABLE_WIDTH - 9:]
+    report.end()
+
+def main(argv):
+    """ runtime entrypoint """
+    try:
+        args = extract_args(argv)
+        timestamp = datetime.now()
+        base = load_yamlfile(args[0])
+        config_date = args[1]
+        optimizer = load_yamlfile(args[2])
+        output_file = args[3]
+
+        # candidates are not reported individually, only their metrics are kept
+        run = dict(base, output=os.devnull)
+        run.pop('snapshot-interval', None)
+        run.pop('snapshot-output', None)
+        files = resolve_files(run, config_date)
+        for key in files.keys():
+            CACHE.load(files[key])
+        CACHE.run_market(run, config_date)
+        valstream = CACHE.load(files['valstream'])
+        sites = None
+        if 'sites' in optimizer:
+            sites = load_yamlfile(optimizer['sites'].replace('{date}', config_date))
+
+        modeled, choices = build_choices(valstream, optimizer)
+        total = 1
+        for options in choices:
+            total = total * len(options)
+        max_candidates = optimizer.get('max-candidates', 1000)
+        strategy = optimizer.get('search', 'exhaustive')
+        if strategy == 'exhaustive' and total > max_candidates:
+            strategy = 'greedy'
+        processes = pool_size(min(total, max_candidates))
+
+        print('model optimize started {}'.format(timestamp))
+        print('  description    : {}'.format(optimizer['description']))
+        print('  base run       : {}'.format(args[0]))
+        print('  config date    : {}'.format(config_date))
+        print('  lines          : {}'.format(', '.join([spec['line-id'] for spec in optimizer['lines']])))
+        print('  candidates     : {}'.format(total))
+        print('  search         : {}'.format(strategy))
+        print('  processes      : {}'.format(processes))
+        print('  output         : {}'.format(output_file))
+
+        with create_pool(processes) as pool:
+            search = Search(pool, run, config_date, timestamp, valstream, modeled, choices, sites)
+            if strategy == 'greedy':
+                results = search.greedy(start_key(valstream, modeled, choices))
+            elif strategy == 'exhaustive':
+                results = search.exhaustive()
+            else:
+                raise Exception('unknown search {}'.format(strategy))
+
+        for result in search.errors():
+            print('{} failed:\n{}'.format(result['key'], result['error']))
+
+        ranked = prune_dominated(results)
+        with open(output_file, 'w') as outfile:
+            write_results(optimizer, search, ranked, total, outfile)
+
+        if 'top-layouts' in optimizer:
+            layouts = []
+            for result in ranked[:optimizer.get('top', 10)]:
+                layouts.append({
+                    'net-per-day': round(result['per-day'], 2),
+                    'area': result['area'],
+                    'workers': result['workers'],
+                    'productionLines': layout(valstream, modeled, choices, result)
+                })
+            with open(optimizer['top-layouts'], 'w') as layoutfile:
+                yaml.dump(layouts, layoutfile, Dumper=Dumper, sort_keys=False)
+        print("done")
+        return 0
+
+    except Exception:
+        traceback.print_exc()
+        return 100
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,82 @@
+""" prices that change over the simulated run """
+
+from bisect import bisect_right
+from array import array
+from clock import MINUTES_PER_DAY
+from materials import Materials
+from market import Price
+from pricehistory import date_ordinal
+
+class PriceCurve(object):
+    """ PriceCurve Class
+    Step curve of prices per material, each price holding from its starting minute of the run
+    until the next. The starting minutes of a material are kept in a sorted array indexed by the
+    material registry, so the price in effect at a minute is a binary search of that array.
+    Materials without a curve are priced at the static market
+    """
+
+    def __init__(self, market):
+        self.market = market
+        self.minutes = []
+        self.prices = []
+        self.description = 'static'
+
+    def _curve(self, product):
+        idx = Materials.index(product)
+        if idx >= len(self.minutes):
+            missing = idx + 1 - len(self.minutes)
+            self.minutes.extend([None] * missing)
+            self.prices.extend([None] * missing)
+        return idx
+
+    def set_curve(self, product, points):
+        """ sets the (minute, price) points of the product, minutes need not be in order """
+        idx = self._curve(product)
+        points = sorted(points, key=lambda point: point[0])
+        self.minutes[idx] = array('l', [minute for minute, price in points])
+        self.prices[idx] = [price for minute, price in points]
+
+    def price(self, product, minute):
+        """ the price of the product in effect at the run minute """
+        idx = Materials.find(product)
+        if idx is not None and idx < len(self.minutes) and self.minutes[idx] is not None:
+            pos = bisect_right(self.minutes[idx], minute)
+            if pos > 0:
+                return self.prices[idx][pos - 1]
+        return self.market.price(product)
+
+    @staticmethod
+    def from_history(history, market, config_date):
+        """
+        the quotes of the market's exchange in the price history, each dated snapshot taking effect
+        on its day of the run starting on config_date, quotes before the run take effect at minute 0
+        """
+        curve = PriceCurve(market)
+        exchange = market.exchanges[market.exchange_index[market.exchange]]
+        start = date_ordinal(config_date)
+        for product in sorted(market.prices.keys()):
+            points = {}
+            for quote_date, pricedata in history.series(product, exchange):
+                minute = max(date_ordinal(quote_date) - start, 0) * MINUTES_PER_DAY
+                points[minute] = Price(pricedata)
+            if len(points) > 0:
+                curve.set_curve(product, points.items())
+        curve.description = '{} history from {}'.format(exchange, config_date)
+        return curve
+
+    @staticmethod
+    def from_factors(market, factors):
+        """
+        synthetic curves scaling the market price by a factor from each run day,
+        factors is a ticker to [[day, factor], ...] mapping
+        """
+        curve = PriceCurve(market)
+        for product in factors.keys():
+            base = market.price(product)
+            points = sorted([(int(day * MINUTES_PER_DAY), base.multiply(factor)) for day, factor in factors[product]],
+                            key=lambda point: point[0])
+            if len(points) == 0 or points[0][0] > 0:
+                points.insert(0, (0, base))
+            curve.set_curve(product, points)
+        curve.description = 'synthetic {}'.format(', '.join(sorted(factors.keys())))
+        return curve
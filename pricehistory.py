@@ -0,0 +1,189 @@
+""" append-only store of dated exchange prices """
+
+import os
+import math
+import struct
+from bisect import bisect_left, bisect_right
+from array import array
+from datetime import date
+from materials import Materials
+from market import Market
+
+def date_ordinal(value):
+    """ the day number of a YYYY-MM-DD string or date """
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = date.fromisoformat(value)
+    return value.toordinal()
+
+class PriceHistory(object):
+    """ PriceHistory Class
+    One fixed size row per date x exchange x ticker holding last/ask/bid/avg/supply/demand,
+    NaN when missing. Rows are only ever appended to the history file, each is loaded into
+    columnar arrays and indexed by (exchange, ticker) in date order, so the quote in effect
+    on a date is a binary search instead of re-parsing every dated exchange file
+    """
+    MAGIC = b'PUPH0001'
+    NAME_SIZE = 8
+    ROW = struct.Struct('<i8s8s8s6d')
+    FIELDS = ('last', 'ask', 'bid', 'avg', 'supply', 'demand')
+
+    def __init__(self, path):
+        self.path = path
+        self.exchanges = []
+        self.currencies = {}
+        self.row_dates = array('l')
+        self.row_exchanges = array('H')
+        self.row_tickers = array('l')
+        self.values = array('d')
+        self.index = {}
+        self.recorded = set()
+        if os.path.isfile(path):
+            self._load()
+
+    def __len__(self):
+        return len(self.row_dates)
+
+    def _load(self):
+        with open(self.path, 'rb') as infile:
+            data = infile.read()
+        if len(data) == 0:
+            return
+        if data[:len(PriceHistory.MAGIC)] != PriceHistory.MAGIC:
+            raise Exception('{} is not a price history file'.format(self.path))
+        data = data[len(PriceHistory.MAGIC):]
+        if len(data) % PriceHistory.ROW.size != 0:
+            raise Exception('{} is truncated'.format(self.path))
+        for row in PriceHistory.ROW.iter_unpack(data):
+            self._append(row[0], row[1].rstrip(b'\0').decode(), row[2].rstrip(b'\0').decode(),
+                         row[3].rstrip(b'\0').decode(), row[4:])
+        for key in self.index.keys():
+            self._sort(key)
+
+    def _append(self, day, code, currency, ticker, values):
+        if code not in self.currencies:
+            self.exchanges.append(code)
+            self.currencies[code] = currency
+        eidx = self.exchanges.index(code)
+        tidx = Materials.index(ticker)
+        row = len(self.row_dates)
+        self.row_dates.append(day)
+        self.row_exchanges.append(eidx)
+        self.row_tickers.append(tidx)
+        self.values.extend(values)
+        self.index.setdefault((eidx, tidx), (array('l'), array('l')))
+        self.index[(eidx, tidx)][0].append(day)
+        self.index[(eidx, tidx)][1].append(row)
+        self.recorded.add((day, code))
+
+    def _sort(self, key):
+        days, rows = self.index[key]
+        if all(days[i] <= days[i + 1] for i in range(len(days) - 1)):
+            return
+        ordered = sorted(zip(days, rows))
+        self.index[key] = (array('l', [day for day, row in ordered]), array('l', [row for day, row in ordered]))
+
+    def dates(self):
+        """ the dates with recorded prices, oldest first """
+        return [date.fromordinal(day).isoformat() for day in sorted(set(self.row_dates))]
+
+    def add_exchanges(self, snapshot_date, marketdata):
+        """
+        appends the prices of an exchange file taken on snapshot_date,
+        exchanges already recorded for the date are skipped, returns the rows added
+        """
+        day = date_ordinal(snapshot_date)
+        for code in marketdata.keys():
+            currency = marketdata[code].get('currency') or ''
+            for name in [code, currency] + list(marketdata[code]['prices'].keys()):
+                if len(name.encode()) > PriceHistory.NAME_SIZE:
+                    raise Exception('{} is longer than the {} bytes a price history holds'.format(
+                        name, PriceHistory.NAME_SIZE))
+        encoded = []
+        touched = set()
+        for code in marketdata.keys():
+            if (day, code) in self.recorded:
+                continue
+            currency = marketdata[code].get('currency') or ''
+            prices = marketdata[code]['prices']
+            for ticker in prices.keys():
+                values = tuple(math.nan if prices[ticker].get(field) is None else float(prices[ticker][field])
+                               for field in PriceHistory.FIELDS)
+                encoded.append(PriceHistory.ROW.pack(day, code.encode(), currency.encode(), ticker.encode(), *values))
+                self._append(day, code, currency, ticker, values)
+                touched.add((self.exchanges.index(code), Materials.index(ticker)))
+        for key in touched:
+            self._sort(key)
+        if len(encoded) > 0:
+            new_file = not os.path.isfile(self.path) or os.path.getsize(self.path) == 0
+            with open(self.path, 'ab') as outfile:
+                if new_file:
+                    outfile.write(PriceHistory.MAGIC)
+                outfile.write(b''.join(encoded))
+        return len(encoded)
+
+    def _pricedata(self, row):
+        base = row * len(PriceHistory.FIELDS)
+        pricedata = {}
+        for fidx, field in enumerate(PriceHistory.FIELDS):
+            value = self.values[base + fidx]
+            pricedata[field] = None if math.isnan(value) else value
+        return pricedata
+
+    def _average(self, rows):
+        """ the price dictionary averaging each field over the rows quoting it """
+        pricedata = {}
+        for fidx, field in enumerate(PriceHistory.FIELDS):
+            values = [self.values[row * len(PriceHistory.FIELDS) + fidx] for row in rows]
+            values = [value for value in values if not math.isnan(value)]
+            pricedata[field] = sum(values) / len(values) if len(values) > 0 else None
+        return pricedata
+
+    def series(self, ticker, exchange, start=None, end=None):
+        """ the (date, price dictionary) quotes of the ticker on the exchange between start and end """
+        tidx = Materials.find(ticker)
+        if exchange not in self.currencies or tidx is None:
+            return []
+        days, rows = self.index.get((self.exchanges.index(exchange), tidx), ((), ()))
+        first = 0 if start is None else bisect_left(days, date_ordinal(start))
+        last = len(days) if end is None else bisect_right(days, date_ordinal(end))
+        return [(date.fromordinal(days[i]).isoformat(), self._pricedata(rows[i])) for i in range(first, last)]
+
+    def marketdata(self, as_of, start=None):
+        """
+        the exchange data in effect on as_of, each ticker quoted at its latest price on or before the date,
+        or averaged over the quotes from start to as_of when a start date is provided
+        """
+        end = date_ordinal(as_of)
+        begin = None if start is None else date_ordinal(start)
+        marketdata = {}
+        for code in self.exchanges:
+            marketdata[code] = {
+                'code': code,
+                'currency': self.currencies[code],
+                'timestamp': date.fromordinal(end).isoformat(),
+                'prices': {}
+            }
+        for (eidx, tidx), (days, rows) in sorted(self.index.items()):
+            last = bisect_right(days, end)
+            if last == 0:
+                continue
+            if begin is None:
+                pricedata = self._pricedata(rows[last - 1])
+            else:
+                first = bisect_left(days, begin)
+                if first >= last:
+                    continue
+                pricedata = self._average(rows[first:last])
+            marketdata[self.exchanges[eidx]]['prices'][Materials.ticker(tidx)] = pricedata
+        for data in marketdata.values():
+            data['prices'] = dict(sorted(data['prices'].items()))
+        return {code: data for code, data in marketdata.items() if len(data['prices']) > 0}
+
+    def market(self, as_of, exchange=None, start=None):
+        """ the market as of the date, or averaged over the dates from start to as_of """
+        marketdata = self.marketdata(as_of, start)
+        if len(marketdata) == 0:
+            raise Exception('no prices recorded on or before {}'.format(as_of))
+        return Market(marketdata, exchange)
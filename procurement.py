@@ -0,0 +1,157 @@
+""" scheduled and conditional procurement of worker supplies
+"""
+
+import math
+from clock import Duration, MINUTES_PER_DAY
+from market import Price, PriceAccumulator
+from ledger import Ledger
+from report import Report
+from productionline import ProductionLine, calc_worker_needs
+
+class Procurement(object):
+    """ Procurement class
+    Buys materials into site inventories following the procurement rules of the value stream.
+    A reorder rule tops the stock up to its order level when it falls below the reorder point,
+    a scheduled rule buys a fixed amount on every interval. Levels may be given in units or in
+    days of the site's worker burn, precomputed once from the worker needs of the lines drawing
+    on the inventory, so each rule check is a single inventory lookup
+    """
+    CHECK_EVENT = 0
+    DEFAULT_CHECK = '1:00:00:00'
+
+    def __init__(self, stream_id, rules, config, lines):
+        self.inventories = config['inventory']
+        self.market = config['market']
+        self.purchasing = config.get('purchasing')
+        self.ledger = Ledger(stream_id, 'PROCUREMENT', None, None, self.market, config.get('price-curve'))
+        self.burn = self._init_burn(lines)
+        self.rules = [self._init_rule(rule) for rule in rules]
+
+    def _init_burn(self, lines):
+        """ the worker supplies consumed per day from each inventory, keyed by (inventory, ticker) """
+        burn = {}
+        for line in lines:
+            for staff in line.workers:
+                for need in calc_worker_needs(staff['worker'], staff['count']):
+                    key = (id(line.inventory), need['id'])
+                    burn[key] = burn.get(key, 0.0) + need['amount'] * MINUTES_PER_DAY / ProductionLine.WORKER_CYCLE
+        return burn
+
+    def _init_rule(self, rule):
+        for key in ['site', 'ticker']:
+            if key not in rule:
+                raise Exception('procurement rule {} is missing {}'.format(rule, key))
+        inventory = self.inventories.site(rule['site'])
+        burn = self.burn.get((id(inventory), rule['ticker']), 0.0)
+        scheduled = 'every' in rule
+        if scheduled:
+            check = Duration(rule['every']).to_minutes()
+            reorder = None
+            order = Procurement.level(rule, 'count', 'order-days', burn)
+        else:
+            check = Duration(rule.get('check', Procurement.DEFAULT_CHECK)).to_minutes()
+            reorder = Procurement.level(rule, 'reorder-point', 'reorder-days', burn)
+            order = Procurement.level(rule, 'order-up-to', 'order-days', burn)
+            if order < reorder:
+                raise Exception('procurement rule {} orders up to less than its reorder point'.format(rule))
+        return {
+            'id': rule.get('rule-id', '{}.{}'.format(rule['ticker'], rule['site'])),
+            'site': rule['site'],
+            'ticker': rule['ticker'],
+            'inventory': inventory,
+            'scheduled': scheduled,
+            'burn': burn,
+            'check': max(check, 1),
+            'reorder': reorder,
+            'order': order,
+            'checks': 0,
+            'buys': 0,
+            'count': 0.0,
+            'refused': 0,
+            'avoided': 0,
+            'capital': 0.0,
+            'peak-capital': 0.0,
+            'cost': PriceAccumulator()
+        }
+
+    @staticmethod
+    def level(rule, units_key, days_key, burn):
+        """ a stock level of the rule, given either in units or in days of burn """
+        if units_key in rule:
+            return float(rule[units_key])
+        if days_key in rule:
+            return float(rule[days_key]) * burn
+        raise Exception('procurement rule {} needs {} or {}'.format(rule, units_key, days_key))
+
+    def initial_events(self):
+        """ returns the (minute, event type, rule) events of the first rule checks """
+        return [(0, Procurement.CHECK_EVENT, rnum) for rnum in range(len(self.rules))]
+
+    def process_event(self, master_clock, event_type, num):
+        """
+        checks a rule, buying when it calls for it
+        returns the next check and the inventory restocked, if any
+        """
+        rule = self.rules[num]
+        result = {
+            'events': [(master_clock.to_minutes() + rule['check'], Procurement.CHECK_EVENT, num)],
+            'restocked': None
+        }
+        rule['checks'] = rule['checks'] + 1
+        stock = rule['inventory'].count(rule['ticker'])
+        if rule['scheduled']:
+            count = math.ceil(rule['order'])
+        elif stock < rule['reorder']:
+            count = math.ceil(rule['order'] - stock)
+        else:
+            count = 0
+        if count > 0 and self._buy(master_clock, rule, count, stock):
+            # without the buy the stock would have run out before the next check
+            if stock < rule['burn'] * rule['check'] / MINUTES_PER_DAY:
+                rule['avoided'] = rule['avoided'] + 1
+            result['restocked'] = rule['inventory']
+
+        price = self.ledger.price(rule['ticker'], master_clock.to_minutes())
+        capital = rule['inventory'].count(rule['ticker']) * (price.avg or 0.0)
+        rule['capital'] = rule['capital'] + capital
+        rule['peak-capital'] = max(rule['peak-capital'], capital)
+        return result
+
+    def _buy(self, master_clock, rule, count, stock):
+        """ buys count units into the rule's inventory, returns false when the purchase was refused """
+        if self.purchasing is not None:
+            if not self.purchasing.buy(master_clock, self.ledger, Ledger.PROCURE_SUPPLY, rule['ticker'], count,
+                                       count, stock, line=self.ledger.line_id, rule=rule['id']):
+                rule['refused'] = rule['refused'] + 1
+                return False
+            cost = self.purchasing.last_cost
+            rule['cost'].add(Price.of(cost, cost, cost, cost))
+        else:
+            self.ledger.add(master_clock, Ledger.PROCURE_SUPPLY, 'supply procured', count=count,
+                            product=rule['ticker'], line=self.ledger.line_id, rule=rule['id'],
+                            need=count, available=stock)
+            rule['cost'].add_multiple(self.ledger.price(rule['ticker'], master_clock.to_minutes()), count)
+        rule['inventory'].add(rule['ticker'], count)
+        rule['buys'] = rule['buys'] + 1
+        rule['count'] = rule['count'] + count
+        return True
+
+    def output_summary(self, outfile):
+        """ outputs the buys, stockouts avoided and capital tied up by each rule """
+        total = PriceAccumulator()
+        report = Report(outfile)
+        report.start()
+        report.output_general('{:<20} {:>6} {:>5} {:>10} {:>7} {:>14} {:>14}'.format(
+            'Rule', 'Burn/D', 'Buys', 'Bought', 'Avoided', 'Capital (Avg)', 'Capital (Max)'))
+        report.minor_break()
+        for rule in self.rules:
+            report.output_general('{:<20} {:>6.2f} {:>5d} {:>10.2f} {:>7d} {:>14.2f} {:>14.2f}'.format(
+                rule['id'][:20], rule['burn'], rule['buys'], rule['count'], rule['avoided'],
+                rule['capital'] / max(rule['checks'], 1), rule['peak-capital']))
+            if rule['refused'] > 0:
+                report.output_general('    {} buys refused over the purchase budget'.format(rule['refused']))
+            total.add(rule['cost'])
+        report.minor_break()
+        report.output_general('                   {}'.format(Price.HEADER_FMT))
+        report.output_general('Procured Supplies: {}'.format(total.total()))
+        report.end()
@@ -4,14 +4,107 @@
 import sys
 import json
 import math
-from clock import DecrClock, Duration
+from clock import Duration
 from configuration import Buildings, Workers, Recipes
 from inventory import Inventory
 from ledger import Ledger
+from materials import Materials
+
+def calc_line_efficiency(building, site_efficiency, worker_efficiency):
+    """ efficiency of a line of buildings at the site with the provided worker efficiency """
+    value = 1.0
+    expertise = building['expertise']
+
+    # COGC Worker Efficiencies
+    for worker in building['workers']:
+        factor = 1.0 + site_efficiency['cogc-worker-bonus'][worker['type']]
+        value = value * factor
+        
+    # COGC Industry Efficiencies
+    factor = 1.0 + site_efficiency['cogc-industry-bonus'][expertise]
+    value = value * factor
+
+    # Expert Efficiencies
+    experts = site_efficiency['experts'][expertise]
+    factor = 1.0 + site_efficiency['expert-factors'][experts]
+    value = value * factor
+
+    # Soil Fertility Efficiencies
+    if expertise == 'AGRICULTURE':
+        factor = 1.0 + site_efficiency['soil-fertility']
+        value = value * factor
+
+    value = value * worker_efficiency
+    if value < 0.33:
+        return 0.33
+    return value
+
+def calc_recipe_minutes(recipe, count, efficiency):
+    """ minutes to run count batches of the recipe at the provided efficiency """
+    duration = Duration(recipe['time'])
+    duration.apply_multiplier(count)
+    duration.apply_efficiency(efficiency)
+    return duration.to_minutes()
+
+def calc_worker_needs(worker, count):
+    """ the supplies count workers need per worker cycle """
+    needs = []
+    numworkers = float(count)
+    for resource in worker['needs']:
+        rate = resource['rate']
+        basis = resource['basis']
+        amount = numworkers * rate/basis
+        essential = resource['essential']
+        needs.append({'id': resource['id'], 'amount': amount, 'essential': essential})
+    return needs
+
+class RecipePlan(object):
+    """ RecipePlan Class
+    A queue entry compiled once at line init: the recipe time scaled by the batch count
+    and the batch input and output amounts as (ticker, material index, count) vectors.
+    Plans are immutable, at_efficiency returns the plan recompiled for a new line efficiency
+    """
+    __slots__ = ('recipe_id', 'count', 'base_minutes', 'efficiency', 'minutes', 'inputs', 'outputs',
+                 'input_vector')
+
+    def __init__(self, recipe_id, count, base_minutes, efficiency, inputs, outputs):
+        self.recipe_id = recipe_id
+        self.count = count
+        self.base_minutes = base_minutes
+        self.efficiency = efficiency
+        # same truncation as Duration.apply_multiplier then Duration.apply_efficiency
+        self.minutes = int(float(base_minutes) / efficiency)
+        self.inputs = inputs
+        self.outputs = outputs
+        self.input_vector = tuple((idx, count) for product, idx, count in inputs)
+
+    @classmethod
+    def compile(cls, recipe_id, count, efficiency=1.0):
+        if recipe_id not in Recipes:
+            raise Exception('recipe {} not found'.format(recipe_id))
+        recipe = Recipes[recipe_id]
+        duration = Duration(recipe['time'])
+        duration.apply_multiplier(count)
+        inputs = tuple((item['id'], Materials.index(item['id']), item['count'] * count) 
+                       for item in recipe['inputs'])
+        outputs = tuple((item['id'], Materials.index(item['id']), item['count'] * count) 
+                        for item in recipe['outputs'])
+        return cls(recipe_id, count, duration.to_minutes(), efficiency, inputs, outputs)
+
+    def at_efficiency(self, efficiency):
+        if efficiency == self.efficiency:
+            return self
+        return RecipePlan(self.recipe_id, self.count, self.base_minutes, efficiency, 
+                          self.inputs, self.outputs)
 
 class ProductionLine(object):
     """ ProductionLine class
+    Driven by the value stream event queue: each building schedules its next recipe
+    completion and the line schedules its next worker resupply
     """
+    RECIPE_EVENT = 0
+    WORKER_EVENT = 1
+    WORKER_CYCLE = Duration("24:00:00").to_minutes()
 
     def __init__(self, stream_id, line_spec, config, master_clock):
         self.line_id = line_spec['line-id']
@@ -23,90 +116,69 @@ class ProductionLine(object):
         self.production = self._init_production(self.building_count)
         self.queue_identity = ''
         self.queue = self._init_production_queue(line_spec['queue'])
-        self.ledger = Ledger(stream_id, self.line_id, self.linetype, self.building_count, config['market'])
-        self.inventory = config['inventory']
+        self.queue_pos = 0
+        self.ledger = Ledger(stream_id, self.line_id, self.linetype, self.building_count, config['market'],
+                             config.get('price-curve'), config.get('market-depth'))
+        self.inventory = config['inventory'].site(self.site_name)
         self.sourcing_strategy = config['sourcing-strategy']
         self.essentials_strategy = config['essentials-strategy']
         self.non_essentials_strategy = config['non-essentials-strategy']
+        self.purchasing = config.get('purchasing')
         
         # initialize workers and efficiency before initializing production
         self.worker_efficiency = 0.0
         self.workers = self._init_workers()
-        self.worker_clock = DecrClock(Duration("0"))
+        self.worker_reset = 0
         self._reset_workers(master_clock)
-        self.efficiency = self._calc_line_efficiency()
+        self._set_efficiency(self._calc_line_efficiency())
+        self.logged_through = master_clock.to_minutes()
 
         for bnum in range(0, self.building_count):
             self._set_next_recipe_active(master_clock, bnum)
-            self.production[bnum]['producing'] = \
-                self._start_next_recipe(master_clock, bnum, last_round_producing=False)
+            if not self._start_building(master_clock, bnum, master_clock.to_minutes() + 1, 
+                                        last_round_producing=False):
+                # starved at init, attempt to start again on the first minute
+                self.production[bnum]['retry'] = master_clock.to_minutes() + 1
 
         print('{} {} initialized - {} buildings'.format(master_clock, self.line_id, self.building_count),
             file=config['outfile'])
 
     def __str__(self):
+        production = [dict(active, plan=active['plan'] and active['plan'].recipe_id) 
+                      for active in self.production]
         return json.dumps({ 
             'lineId': self.line_id, 
             'efficiency': self.efficiency,
-            'production': self.production,
+            'production': production,
             'linetype': self.linetype, 
-            'queue': self.queue 
+            'queue': [{'id': plan.recipe_id, 'count': plan.count} for plan in self.queue]
             })
 
     def line_identity(self):
         return self.linetype + str(self.building_count) + "[" + self.queue_identity + "]"
 
     def _calc_line_efficiency(self):
-        value = 1.0
-        building = self.building
-        expertise = building['expertise']
-        site_efficiency = self.site_efficiency
-
-        # COGC Worker Efficiencies
-        for worker in building['workers']:
-            factor = 1.0 + site_efficiency['cogc-worker-bonus'][worker['type']]
-            value = value * factor
-            
-        # COGC Industry Efficiencies
-        factor = 1.0 + site_efficiency['cogc-industry-bonus'][expertise]
-        value = value * factor
-
-        # Expert Efficiencies
-        experts = site_efficiency['experts'][expertise]
-        factor = 1.0 + site_efficiency['expert-factors'][experts]
-        value = value * factor
-
-        # Soil Fertility Efficiencies
-        if expertise == 'AGRICULTURE':
-            factor = 1.0 + site_efficiency['soil-fertility']
-            value = value * factor
-
-        value = value * self.worker_efficiency
-        if value < 0.33:
-            return 0.33
-        return value
+        return calc_line_efficiency(self.building, self.site_efficiency, self.worker_efficiency)
 
     def _init_production_queue(self, queue):
-        prodqueue = []
-        for item in queue:
-            if item['recipe'] not in Recipes: 
-                raise Exception('recipe {} not found'.format(item['recipe']))
-            product = {
-                'id': item['recipe'],
-                'count': item['count'],
-                'recipe': Recipes[item['recipe']]
-            }
-            prodqueue.append(product)
-        self.queue_identity = '.'.join(map(lambda x: x['id'].replace('.', '') + "x" + str(x['count']), prodqueue))
+        prodqueue = [RecipePlan.compile(item['recipe'], item['count']) for item in queue]
+        self.queue_identity = '.'.join(map(lambda x: x.recipe_id.replace('.', '') + "x" + str(x.count), prodqueue))
         return prodqueue
 
+    def _set_efficiency(self, efficiency):
+        """ sets the line efficiency, recompiling the queue plans when it changed """
+        self.efficiency = efficiency
+        if self.queue[0].efficiency != efficiency:
+            self.queue = [plan.at_efficiency(efficiency) for plan in self.queue]
+
     def _init_production(self, buildCount):
         return [{
-            "recipe": None,
-            "count": 0,
-            "clock": DecrClock(Duration("0")),
-            "producing": False
-        }] * buildCount 
+            "plan": None,
+            "minutes": 0,
+            "producing": False,
+            "finish": None,
+            "retry": None
+        } for _ in range(buildCount)]
 
     def _init_workers(self):
         workers = []
@@ -120,119 +192,151 @@ class ProductionLine(object):
             workers.append({'type': workerType, 'count': workerCount, 'worker': worker})
         return workers   
         
-    def step(self, master_clock):
-        for buildingNum in range(0, self.building_count):
-            self._recipe_step(master_clock, buildingNum)
-        self._worker_step(master_clock)
-        self._log_production_activity(master_clock)
+    def initial_events(self):
+        """ returns the (minute, event type, building) events scheduled during init """
+        events = [(self.worker_reset, ProductionLine.WORKER_EVENT, 0)]
+        for bnum, active in enumerate(self.production):
+            if active['producing']:
+                events.append((active['finish'], ProductionLine.RECIPE_EVENT, bnum))
+            elif active['retry'] is not None:
+                events.append((active['retry'], ProductionLine.RECIPE_EVENT, bnum))
+        return events
+
+    def process_event(self, master_clock, event_type, bnum):
+        """ 
+        processes a recipe or worker event at the master clock minute
+        returns the follow-on (minute, event type, building) events and whether 
+        inventory may have been restocked (outputs produced or supplies purchased)
+        """
+        minute = master_clock.to_minutes()
+        self.log_activity(minute - 1)
+        result = {
+            'events': [],
+            'restocked': False
+        }
+        if event_type == ProductionLine.WORKER_EVENT:
+            self._reset_workers(master_clock)
+            self._set_efficiency(self._calc_line_efficiency())
+            result['events'].append((self.worker_reset, ProductionLine.WORKER_EVENT, 0))
+            result['restocked'] = True
+            return result
 
-    def _recipe_step(self, master_clock, buildingNum):
-        active = self.production[buildingNum]
+        active = self.production[bnum]
         if not active['producing']:
+            if active['retry'] != minute:
+                # stale retry, superseded by an earlier attempt
+                return result
             # not currently producing, attempt to start producing
-            active['producing'] = self._start_next_recipe(master_clock, buildingNum, last_round_producing=False)
+            active['retry'] = None
+            if not self._start_building(master_clock, bnum, minute, last_round_producing=False):
+                return result
+
+        while active['producing'] and active['finish'] == minute:
+            # production done, produce output and attempt to start next item in queue
+            active['producing'] = False
+            self._produce(master_clock, bnum)
+            self._set_next_recipe_active(master_clock, bnum)
+            self._start_building(master_clock, bnum, minute + 1, last_round_producing=True)
+            result['restocked'] = True
 
         if active['producing']:
-            # producing, decrement the active recipe clock and check for completion
-            active['clock'].step()
-            if active['clock'].to_minutes() > 0:
-                # still producing, time remaining 
-                pass
-            else: 
-                # production done, produce output and attempt to start next item in queue
-                active['producing'] = False
-                self._produce(master_clock, buildingNum)
-                self._set_next_recipe_active(master_clock, buildingNum)
-                active['producing'] = self._start_next_recipe(master_clock, buildingNum, last_round_producing=True)
+            result['events'].append((active['finish'], ProductionLine.RECIPE_EVENT, bnum))
+        return result
+
+    def waiting_buildings(self):
+        """ buildings starved of inputs that do not have a retry scheduled """
+        return [bnum for bnum, active in enumerate(self.production) 
+                if not active['producing'] and active['retry'] is None]
+
+    def schedule_retry(self, bnum, minute):
+        """ schedules a starved building to attempt to start again at the provided minute """
+        self.production[bnum]['retry'] = minute
+
+    def _start_building(self, master_clock, bnum, first_minute, last_round_producing):
+        """ attempts to start the active recipe, the recipe clock counts down from first_minute """
+        active = self.production[bnum]
+        active['producing'] = self._start_next_recipe(master_clock, bnum, last_round_producing)
+        if active['producing']:
+            active['finish'] = first_minute + max(active['minutes'], 1) - 1
+        return active['producing']
 
     def _produce(self, master_clock, buildingNum):
-        active = self.production[buildingNum]
-        recipe = active['recipe']
-        outputs = recipe['outputs']
-        for output in outputs:
-            product = output['id']
-            count = active['count'] * output['count']
+        for product, idx, count in self.production[buildingNum]['plan'].outputs:
             self.inventory.add(product, count)
             self.ledger.add(master_clock, Ledger.OUTPUT, 'output produced', count=count, product=product)
     
-    def _consume_inputs(self, master_clock, inputs, num_runs):
-        for input in inputs: 
-            product = input['id']
-            count = input['count'] * num_runs
-            if not self.inventory.remove(product, count):
-                raise Exception('removing {} {} from inventory failed'.format(count, product))
+    def _consume_inputs(self, master_clock, plan):
+        if not self.inventory.remove_all(plan.input_vector):
+            raise Exception('removing {} inputs from inventory failed'.format(plan.recipe_id))
+        for product, idx, count in plan.inputs: 
             self.ledger.add(master_clock, Ledger.INPUT, 'input consumed', count=count, product=product)
 
-    def _inputs_available(self, inputs, num_runs):
-        status = {
-            'available': True,
-            'missing': []
-        }
-        for input in inputs: 
-            product = input['id']
-            count = input['count'] * num_runs
+    def _missing_inputs(self, inputs):
+        """ the inputs short in inventory, an empty list when the batch can start """
+        missing = []
+        for product, idx, count in inputs: 
             available = self.inventory.count(product)
             if available - count < 0:
-                status['available'] = False
-                status['missing'].append({ "ticker": product, "count": count, "available": available})
-        return status
-
-    def _set_recipe_clock(self, recipe, count):
-        duration = Duration(recipe['time'])
-        duration.apply_multiplier(count)
-        duration.apply_efficiency(self.efficiency)
-        return DecrClock(duration)
+                missing.append({ "ticker": product, "count": count, "available": available})
+        return missing
 
     def _set_next_recipe_active(self, master_clock, buildingNum):
-        prod = self.queue.pop(0)
+        plan = self.queue[self.queue_pos]
+        self.queue_pos = (self.queue_pos + 1) % len(self.queue)
         active = self.production[buildingNum]
-        active['recipe'] = prod['recipe']
-        active['count'] = prod['count'] 
-        active['clock']= self._set_recipe_clock(prod['recipe'], prod['count'])
+        active['plan'] = plan
+        active['minutes'] = plan.minutes
         active['producing'] = False
-        self.queue.append(prod)
 
     def _start_next_recipe(self, master_clock, buildingNum, last_round_producing=False):
         active = self.production[buildingNum]
-        recipe = active['recipe']
+        plan = active['plan']
+        inputs = plan.inputs
         producing = False
 
-        input_status = self._inputs_available(recipe['inputs'], active['count'])
-        if not input_status['available'] and self.sourcing_strategy == 'market':
+        missing_inputs = []
+        if not self.inventory.has_all(plan.input_vector):
+            missing_inputs = self._missing_inputs(inputs)
+        if missing_inputs and self.sourcing_strategy == 'market':
             # not enough inventory to start production
             # sourcing strategy is to acquire missing inputs from market
-            for missing in input_status['missing']:
+            for missing in missing_inputs:
                 product = missing['ticker']
                 count = missing['count']
                 available = missing['available']
                 purchase = count - available
-                self.inventory.add(product, purchase)
-                self.ledger.add(master_clock, Ledger.PURCHASE_INPUT, 'input purchased', 
-                                line=self.line_id, bnum=buildingNum, count=purchase, 
-                                product=product, need=count, available=available)
-            input_status = self._inputs_available(recipe['inputs'], active['count'])
+                self._purchase(master_clock, Ledger.PURCHASE_INPUT, 'input purchased', product, purchase,
+                               count, available, line=self.line_id, bnum=buildingNum)
+            missing_inputs = self._missing_inputs(inputs)
 
-        if input_status['available']:
+        if not missing_inputs:
             # inputs available, consume them from inventory
             producing = True
-            self._consume_inputs(master_clock, recipe['inputs'], active['count'])
+            self._consume_inputs(master_clock, plan)
             # TODO capture production fees (10.00 ICA per 24 baseline production hours)
         elif last_round_producing:
             # not enough inventory to start production
             # sourcing strategy is default or inventory-only
             # capture missing input if we are not able to produce and were producing last step
-            for missing in input_status['missing']:
+            for missing in missing_inputs:
                 self.ledger.add(master_clock, Ledger.MISSING_INPUT, 'missing', 
                     line=self.line_id, bnum=buildingNum, ticker=missing['ticker'], 
                     count=missing['count'], need=missing['count'], available=missing['available'])
         return producing
 
-    def _worker_step(self, master_clock):
-        self.worker_clock.step()
-        if self.worker_clock.to_minutes() <= 0:
-            self._reset_workers(master_clock)
-            self.efficiency = self._calc_line_efficiency()
-        self.ledger.add(master_clock, Ledger.EFFICIENCY, 'efficiency', value=self.efficiency) 
+    def _purchase(self, master_clock, itemtype, description, product, count, need, available, **details):
+        """ 
+        buys count units into the line inventory, through the stream purchasing when there is one
+        returns false when the purchase was refused
+        """
+        if self.purchasing is not None:
+            if not self.purchasing.buy(master_clock, self.ledger, itemtype, product, count, need, available, **details):
+                return False
+        else:
+            self.ledger.add(master_clock, itemtype, description, count=count, product=product, 
+                            **dict(details, need=need, available=available))
+        self.inventory.add(product, count)
+        return True
 
     def _reset_workers(self, master_clock):
         """
@@ -244,7 +348,7 @@ class ProductionLine(object):
         TODO handle edge/unhappy path cases for unsupplied workers
              for now, just ensure adequate supply... :-) 
         """
-        self.worker_clock = DecrClock(Duration("24:00:00"))
+        self.worker_reset = master_clock.to_minutes() + ProductionLine.WORKER_CYCLE
         worker_efficiencies = []
         for staff in self.workers:
             needs = self._calc_worker_needs(staff)
@@ -257,16 +361,7 @@ class ProductionLine(object):
             raise Exception("{} line misconfigured, no workers".format(self.line_id))
 
     def _calc_worker_needs(self, staff):
-        needs = []
-        worker = staff['worker']
-        numworkers = float(staff['count'])
-        for resource in worker['needs']:
-            rate = resource['rate']
-            basis = resource['basis']
-            amount = numworkers * rate/basis
-            essential = resource['essential']
-            needs.append({'id': resource['id'], 'amount': amount, 'essential': essential})
-        return needs
+        return calc_worker_needs(staff['worker'], staff['count'])
 
     def _determine_available_supplies(self, staff, needs):
         supplies = []
@@ -298,19 +393,17 @@ class ProductionLine(object):
                use < need and not essential and self.non_essentials_strategy == 'market':
                 # 'market' strategy in place - purchase supplies 
                 purchase = math.ceil(need - use)
-                self.inventory.add(product, purchase)
-                self.ledger.add(master_clock, Ledger.PURCHASE_SUPPLY, 'supply purchased', 
-                                line=self.line_id, count=purchase, 
-                                product=product, need=need, available=use)
-                use = need
-            elif use < need:
+                if self._purchase(master_clock, Ledger.PURCHASE_SUPPLY, 'supply purchased', product, purchase,
+                                  need, use, line=self.line_id):
+                    use = need
+            if use < need:
                 # 'default' or other strategy in place - rely on inventory only
                 self.ledger.add(master_clock, Ledger.MISSING_SUPPLY, 'missing', 
                     line=self.line_id, ticker=product, count=need-use, 
                     need=need, available=use)
 
-            # consume supplies
-            if not self.inventory.remove(product, use):
+            # consume supplies, nothing is drawn for a supply the site does not hold
+            if use > 0 and not self.inventory.remove(product, use):
                 raise Exception('removing {} {} from inventory failed'.format(use, product))
             self.ledger.add(master_clock, Ledger.INPUT, 'supplies consumed', 
                             count=use, product=product, extype='opex')
@@ -340,13 +433,18 @@ class ProductionLine(object):
             efficiency = essentials_mod_eff + nonessentials_mod_eff
         return efficiency
 
-    def _log_production_activity(self, master_clock):
+    def log_activity(self, minute):
+        """ logs the efficiency and production status for each minute up to the provided minute """
         producing = True
         for prod in self.production:
             if not prod['producing']:
                 producing = False
+        if minute <= self.logged_through:
+            return
+        start = self.logged_through + 1
+        self.ledger.add_span(start, minute, Ledger.EFFICIENCY, 'efficiency', value=self.efficiency) 
         if producing:
-            self.ledger.add(master_clock, Ledger.STATUS, 'producing', state=Ledger.ACTIVE) 
+            self.ledger.add_span(start, minute, Ledger.STATUS, 'producing', state=Ledger.ACTIVE) 
         else:
-            self.ledger.add(master_clock, Ledger.STATUS, 'starved', state=Ledger.INACTIVE) 
-
+            self.ledger.add_span(start, minute, Ledger.STATUS, 'starved', state=Ledger.INACTIVE) 
+        self.logged_through = minute
@@ -0,0 +1,108 @@
+""" market purchases priced against a modeled order book
+"""
+
+from clock import MINUTES_PER_DAY
+from report import Report
+
+class Purchasing(object):
+    """ Purchasing Class
+    Buys the shortfalls of market sourced inputs, supplies and fuel for a value stream.
+    The order book of a product is modeled from its quote, the price curve's quote for the day
+    of the purchase when the run has one: the ask price rising by the slippage
+    for each supply depth's worth bought in a day, so the cost of the day's volume is a closed form.
+    The purchases of a ledger and product are aggregated into a single bulk buy per day,
+    written to the ledger once the day is over, and a purchase is refused when it would take
+    the day's spending over the budget
+    """
+    DEFAULT_SLIPPAGE = 1.0
+
+    def __init__(self, market, budget=None, slippage=DEFAULT_SLIPPAGE, curve=None):
+        self.market = market
+        self.curve = curve
+        self.budget = budget
+        self.slippage = slippage
+        self.day = None
+        self.spent = 0.0
+        self.volumes = {}
+        self.pending = {}
+        self.purchases = 0
+        self.bulk_buys = 0
+        self.refused = 0
+        self.last_cost = 0.0
+        self.total_spent = 0.0
+        self.peak_spent = 0.0
+
+    def cost(self, product, units, minute=None):
+        """ the cost of buying the units of the product in a day, at the prices in effect at the run minute """
+        if self.curve is not None and minute is not None:
+            price = self.curve.price(product, minute)
+        else:
+            price = self.market.price(product)
+        ask = price.ask or price.avg or 0.0
+        depth = max(float(price.supply or 0), 1.0)
+        return ask * units * (1.0 + self.slippage * units / (2.0 * depth))
+
+    def buy(self, master_clock, ledger, itemtype, product, count, need, available, **details):
+        """
+        buys count units for the ledger, adding them to the day's bulk buy,
+        returns false when the day's budget does not cover them, the cost charged is kept in last_cost
+        """
+        minute = master_clock.to_minutes()
+        day = minute // MINUTES_PER_DAY
+        if day != self.day:
+            self.flush()
+            self.day = day
+            self.spent = 0.0
+            self.volumes = {}
+        volume = self.volumes.get(product, 0.0)
+        cost = self.cost(product, volume + count, minute) - self.cost(product, volume, minute)
+        if self.budget is not None and self.spent + cost > self.budget:
+            self.refused = self.refused + 1
+            return False
+        self.spent = self.spent + cost
+        self.last_cost = cost
+        self.peak_spent = max(self.peak_spent, self.spent)
+        self.total_spent = self.total_spent + cost
+        self.volumes[product] = volume + count
+        self.purchases = self.purchases + 1
+
+        key = (ledger.line_id, itemtype, product)
+        if key not in self.pending:
+            self.pending[key] = {
+                'ledger': ledger,
+                'minute': minute,
+                'count': 0.0,
+                'need': 0.0,
+                'available': 0.0,
+                'cost': 0.0,
+                'details': details
+            }
+        pending = self.pending[key]
+        if pending['details'].get('bnum') != details.get('bnum'):
+            # bought for several buildings of the line
+            pending['details']['bnum'] = '*'
+        pending['count'] = pending['count'] + count
+        pending['need'] = pending['need'] + need
+        pending['available'] = pending['available'] + available
+        pending['cost'] = pending['cost'] + cost
+        return True
+
+    def flush(self):
+        """ writes the pending bulk buys to their ledgers """
+        for (line_id, itemtype, product), pending in self.pending.items():
+            pending['ledger'].add_minute(pending['minute'], itemtype, 'bulk purchase', product=product,
+                                         count=pending['count'], cost=pending['cost'], need=pending['need'],
+                                         available=pending['available'], **pending['details'])
+            self.bulk_buys = self.bulk_buys + 1
+        self.pending = {}
+
+    def output_summary(self, outfile):
+        """ outputs the purchase counts and spending """
+        report = Report(outfile)
+        report.start()
+        report.output_general('Purchases  : {} aggregated into {} bulk buys'.format(self.purchases, self.bulk_buys))
+        report.output_general('Refused    : {} over the daily budget of {}'.format(
+            self.refused, 'unlimited' if self.budget is None else '{:.2f}'.format(self.budget)))
+        report.output_general('Slippage   : {} per supply depth'.format(self.slippage))
+        report.output_general('Spent      : {:.2f} total, {:.2f} on the busiest day'.format(self.total_spent, self.peak_spent))
+        report.end()
@@ -1,7 +1,7 @@
 """ report generation class
 """
 
-from market import Price
+from market import PriceAccumulator
 
 class Report(object):
     """ Report class
@@ -43,7 +43,7 @@ class Report(object):
 
     def output_value_table(self, inventory, name=None):
         total_count = 0
-        total_prices = Price()
+        total_prices = PriceAccumulator()
 
         if name:
             header = "{}:".format(name)
@@ -53,7 +53,7 @@ class Report(object):
         self.output_general(self.VT_HEAD)
         for key in inventory.keys():
             total_count = total_count + inventory[key]['count']
-            total_prices = total_prices.add(inventory[key]['value'])
+            total_prices.add(inventory[key]['value'])
             product_line = self.VT_BODYFMT.format(
                 product=key,
                 count=inventory[key]['count'],
@@ -65,7 +65,7 @@ class Report(object):
 
     def output_value_table_w_perday(self, inventory, name, duration):
         total_count = 0
-        total_prices = Price()
+        total_prices = PriceAccumulator()
         total_perday = 0.0
         days = duration.to_days()
 
@@ -78,7 +78,7 @@ class Report(object):
         for key in inventory.keys():
             count = inventory[key]['count']
             total_count = total_count + count
-            total_prices = total_prices.add(inventory[key]['value'])
+            total_prices.add(inventory[key]['value'])
             perday = float(count)/float(days)
             total_perday = total_perday + perday
             product_line = self.VT_BODYFMT_WDUR.format(
@@ -0,0 +1,178 @@
+""" run file loading shared by the value stream models
+"""
+import os
+import multiprocessing
+from inventory import SiteInventories
+from market import Market
+from pricehistory import PriceHistory
+from pricecurve import PriceCurve
+from marketdepth import MarketDepth
+from purchasing import Purchasing
+from clock import Duration
+from configuration import load_yamlfile
+
+class DataCache(object):
+    """ DataCache Class
+    Parses each data file and builds each market once, so batches of runs
+    sharing valstream, efficiency, inventory and exchange files reuse them
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.markets = {}
+        self.histories = {}
+
+    def load(self, path):
+        if path not in self.files:
+            self.files[path] = load_yamlfile(path)
+        return self.files[path]
+
+    def market(self, path, currency):
+        """ the market of the exchange file, bare tickers priced on the currency's exchange """
+        key = (path, currency)
+        if key not in self.markets:
+            if path not in self.markets:
+                self.markets[path] = Market(self.load(path))
+            self.markets[key] = self.markets[path].view(currency)
+        return self.markets[key]
+
+    def history(self, path):
+        if path not in self.histories:
+            self.histories[path] = PriceHistory(path)
+        return self.histories[path]
+
+    def history_market(self, path, config_date, currency):
+        """ the market in effect on the config date from the price history """
+        key = (path, config_date, currency)
+        if key not in self.markets:
+            if (path, config_date) not in self.markets:
+                self.markets[(path, config_date)] = self.history(path).market(config_date)
+            self.markets[key] = self.markets[(path, config_date)].view(currency)
+        return self.markets[key]
+
+    def run_market(self, config_file, config_date):
+        """ the market of a run file, from its price history as of the config date or its exchange file """
+        if config_file.get('price-history'):
+            return self.history_market(config_file['price-history'], config_date, config_file['currency'])
+        return self.market(resolve_files(config_file, config_date)['exchange'], config_file['currency'])
+
+def resolve_files(config_file, config_date):
+    """ returns the data files referenced by the run file with the {date} replaced """
+    files = {}
+    for key in ['valstream', 'efficiency', 'inventory', 'exchange']:
+        if key not in config_file:
+            continue
+        files[key] = config_file[key].replace('{date}', config_date)
+    return files
+
+def load_price_curve(config_file, config_date, market, cache):
+    """ the price curve of a backtest run, None when the run is priced at the static market """
+    curve_config = config_file.get('price-curve')
+    if not curve_config:
+        return None
+    if curve_config == 'history':
+        if not config_file.get('price-history'):
+            raise Exception('price-curve history requires a price-history file')
+        return PriceCurve.from_history(cache.history(config_file['price-history']), market, config_date)
+    return PriceCurve.from_factors(market, curve_config)
+
+def load_run_config(config_file, config_date, timestamp, cache, verbose=True):
+    """ builds the value stream configuration from a parsed run file """
+    files = resolve_files(config_file, config_date)
+    description = config_file['description']
+    valstream_file = files['valstream']
+    efficiency_file = files['efficiency']
+    inventory_file = files['inventory']
+    exchange_file = files.get('exchange')
+    currency = config_file['currency']
+    sourcing_strategy = config_file['sourcing-strategy']
+    essentials_strategy = config_file['essentials-strategy']
+    non_essentials_strategy = config_file['non-essentials-strategy']
+    duration_config = config_file['duration']
+    output_file = config_file['output']
+    snapshot_config = config_file.get('snapshot-interval')
+    snapshot_file = config_file.get('snapshot-output')
+    history_file = config_file.get('price-history')
+
+    outfile = open(output_file, 'w')
+
+    def echo(line):
+        if verbose:
+            print(line)
+        print(line, file=outfile)
+
+    echo('model value stream started {}'.format(timestamp))
+    echo('  description    : {}'.format(description))
+    echo('  config date    : {}'.format(config_date))
+    echo('  valstream      : {}'.format(valstream_file))
+    echo('  efficiency     : {}'.format(efficiency_file))
+    echo('  inventory      : {}'.format(inventory_file))
+    if history_file:
+        echo('  price history  : {} as of {}'.format(history_file, config_date))
+    else:
+        echo('  exchange       : {}'.format(exchange_file))
+    echo('  currency       : {}'.format(currency))
+    echo('  sourcing       : {}'.format(sourcing_strategy))
+    echo('  essentials     : {}'.format(essentials_strategy))
+    echo('  non-essentials : {}'.format(non_essentials_strategy))
+    echo('  duration       : {}'.format(duration_config))
+    echo('  output         : {}'.format(output_file))
+    if snapshot_config:
+        echo('  snapshots      : {} every {}'.format(snapshot_file, snapshot_config))
+
+    valstream = cache.load(valstream_file)
+    efficiency = cache.load(efficiency_file)
+    inventory = SiteInventories(cache.load(inventory_file))
+    market = cache.run_market(config_file, config_date)
+    curve = load_price_curve(config_file, config_date, market, cache)
+    if curve:
+        echo('  price curve    : {}'.format(curve.description))
+    depth = None
+    if 'market-depth' in config_file:
+        depth_config = config_file['market-depth'] or {}
+        depth = MarketDepth(market, depth_config.get('turnover', MarketDepth.DEFAULT_TURNOVER),
+                            depth_config.get('impact', MarketDepth.DEFAULT_IMPACT))
+        echo('  market depth   : turnover {} impact {}'.format(depth.turnover, depth.impact))
+    purchasing = None
+    if 'purchasing' in config_file:
+        purchasing_config = config_file['purchasing'] or {}
+        purchasing = Purchasing(market, purchasing_config.get('budget'),
+                                purchasing_config.get('slippage', Purchasing.DEFAULT_SLIPPAGE), curve)
+        echo('  purchasing     : budget {}/day slippage {}'.format(purchasing.budget or 'unlimited', purchasing.slippage))
+    duration = Duration(duration_config)
+    snapshot_interval = None
+    snapshotfile = None
+    if snapshot_config:
+        snapshot_interval = Duration(snapshot_config)
+        snapshotfile = open(snapshot_file, 'w')
+
+    return {
+        'config-date': config_date,
+        'valstream': valstream,
+        'efficiency': efficiency,
+        'inventory': inventory,
+        'market': market,
+        'price-curve': curve,
+        'market-depth': depth,
+        'purchasing': purchasing,
+        'sourcing-strategy': sourcing_strategy,
+        'essentials-strategy': essentials_strategy,
+        'non-essentials-strategy': non_essentials_strategy,
+        'duration': duration,
+        'outfile': outfile,
+        'snapshot-interval': snapshot_interval,
+        'snapshotfile': snapshotfile
+    }
+
+def create_pool(processes):
+    """ 
+    creates the worker pool for parallel runs
+    forked workers share the data already parsed into the cache and configuration
+    """
+    context = multiprocessing
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    return context.Pool(processes)
+
+def pool_size(jobs):
+    return max(1, min(jobs, os.cpu_count() or 1))
@@ -0,0 +1,150 @@
+""" Shipping between site inventories
+"""
+
+import math
+import heapq
+from clock import Duration
+from market import Price, PriceAccumulator
+from ledger import Ledger
+from report import Report
+
+class Shipping(object):
+    """ Shipping class
+    Moves material between site inventories following the shipment rules of the value stream.
+    Each rule is checked on its interval and ships the surplus above its threshold, paying
+    the rule's fuel from the source site. Shipments in flight are kept in a heap ordered by
+    arrival, the value stream is given the next arrival as an event so a delivery costs
+    O(log n) instead of a scan of every shipment
+    """
+    CHECK_EVENT = 0
+    DELIVERY_EVENT = 1
+    DEFAULT_CHECK = '1:00:00:00'
+
+    def __init__(self, stream_id, rules, config):
+        self.inventories = config['inventory']
+        self.market = config['market']
+        self.sourcing_strategy = config['sourcing-strategy']
+        self.purchasing = config.get('purchasing')
+        self.ledger = Ledger(stream_id, 'SHIPPING', None, None, self.market, config.get('price-curve'))
+        self.rules = [self._init_rule(rule) for rule in rules]
+        self.in_flight = []
+        self.shipped = 0
+
+    def _init_rule(self, rule):
+        for key in ['from', 'to', 'ticker', 'above', 'transit']:
+            if key not in rule:
+                raise Exception('shipment rule {} is missing {}'.format(rule, key))
+        return {
+            'id': rule.get('rule-id', '{}.{}.{}'.format(rule['ticker'], rule['from'], rule['to'])),
+            'ticker': rule['ticker'],
+            'source': self.inventories.site(rule['from']),
+            'destination': self.inventories.site(rule['to']),
+            'above': rule['above'],
+            'min-count': rule.get('min-count', 1),
+            'max-count': rule.get('max-count'),
+            'transit': max(Duration(rule['transit']).to_minutes(), 1),
+            'check': max(Duration(rule.get('check', Shipping.DEFAULT_CHECK)).to_minutes(), 1),
+            'fuel': rule.get('fuel', {}),
+            'shipments': 0,
+            'count': 0.0,
+            'fuel-cost': PriceAccumulator()
+        }
+
+    def initial_events(self):
+        """ returns the (minute, event type, rule) events of the first rule checks """
+        return [(rule['check'], Shipping.CHECK_EVENT, rnum) for rnum, rule in enumerate(self.rules)]
+
+    def process_event(self, master_clock, event_type, num):
+        """
+        checks a rule or delivers the next arriving shipment
+        returns the follow-on events and the inventory restocked by a delivery, if any
+        """
+        result = {
+            'events': [],
+            'restocked': None
+        }
+        if event_type == Shipping.DELIVERY_EVENT:
+            arrival, seq, rnum, count = heapq.heappop(self.in_flight)
+            rule = self.rules[rnum]
+            rule['destination'].add(rule['ticker'], count)
+            self.ledger.add(master_clock, Ledger.DELIVERY, 'shipment delivered',
+                            count=count, product=rule['ticker'], rule=rule['id'])
+            result['restocked'] = rule['destination']
+            return result
+
+        rule = self.rules[num]
+        result['events'].append((master_clock.to_minutes() + rule['check'], Shipping.CHECK_EVENT, num))
+        arrival = self._ship(master_clock, num)
+        if arrival is not None:
+            result['events'].append((arrival, Shipping.DELIVERY_EVENT, 0))
+        return result
+
+    def _ship(self, master_clock, rnum):
+        """ ships the rule's surplus, returning the arrival minute or None when nothing shipped """
+        rule = self.rules[rnum]
+        source = rule['source']
+        # the fuel is held back from the surplus when the rule ships its own fuel
+        count = math.floor(source.count(rule['ticker']) - rule['above'] - rule['fuel'].get(rule['ticker'], 0))
+        if rule['max-count'] is not None:
+            count = min(count, rule['max-count'])
+        if count < rule['min-count'] or not self._fuel(master_clock, rnum):
+            return None
+        if not source.remove(rule['ticker'], count):
+            return None
+        self.ledger.add(master_clock, Ledger.SHIPMENT, 'shipment sent',
+                        count=count, product=rule['ticker'], rule=rule['id'])
+        rule['shipments'] = rule['shipments'] + 1
+        rule['count'] = rule['count'] + count
+        arrival = master_clock.to_minutes() + rule['transit']
+        self.shipped = self.shipped + 1
+        heapq.heappush(self.in_flight, (arrival, self.shipped, rnum, count))
+        return arrival
+
+    def _fuel(self, master_clock, rnum):
+        """ consumes the fuel for a shipment from the source site, returns false when short """
+        rule = self.rules[rnum]
+        source = rule['source']
+        missing = [(ticker, count, source.count(ticker)) for ticker, count in rule['fuel'].items()
+                   if source.count(ticker) < count]
+        if len(missing) > 0 and self.sourcing_strategy != 'market':
+            for ticker, count, available in missing:
+                self.ledger.add(master_clock, Ledger.MISSING_INPUT, 'missing',
+                    line=self.ledger.line_id, bnum=rnum, ticker=ticker,
+                    count=count, need=count, available=available)
+            return False
+        for ticker, count, available in missing:
+            if self.purchasing is not None:
+                if not self.purchasing.buy(master_clock, self.ledger, Ledger.PURCHASE_INPUT, ticker, count - available,
+                                           count, available, line=self.ledger.line_id, bnum=rnum):
+                    self.ledger.add(master_clock, Ledger.MISSING_INPUT, 'missing',
+                        line=self.ledger.line_id, bnum=rnum, ticker=ticker,
+                        count=count, need=count, available=available)
+                    return False
+            else:
+                self.ledger.add(master_clock, Ledger.PURCHASE_INPUT, 'fuel purchased',
+                                line=self.ledger.line_id, bnum=rnum, count=count - available,
+                                product=ticker, need=count, available=available)
+            source.add(ticker, count - available)
+        for ticker, count in rule['fuel'].items():
+            source.remove(ticker, count)
+            self.ledger.add(master_clock, Ledger.INPUT, 'fuel consumed',
+                            count=count, product=ticker, extype='shipping')
+            rule['fuel-cost'].add_multiple(self.ledger.price(ticker, master_clock.to_minutes()), count)
+        return True
+
+    def output_summary(self, outfile):
+        """ outputs the shipments and fuel cost of each rule """
+        total = PriceAccumulator()
+        report = Report(outfile)
+        report.start()
+        report.output_general('{:<24} {:>9} {:>12} {:>6}  {}'.format('Rule', 'Shipments', 'Shipped', 'Ticker', 'Fuel Cost (Avg)'))
+        report.minor_break()
+        for rule in self.rules:
+            report.output_general('{:<24} {:>9d} {:>12.2f} {:>6}  {:>12.2f}'.format(
+                rule['id'][:24], rule['shipments'], rule['count'], rule['ticker'], rule['fuel-cost'].avg))
+            total.add(rule['fuel-cost'])
+        report.minor_break()
+        report.output_general('In Transit : {} shipments'.format(len(self.in_flight)))
+        report.output_general('                   {}'.format(Price.HEADER_FMT))
+        report.output_general('Shipping Cost    : {}'.format(total.total()))
+        report.end()
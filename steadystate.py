@@ -0,0 +1,317 @@
+""" closed-form steady state of a value stream
+"""
+
+import math
+from clock import Duration, MINUTES_PER_DAY
+from configuration import Buildings, Recipes, Workers
+from productionline import calc_line_efficiency, calc_recipe_minutes, calc_worker_needs
+from inventory import Inventory
+from market import Price, PriceAccumulator
+from report import Report
+from shipping import Shipping
+from procurement import Procurement
+
+class SteadyState(object):
+    """ SteadyState Class
+    Per day rates of a value stream derived directly from the recipes, buildings,
+    workers and site efficiencies, without stepping the simulation.
+    Workers are taken as fully supplied and every building as always producing:
+    the buildings of a line share its queue, so each queue entry runs equally often
+    and a full pass of the queue occupies the line for the sum of the entry minutes.
+    Shipment rules move the surplus of their source site to the destination, as much as
+    the rule's maximum per check allows, and procurement rules buy into their site
+    """
+
+    def __init__(self, config):
+        self.streamconfig = config['valstream']
+        self.efficiency = config['efficiency']
+        self.inventory = config['inventory']
+        self.market = config['market']
+        self.sourcing_strategy = config['sourcing-strategy']
+        self.essentials_strategy = config['essentials-strategy']
+        self.non_essentials_strategy = config['non-essentials-strategy']
+        self.purchasing = config.get('purchasing')
+
+    def line_rates(self, line_spec):
+        """ per day outputs, inputs and worker supplies of a single production line """
+        linetype = line_spec['line-type']
+        site_name = line_spec['site-name']
+        building = Buildings[linetype]
+        building_count = line_spec['buildingCount']
+        efficiency = calc_line_efficiency(building, self.efficiency[site_name], 1.0)
+
+        queue_minutes = 0
+        for item in line_spec['queue']:
+            if item['recipe'] not in Recipes:
+                raise Exception('recipe {} not found'.format(item['recipe']))
+            queue_minutes = queue_minutes + max(calc_recipe_minutes(Recipes[item['recipe']], item['count'], efficiency), 1)
+        queues_per_day = float(MINUTES_PER_DAY) * building_count / queue_minutes
+
+        outputs = Inventory({})
+        inputs = Inventory({})
+        for item in line_spec['queue']:
+            recipe = Recipes[item['recipe']]
+            for output in recipe['outputs']:
+                outputs.add(output['id'], output['count'] * item['count'] * queues_per_day)
+            for input in recipe['inputs']:
+                inputs.add(input['id'], input['count'] * item['count'] * queues_per_day)
+
+        essentials = Inventory({})
+        non_essentials = Inventory({})
+        for need in building['workers']:
+            if need['type'] not in Workers[site_name]:
+                raise Exception("worker {} not defined".format(need['type']))
+            worker = Workers[site_name][need['type']]
+            for supply in calc_worker_needs(worker, need['count'] * building_count):
+                if supply['essential']:
+                    essentials.add(supply['id'], supply['amount'])
+                else:
+                    non_essentials.add(supply['id'], supply['amount'])
+
+        return {
+            'line-id': line_spec['line-id'],
+            'site-name': site_name,
+            'identity': '{}{}[{}]'.format(linetype, building_count, '.'.join(
+                [item['recipe'].replace('.', '') + 'x' + str(item['count']) for item in line_spec['queue']])),
+            'efficiency': efficiency,
+            'queue-minutes': queue_minutes,
+            'queues-per-day': queues_per_day,
+            'outputs': outputs,
+            'inputs': inputs,
+            'essentials': essentials,
+            'non-essentials': non_essentials
+        }
+
+    def evaluate(self):
+        """
+        per day rates of every line and the stream, the stream net value per day,
+        and the materials each site inventory is drawn on faster than it is restocked
+        """
+        lines = [self.line_rates(line_spec) for line_spec in self.streamconfig['productionLines']]
+        outputs = Inventory({})
+        inputs = Inventory({})
+        supplies = Inventory({})
+        for line in lines:
+            outputs.add_all(line['outputs'])
+            inputs.add_all(line['inputs'])
+            supplies.add_all(line['essentials'])
+            supplies.add_all(line['non-essentials'])
+
+        net = PriceAccumulator()
+        self.market.accumulate(net, outputs.counts, outputs.order)
+        self.market.accumulate(net, inputs.counts, inputs.order, -1.0)
+        self.market.accumulate(net, supplies.counts, supplies.order, -1.0)
+
+        # lines only draw from the inventory of their own site
+        sites = {}
+        for line in lines:
+            sites.setdefault(self._site_key(line['site-name']), []).append(line)
+        flows = {site_name: self._site_flows(site_lines) for site_name, site_lines in sites.items()}
+        self._apply_shipments(flows)
+        self._apply_procurement(flows)
+        shortfalls = []
+        purchases = PriceAccumulator()
+        for site_name in sites.keys():
+            for shortfall in self._shortfalls(site_name, flows[site_name]):
+                if shortfall['purchased']:
+                    purchases.add_multiple(self.market.price(shortfall['ticker']), shortfall['deficit'])
+                shortfalls.append(shortfall)
+
+        return {
+            'lines': lines,
+            'outputs': outputs,
+            'inputs': inputs,
+            'supplies': supplies,
+            'net': net.total(),
+            'purchases': purchases.total(),
+            'shortfalls': shortfalls,
+            'fp': '-'.join([line['identity'] for line in lines])
+        }
+
+    def _site_key(self, site_name):
+        """ the key of the inventory a site draws from, None when every site shares one """
+        if self.inventory.partitioned():
+            return site_name
+        return None
+
+    def _site_flows(self, lines):
+        """ the materials produced, drawn and shipped in per day at a site, and the strategy they are sourced by """
+        flows = {
+            'produced': Inventory({}),
+            'drawn': Inventory({}),
+            'supplies': Inventory({}),
+            'shipped': Inventory({}),
+            'procured': {},
+            'strategies': {}
+        }
+        for line in lines:
+            flows['produced'].add_all(line['outputs'])
+            for key, strategy in [('inputs', self.sourcing_strategy),
+                                  ('essentials', self.essentials_strategy),
+                                  ('non-essentials', self.non_essentials_strategy)]:
+                flows['drawn'].add_all(line[key])
+                if key != 'inputs':
+                    flows['supplies'].add_all(line[key])
+                for product in line[key].items.keys():
+                    flows['strategies'].setdefault(product, set()).add(strategy)
+        return flows
+
+    def _apply_shipments(self, flows):
+        """ moves the surplus per day of each shipment rule from its source to its destination, in rule order """
+        for rule in self.streamconfig.get('shipments', []):
+            source = flows.get(self._site_key(rule['from']))
+            destination = flows.get(self._site_key(rule['to']))
+            if source is None or destination is None or source is destination:
+                continue
+            ticker = rule['ticker']
+            checks = float(MINUTES_PER_DAY) / max(Duration(rule.get('check', Shipping.DEFAULT_CHECK)).to_minutes(), 1)
+            count = (source['produced'].count(ticker) + source['shipped'].count(ticker)
+                     - source['drawn'].count(ticker))
+            if rule.get('max-count') is not None:
+                count = min(count, rule['max-count'] * checks)
+            if count <= 1e-9:
+                continue
+            source['drawn'].add(ticker, count)
+            destination['shipped'].add(ticker, count)
+            # the source pays the fuel of every shipment, at most one per check
+            shipments = min(checks, count / max(rule.get('min-count', 1), 1))
+            for fuel, fuel_count in rule.get('fuel', {}).items():
+                source['drawn'].add(fuel, fuel_count * shipments)
+                source['strategies'].setdefault(fuel, set()).add(self.sourcing_strategy)
+
+    def _apply_procurement(self, flows):
+        """
+        sets the units per day each procurement rule buys into its site, None for a reorder
+        rule which keeps the stock topped up however fast it is drawn.
+        With a purchase budget the rules buy in rule order from one day's budget, and like the
+        purchasing a buy costing more than is left is refused outright, a reorder rule's buy
+        being the stock between its reorder point and order level
+        """
+        budget = None
+        if self.purchasing is not None and self.purchasing.budget is not None:
+            budget = self.purchasing.budget
+        volumes = {}
+        for rule in self.streamconfig.get('procurement', []):
+            site = flows.get(self._site_key(rule['site']))
+            if site is None:
+                continue
+            ticker = rule['ticker']
+            burn = site['supplies'].count(ticker)
+            if 'every' in rule:
+                count = math.ceil(Procurement.level(rule, 'count', 'order-days', burn))
+                buys = float(MINUTES_PER_DAY) / max(Duration(rule['every']).to_minutes(), 1)
+                procured = count * buys
+            else:
+                count = max(math.ceil(Procurement.level(rule, 'order-up-to', 'order-days', burn)
+                                      - Procurement.level(rule, 'reorder-point', 'reorder-days', burn)), 1)
+                buys = 1.0
+                procured = None
+            if budget is not None:
+                day_buys = max(int(buys), 1)
+                bought = 0
+                for bnum in range(day_buys):
+                    volume = volumes.get(ticker, 0.0)
+                    cost = self.purchasing.cost(ticker, volume + count) - self.purchasing.cost(ticker, volume)
+                    if cost > budget:
+                        break
+                    budget = budget - cost
+                    volumes[ticker] = volume + count
+                    bought = bought + 1
+                if procured is not None:
+                    procured = procured * bought / day_buys
+                elif bought == 0:
+                    procured = 0.0
+            if procured is None:
+                site['procured'][ticker] = None
+            elif site['procured'].get(ticker, 0.0) is not None:
+                site['procured'][ticker] = site['procured'].get(ticker, 0.0) + procured
+
+    def _shortfalls(self, site_name, flows):
+        """ materials drawn faster than produced and shipped in, either procured, bought or run out of stock """
+        inventory = self.inventory.lookup(site_name)
+        strategies = flows['strategies']
+        shortfalls = []
+        for product in sorted(strategies.keys()):
+            shipped = flows['shipped'].count(product)
+            deficit = flows['drawn'].count(product) - flows['produced'].count(product) - shipped
+            if deficit <= 1e-9:
+                continue
+            procured = 0.0
+            if product in flows['procured']:
+                procured = flows['procured'][product]
+                procured = deficit if procured is None else min(procured, deficit)
+            if procured > 1e-9:
+                shortfalls.append({
+                    'site': site_name,
+                    'ticker': product,
+                    'deficit': procured,
+                    'shipped': shipped,
+                    'stock': inventory.count(product),
+                    'days': None,
+                    'purchased': True,
+                    'supplied': 'procured'
+                })
+                deficit = deficit - procured
+                if deficit <= 1e-9:
+                    continue
+            shortfalls.append({
+                'site': site_name,
+                'ticker': product,
+                'deficit': deficit,
+                'shipped': shipped,
+                'stock': inventory.count(product),
+                'days': inventory.count(product) / deficit,
+                'purchased': strategies[product] == {'market'},
+                'supplied': 'purchased'
+            })
+        return shortfalls
+
+    def output_summary(self, outfile, state=None):
+        """ outputs the steady state rates to the provided outfile, returning the stream state """
+        if state is None:
+            state = self.evaluate()
+
+        report = Report(outfile)
+        report.start()
+        report.output_general('Steady State: {}'.format(self.streamconfig['description']))
+        layout = 'Layout     : {}'.format(state['fp'])
+        width = Report.TABLE_WIDTH - 4
+        report.output_general(layout[:width])
+        for start in range(width, len(layout), width - 13):
+            report.output_general(' ' * 13 + layout[start:start + width - 13])
+        report.major_break()
+        for line in state['lines']:
+            report.output_general('{:<10} efficiency {:7.2%}  queue {:>6d} min  {:8.3f} queues/day'
+                                  .format(line['line-id'], line['efficiency'], line['queue-minutes'],
+                                          line['queues-per-day']))
+        report.output_general("")
+        report.output_general('                   {}'.format(Price.HEADER_FMT))
+        report.output_general('Net Value/Day    : {}'.format(state['net']))
+        report.output_general('Purchases/Day    : {}'.format(state['purchases']))
+        report.major_break()
+        report.output_value_table(state['outputs'].summarize_inventory(self.market)['inventory'],
+                                  'Produced Materials/Day')
+        report.major_break()
+        report.output_value_table(state['inputs'].summarize_inventory(self.market)['inventory'],
+                                  'Consumed Materials/Day')
+        report.major_break()
+        report.output_value_table(state['supplies'].summarize_inventory(self.market)['inventory'],
+                                  'Worker Supplies/Day')
+
+        if len(state['shortfalls']) > 0:
+            report.major_break()
+            report.output_general('Shortfalls:')
+            report.major_break()
+            for shortfall in state['shortfalls']:
+                if shortfall['site'] is not None:
+                    shortfall = dict(shortfall, ticker='{site}.{ticker}'.format(**shortfall))
+                if shortfall['purchased']:
+                    message = '{ticker} short {deficit:4.2f}/day, {supplied}'.format(**shortfall)
+                else:
+                    message = ('{ticker} short {deficit:4.2f}/day, starves after {days:4.2f} days '
+                               '(stock {stock:4.2f})'.format(**shortfall))
+                if shortfall['shipped'] > 0:
+                    message = message + ' after {:4.2f}/day shipped in'.format(shortfall['shipped'])
+                report.output_general(message)
+        report.end()
+        return state
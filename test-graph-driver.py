@@ -0,0 +1,140 @@
+#!/usr/bin/python3
+""" test driver for production graphs
+Costs a small set of templates at one site, including templates consuming each other's
+outputs, and checks the dependency order, the variant counts, the pruned trees against the
+full enumeration and the costs the supply and cycle solvers settle on
+"""
+
+import os
+import sys
+import importlib
+from market import Market
+
+graph = importlib.import_module('build-graph')
+
+MARKET = Market({
+    'IC1': {'currency': 'ICA', 'prices': {
+        'DW': {'last': 10.0, 'ask': 10.0, 'bid': 10.0, 'avg': 10.0, 'supply': 1000, 'demand': 1000},
+        'H2O': {'last': 4.0, 'ask': 4.0, 'bid': 4.0, 'avg': 4.0, 'supply': 1000, 'demand': 1000},
+        'AA': {'last': 100.0, 'ask': 100.0, 'bid': 100.0, 'avg': 100.0, 'supply': 100, 'demand': 100},
+        'BB': {'last': 100.0, 'ask': 100.0, 'bid': 100.0, 'avg': 100.0, 'supply': 100, 'demand': 100},
+        'CC': {'last': 100.0, 'ask': 100.0, 'bid': 100.0, 'avg': 100.0, 'supply': 100, 'demand': 100},
+        'DD': {'last': 200.0, 'ask': 200.0, 'bid': 200.0, 'avg': 200.0, 'supply': 100, 'demand': 100},
+        'EE': {'last': 100.0, 'ask': 100.0, 'bid': 100.0, 'avg': 100.0, 'supply': 100, 'demand': 100},
+        'PP': {'last': 90.0, 'ask': 90.0, 'bid': 90.0, 'avg': 90.0, 'supply': 100, 'demand': 100},
+        'QQ': {'last': 50.0, 'ask': 50.0, 'bid': 50.0, 'avg': 50.0, 'supply': 100, 'demand': 100}
+    }}
+})
+
+def template(inputs, outputs, time='24:00:00'):
+    return {'line': 'BLD', 'time': time,
+            'inputs': [{'id': ticker, 'count': count} for ticker, count in inputs],
+            'outputs': [{'id': ticker, 'count': count} for ticker, count in outputs]}
+
+# a building at 100% efficiency whose workers burn 1 DW a day; DW.T makes the DW from H2O,
+# AA.T, BB.T and CC.T consume each other's outputs, EE.T consumes its own output
+TEMPLATES = {
+    'DW.T': template([('H2O', 1)], [('DW', 2)]),
+    'AA.T': template([('BB', 1)], [('AA', 1)]),
+    'BB.T': template([('CC', 1)], [('BB', 1)]),
+    'CC.T': template([('AA', 1)], [('CC', 1)]),
+    'DD.T': template([('AA', 1)], [('DD', 1)]),
+    'EE.T': template([('EE', 1)], [('EE', 2)]),
+    'PP.T': template([('QQ', 1)], [('PP', 1)]),
+    'QQ.F': template([], [('QQ', 1)]),
+    'QQ.G': template([], [('QQ', 1)], '48:00:00')
+}
+
+def create_config():
+    config = {
+        'templates': TEMPLATES,
+        'buildings': {'BLD': {'expertise': 'MANUFACTURING', 'workers': [{'type': 'PIONEER', 'count': 10}]}},
+        'efficiency': {'Test': {'cogc-worker-bonus': {'PIONEER': 0.0},
+                                'cogc-industry-bonus': {'MANUFACTURING': 0.0},
+                                'experts': {'MANUFACTURING': 0}, 'expert-factors': {0: 0.0},
+                                'soil-fertility': 0.0}},
+        'workers': {'Test': {'PIONEER': {'needs': [{'id': 'DW', 'rate': 10.0, 'basis': 100.0}]}}},
+        'market': MARKET,
+        'site': 'Test',
+        'tolerance': 1e-9,
+        'max-passes': 100,
+        'log': open(os.devnull, 'w')
+    }
+    config['supply'] = graph.create_supply_map(config)
+    config['sources'] = graph.create_source_map(config)
+    config['components'] = graph.create_component_list(config)
+    config['cycles'] = graph.create_cycle_map(config)
+    return config
+
+failures = 0
+
+def check(label, actual, expected):
+    global failures
+    result = 'ok'
+    if isinstance(expected, float):
+        if abs(actual - expected) > 1e-6:
+            result = 'FAIL'
+    elif actual != expected:
+        result = 'FAIL'
+    if result == 'FAIL':
+        failures = failures + 1
+    print('{:<44} {:>24} {:>24} {}'.format(label, str(actual), str(expected), result))
+
+def cheapest(nodes):
+    return min([node.total_cost_per_unit for node in nodes])
+
+print('{:<44} {:>24} {:>24}'.format('check', 'actual', 'expected'))
+config = create_config()
+
+# components follow the components they depend on, cycles are grouped
+position = {}
+for index, component in enumerate(config['components']):
+    for key in component:
+        position[key] = index
+check('AA.T, BB.T and CC.T in one component', sorted(config['components'][position['AA.T']]), ['AA.T', 'BB.T', 'CC.T'])
+check('DD.T after the cycle', position['DD.T'] > position['AA.T'], True)
+check('templates in cycles', sorted(config['cycles'].keys()), ['AA.T', 'BB.T', 'CC.T', 'EE.T'])
+check('DW.T and PP.T not in a cycle', 'DW.T' in config['cycles'] or 'PP.T' in config['cycles'], False)
+
+# a source in the key's cycle counts as a single variant
+check('AA.T variants: BB.MKT, BB.T', graph.count_prod_trees(config, 'AA.T'), 2)
+check('DD.T variants: AA.MKT, 2 of AA.T', graph.count_prod_trees(config, 'DD.T'), 3)
+check('EE.T variants: EE.MKT, EE.T', graph.count_prod_trees(config, 'EE.T'), 2)
+check('PP.T variants: QQ.MKT, QQ.F, QQ.G', graph.count_prod_trees(config, 'PP.T'), 3)
+
+nodes = graph.solve_supply(config)
+
+# DW from DW.T settles at DW = (4 + DW) / 2
+check('DW supply cost', config['supply']['DW'], 4.0)
+check('DW.T cost per DW', cheapest(nodes['DW.T']), 4.0)
+
+# EE.T settles at E = (4 + E) / 2, the first pass buying EE at 100
+check('EE.T cost per EE', cheapest(nodes['EE.T']), 4.0)
+check('EE.T trees kept: cycle and market', [node.description for node in nodes['EE.T']],
+      ['EE.T.1<-EE.T.1', 'EE.T.0<-EE.MKT.0'])
+
+# going round AA.T, BB.T and CC.T costs more than the market, so each buys its input
+check('AA.T cost per AA', cheapest(nodes['AA.T']), 104.0)
+check('CC.T cost per CC', cheapest(nodes['CC.T']), 104.0)
+check('DD.T cost per DD', cheapest(nodes['DD.T']), 104.0)
+
+# QQ.G costs more than QQ.F and takes longer, so PP.T is never built on it
+check('PP.T trees kept', [node.description for node in nodes['PP.T']], ['PP.T.1<-QQ.F.0', 'PP.T.0<-QQ.MKT.0'])
+check('PP.T cost per PP on QQ.F', nodes['PP.T'][0].total_cost_per_unit, 8.0)
+
+# the pruned trees are the trees of the full enumeration at their variant
+for key in ['DD.T', 'EE.T', 'PP.T']:
+    enumerated = list(graph.iter_prod_trees(config, key))
+    check('{} trees enumerated'.format(key), len(enumerated), graph.count_prod_trees(config, key))
+    check('{} pruned trees in the enumeration'.format(key),
+          [enumerated[node.variant].description for node in nodes[key]],
+          [node.description for node in nodes[key]])
+
+# a cycle that does not settle stops at the pass limit
+config = create_config()
+config['tolerance'] = 0.0
+config['max-passes'] = 5
+check('EE.T passes without a tolerance', graph.solve_cycle(config, config['components'][position['EE.T']]), 5)
+
+print('{} failures'.format(failures))
+sys.exit(1 if failures > 0 else 0)
@@ -0,0 +1,64 @@
+#!/usr/bin/python3
+""" test driver for market depth
+Checks the units sellable at the quoted price, the sell-through observed from the units a
+value stream produces and consumes, and the output value of a ledger at that sell-through
+"""
+
+import sys
+from market import Market
+from marketdepth import MarketDepth
+from ledger import Ledger
+
+MARKET = Market({
+    'IC1': {'currency': 'ICA', 'prices': {
+        'DW': {'last': 10.0, 'ask': 11.0, 'bid': 9.0, 'avg': 10.0, 'supply': 200, 'demand': 80},
+        'RAT': {'last': 20.0, 'ask': 21.0, 'bid': 19.0, 'avg': 20.0, 'supply': 200, 'demand': 500},
+        'H2O': {'last': 4.0, 'ask': 4.0, 'bid': 4.0, 'avg': 4.0, 'supply': 200, 'demand': None}
+    }}
+})
+
+failures = 0
+
+def check(label, actual, expected):
+    global failures
+    result = 'ok'
+    if abs(actual - expected) > 1e-6:
+        result = 'FAIL'
+        failures = failures + 1
+    print('{:<44} {:>10.4f} {:>10.4f} {}'.format(label, actual, expected, result))
+
+print('{:<44} {:>10} {:>10}'.format('check', 'actual', 'expected'))
+
+# the depth is the quoted demand renewed by the turnover each day
+depth = MarketDepth(MARKET, turnover=1.0, impact=1.0)
+check('DW depth/day', depth.depth('DW'), 80.0)
+check('H2O depth/day without demand', depth.depth('H2O'), 0.0)
+check('half turnover DW depth/day', MarketDepth(MARKET, turnover=0.5).depth('DW'), 40.0)
+
+# units beyond the depth take a linear price impact until nothing more sells
+check('DW sellable 60 of 60', depth.sellable('DW', 60.0), 60.0)
+check('DW sellable of 100', depth.sellable('DW', 100.0), 80.0 + 20.0 - 20.0 * 20.0 / 160.0)
+check('DW sellable of 1000', depth.sellable('DW', 1000.0), 80.0 + 80.0 - 80.0 * 80.0 / 160.0)
+check('DW sellable of 1000 without impact', MarketDepth(MARKET, impact=0.0).sellable('DW', 1000.0), 1000.0)
+
+# only the surplus over what the stream consumes itself is sold
+depth.observe({'DW': 150.0, 'RAT': 100.0}, {'DW': 50.0})
+check('DW sold/day', depth.sold['DW'], 100.0)
+check('DW sell-through', depth.sell_through('DW'), 1.0 - (100.0 - 97.5) / 150.0)
+check('RAT sell-through within depth', depth.sell_through('RAT'), 1.0)
+check('H2O sell-through not produced', depth.sell_through('H2O'), 1.0)
+depth.observe({'DW': 50.0}, {})
+check('DW sell-through observed again', depth.sell_through('DW'), 1.0)
+
+# outputs are valued at the sell-through, inputs at the full price
+depth.observe({'DW': 150.0}, {'DW': 50.0})
+ledger = Ledger('test', 'DEPTH', None, None, MARKET, None, depth)
+ledger.add_minute(0, Ledger.OUTPUT, 'produced', product='DW', count=150.0)
+ledger.add_minute(0, Ledger.INPUT, 'consumed', product='DW', count=50.0)
+ledger.add_span(0, 1439, Ledger.STATUS, 'producing', state=Ledger.ACTIVE)
+summary = ledger.summarize_ledger()
+check('DW production value (avg)', summary['total_production_value'].avg, 1500.0 * depth.sell_through('DW'))
+check('DW production cost (avg)', summary['total_production_cost'].avg, -500.0)
+
+print('{} failures'.format(failures))
+sys.exit(1 if failures > 0 else 0)
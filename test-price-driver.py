@@ -17,4 +17,14 @@ print(price2)
 print(price1.multiply(3.0))
 print(price2.multiply(5.0))
 
-print(price1.add(price2))
\ No newline at end of file
+print(price1.add(price2))
+from market import Market
+from inventory import Inventory
+
+market = Market({'IC1': {'currency': 'ICA', 'prices': {
+    'H2O': {'last': 40.0, 'ask': 42.0, 'bid': None, 'avg': 40.0, 'supply': 1000, 'demand': 1000},
+    'SF': {'last': 20.0, 'ask': 21.0, 'bid': 19.0, 'avg': 20.0, 'supply': 500, 'demand': 500}}}})
+inventory = Inventory({'H2O': 10.0, 'SF': 3.0, 'SF.IC1': 2.0})
+
+print(market.value(inventory.items)['total'])
+print(inventory.value(market))
@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+""" test driver for price curves
+Builds synthetic and history curves over a small market and checks the price in effect at
+minutes around each step and the value of ledger entries made along the curve
+"""
+
+import os
+import sys
+import tempfile
+from clock import MINUTES_PER_DAY
+from market import Market
+from pricehistory import PriceHistory
+from pricecurve import PriceCurve
+from ledger import Ledger
+
+def exchange(h2o_avg, sf_avg):
+    return {'IC1': {'code': 'IC1', 'currency': 'ICA', 'prices': {
+        'H2O': {'last': h2o_avg, 'ask': h2o_avg, 'bid': h2o_avg, 'avg': h2o_avg, 'supply': 1000, 'demand': 1000},
+        'SF': {'last': sf_avg, 'ask': sf_avg, 'bid': sf_avg, 'avg': sf_avg, 'supply': 500, 'demand': 500}
+    }}}
+
+MARKET = Market(exchange(40.0, 20.0))
+
+failures = 0
+
+def check(label, actual, expected):
+    global failures
+    result = 'ok'
+    if abs(actual - expected) > 1e-6:
+        result = 'FAIL'
+        failures = failures + 1
+    print('{:<44} {:>10.2f} {:>10.2f} {}'.format(label, actual, expected, result))
+
+print('{:<44} {:>10} {:>10}'.format('check', 'actual', 'expected'))
+
+# synthetic factors step the market price from the start of each listed day
+curve = PriceCurve.from_factors(MARKET, {'SF': [[2, 1.5], [1, 0.5]]})
+check('factors: SF at minute 0', curve.price('SF', 0).avg, 20.0)
+check('factors: SF at the end of day 0', curve.price('SF', MINUTES_PER_DAY - 1).avg, 20.0)
+check('factors: SF at the start of day 1', curve.price('SF', MINUTES_PER_DAY).avg, 10.0)
+check('factors: SF on day 2', curve.price('SF', 2 * MINUTES_PER_DAY + 30).avg, 30.0)
+check('factors: SF on day 9', curve.price('SF', 9 * MINUTES_PER_DAY).avg, 30.0)
+check('factors: H2O without a curve', curve.price('H2O', MINUTES_PER_DAY).avg, 40.0)
+
+# history quotes take effect on their day of the run, earlier quotes from minute 0
+with tempfile.TemporaryDirectory() as scratch:
+    history = PriceHistory(os.path.join(scratch, 'prices.hist'))
+    history.add_exchanges('2020-05-06', exchange(36.0, 16.0))
+    history.add_exchanges('2020-05-08', exchange(40.0, 20.0))
+    history.add_exchanges('2020-05-11', exchange(46.0, 26.0))
+    curve = PriceCurve.from_history(history, MARKET, '2020-05-08')
+check('history: H2O at minute 0', curve.price('H2O', 0).avg, 40.0)
+check('history: H2O on day 2', curve.price('H2O', 3 * MINUTES_PER_DAY - 1).avg, 40.0)
+check('history: H2O on day 3', curve.price('H2O', 3 * MINUTES_PER_DAY).avg, 46.0)
+check('history: SF on day 5', curve.price('SF', 5 * MINUTES_PER_DAY).avg, 26.0)
+
+# ledger entries are valued at the curve price of their minute
+ledger = Ledger('test', 'CURVE', None, None, MARKET, curve)
+ledger.add_minute(0, Ledger.OUTPUT, 'produced', product='SF', count=10.0)
+ledger.add_minute(4 * MINUTES_PER_DAY, Ledger.OUTPUT, 'produced', product='SF', count=10.0)
+ledger.add_minute(4 * MINUTES_PER_DAY, Ledger.INPUT, 'consumed', product='H2O', count=5.0)
+check('ledger: SF produced', ledger.totals[(Ledger.OUTPUT, 'SF')], 20.0)
+check('ledger: SF output value', ledger.valued[(Ledger.OUTPUT, 'SF')].avg, 10 * 20.0 + 10 * 26.0)
+check('ledger: H2O input value', ledger.valued[(Ledger.INPUT, 'H2O')].avg, 5 * 46.0)
+
+print('{} failures'.format(failures))
+sys.exit(1 if failures > 0 else 0)
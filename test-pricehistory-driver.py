@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+""" test driver for the price history
+Appends dated exchange data to a history file in a scratch directory, reloads it and checks
+the file layout, the quotes in effect on each date and the averages over a range of dates
+"""
+
+import os
+import sys
+import tempfile
+from pricehistory import PriceHistory
+
+def exchange(h2o_ask, sf_avg):
+    return {'IC1': {'code': 'IC1', 'currency': 'ICA', 'prices': {
+        'H2O': {'last': 40.0, 'ask': h2o_ask, 'bid': 38.0, 'avg': 40.0, 'supply': 1000, 'demand': None},
+        'SF': {'last': sf_avg, 'ask': sf_avg, 'bid': sf_avg, 'avg': sf_avg, 'supply': 500, 'demand': 500}
+    }}}
+
+failures = 0
+
+def check(label, actual, expected):
+    global failures
+    result = 'ok'
+    if actual != expected:
+        result = 'FAIL'
+        failures = failures + 1
+    print('{:<44} {:>14} {:>14} {}'.format(label, str(actual), str(expected), result))
+
+def raises(call):
+    try:
+        call()
+    except Exception:
+        return True
+    return False
+
+print('{:<44} {:>14} {:>14}'.format('check', 'actual', 'expected'))
+with tempfile.TemporaryDirectory() as scratch:
+    path = os.path.join(scratch, 'prices.hist')
+
+    # an empty file, as left by touch, is started like a new one
+    open(path, 'wb').close()
+    history = PriceHistory(path)
+    check('rows added 2020-05-10', history.add_exchanges('2020-05-10', exchange(44.0, 30.0)), 2)
+    check('rows added 2020-05-08', history.add_exchanges('2020-05-08', exchange(42.0, 20.0)), 2)
+    check('rows added 2020-05-08 again', history.add_exchanges('2020-05-08', exchange(99.0, 99.0)), 0)
+    check('file size', os.path.getsize(path), len(PriceHistory.MAGIC) + 4 * PriceHistory.ROW.size)
+    with open(path, 'rb') as infile:
+        check('file magic', infile.read(len(PriceHistory.MAGIC)), PriceHistory.MAGIC)
+
+    # names longer than a row holds are refused before anything is written
+    long_name = exchange(1.0, 1.0)
+    long_name['IC1']['prices']['LONGTICKER'] = long_name['IC1']['prices']['H2O']
+    check('long ticker refused', raises(lambda: history.add_exchanges('2020-05-11', long_name)), True)
+    check('file size after refusal', os.path.getsize(path), len(PriceHistory.MAGIC) + 4 * PriceHistory.ROW.size)
+
+    # the reloaded history holds the same quotes in date order
+    history = PriceHistory(path)
+    check('rows loaded', len(history), 4)
+    check('dates', history.dates(), ['2020-05-08', '2020-05-10'])
+    series = history.series('H2O', 'IC1')
+    check('H2O ask series', [pricedata['ask'] for day, pricedata in series], [42.0, 44.0])
+    check('H2O missing demand', series[0][1]['demand'], None)
+    check('H2O ask 2020-05-09 to 2020-05-10', [pricedata['ask'] for day, pricedata in
+                                               history.series('H2O', 'IC1', '2020-05-09', '2020-05-10')], [44.0])
+
+    # the quote in effect is the latest on or before the date
+    check('SF avg as of 2020-05-08', history.market('2020-05-08').price('SF').avg, 20.0)
+    check('SF avg as of 2020-05-09', history.market('2020-05-09').price('SF').avg, 20.0)
+    check('SF avg as of 2020-05-10', history.market('2020-05-10').price('SF').avg, 30.0)
+    check('SF avg averaged 2020-05-08..10', history.market('2020-05-10', start='2020-05-08').price('SF').avg, 25.0)
+    check('H2O avg quoted in ICA', history.market('2020-05-10', 'ICA').price('H2O.ICA').avg, 40.0)
+    check('no prices before 2020-05-08', raises(lambda: history.market('2020-05-07')), True)
+
+    # a file cut short is refused rather than misread
+    with open(path, 'ab') as outfile:
+        outfile.write(b'\0' * 10)
+    check('truncated file refused', raises(lambda: PriceHistory(path)), True)
+
+print('{} failures'.format(failures))
+sys.exit(1 if failures > 0 else 0)
@@ -0,0 +1,112 @@
+#!/usr/bin/python3
+""" test driver for procurement rules
+Runs reorder-point and scheduled rules over a small market, drawing the stock down between
+checks, and checks the units bought, the buys refused over a budget and the cost and capital
+"""
+
+import sys
+import heapq
+from clock import Duration, IncrClock, MINUTES_PER_DAY
+from market import Market
+from inventory import SiteInventories
+from pricecurve import PriceCurve
+from purchasing import Purchasing
+from procurement import Procurement
+
+MARKET = Market({
+    'IC1': {'currency': 'ICA', 'prices': {
+        'H2O': {'last': 40.0, 'ask': 42.0, 'bid': 38.0, 'avg': 40.0, 'supply': 1000, 'demand': 1000},
+        'RAT': {'last': 20.0, 'ask': 21.0, 'bid': 19.0, 'avg': 20.0, 'supply': 500, 'demand': 500}
+    }}
+})
+
+failures = 0
+
+def check(label, actual, expected):
+    global failures
+    result = 'ok'
+    if abs(actual - expected) > 1e-6:
+        result = 'FAIL'
+        failures = failures + 1
+    print('{:<44} {:>10.2f} {:>10.2f} {}'.format(label, actual, expected, result))
+
+def raises(call):
+    try:
+        call()
+    except Exception:
+        return True
+    return False
+
+class Run(object):
+    """ the procurement of a site's rules, stepped through its check events """
+
+    def __init__(self, stock, rules, purchasing=None, curve=None):
+        self.inventories = SiteInventories({'A': stock})
+        self.procurement = Procurement('test', rules, {'inventory': self.inventories, 'market': MARKET,
+                                       'purchasing': purchasing, 'price-curve': curve}, [])
+        self.clock = IncrClock(Duration('30:00:00:00'))
+        self.events = []
+        for event in self.procurement.initial_events():
+            heapq.heappush(self.events, event)
+
+    def until(self, minute):
+        """ processes the checks before the minute """
+        while len(self.events) > 0 and self.events[0][0] < minute:
+            event_minute, event_type, num = heapq.heappop(self.events)
+            self.clock.jump_to(event_minute)
+            for event in self.procurement.process_event(self.clock, event_type, num)['events']:
+                heapq.heappush(self.events, event)
+
+    def draw(self, ticker, count):
+        self.inventories.site('A').remove(ticker, count)
+
+print('{:<44} {:>10} {:>10}'.format('check', 'actual', 'expected'))
+
+# a reorder rule tops the stock up to its order level when a check finds it below the reorder point
+run = Run({'H2O': 10}, [{'site': 'A', 'ticker': 'H2O', 'reorder-point': 20, 'order-up-to': 100}])
+run.until(1)
+check('reorder: H2O held after the first check', run.inventories.balance('A', 'H2O'), 100.0)
+run.draw('H2O', 70)
+run.until(MINUTES_PER_DAY + 1)
+check('reorder: H2O held above the reorder point', run.inventories.balance('A', 'H2O'), 30.0)
+run.draw('H2O', 15)
+run.until(2 * MINUTES_PER_DAY + 1)
+rule = run.procurement.rules[0]
+check('reorder: H2O held after the second buy', run.inventories.balance('A', 'H2O'), 100.0)
+check('reorder: buys', rule['buys'], 2)
+check('reorder: bought', rule['count'], 90.0 + 85.0)
+check('reorder: cost (avg)', rule['cost'].avg, (90.0 + 85.0) * 40.0)
+check('reorder: peak capital', rule['peak-capital'], 100.0 * 40.0)
+
+# a scheduled rule buys its count on every interval, from minute 0
+run = Run({}, [{'site': 'A', 'ticker': 'RAT', 'every': '2:00:00:00', 'count': 25}])
+run.until(5 * MINUTES_PER_DAY)
+check('scheduled: RAT held after 5 days', run.inventories.balance('A', 'RAT'), 75.0)
+check('scheduled: buys', run.procurement.rules[0]['buys'], 3)
+
+# through the purchasing a buy is charged its slipped cost, and refused over the day's budget
+purchasing = Purchasing(MARKET, budget=2000.0)
+run = Run({}, [{'site': 'A', 'ticker': 'RAT', 'every': '1:00:00:00', 'count': 50},
+               {'site': 'A', 'ticker': 'H2O', 'every': '1:00:00:00', 'count': 50}], purchasing)
+run.until(1)
+check('budget: RAT held', run.inventories.balance('A', 'RAT'), 50.0)
+check('budget: RAT cost (avg)', run.procurement.rules[0]['cost'].avg, purchasing.cost('RAT', 50))
+check('budget: H2O refused', run.procurement.rules[1]['refused'], 1)
+check('budget: H2O held', run.inventories.balance('A', 'H2O'), 0.0)
+
+# capital is valued at the price curve of the check
+curve = PriceCurve.from_factors(MARKET, {'H2O': [[1, 2.0]]})
+run = Run({'H2O': 50}, [{'site': 'A', 'ticker': 'H2O', 'reorder-point': 20, 'order-up-to': 100}], None, curve)
+run.until(MINUTES_PER_DAY + 1)
+rule = run.procurement.rules[0]
+check('curve: capital on day 0 and day 1', rule['capital'], 50.0 * 40.0 + 50.0 * 80.0)
+check('curve: peak capital', rule['peak-capital'], 50.0 * 80.0)
+
+# levels are given in units or in days of burn
+check('level in units', Procurement.level({'count': 12}, 'count', 'order-days', 5.0), 12.0)
+check('level in days of burn', Procurement.level({'order-days': 3}, 'count', 'order-days', 5.0), 15.0)
+check('order level below reorder point refused', raises(lambda: Run({}, [{'site': 'A', 'ticker': 'H2O',
+      'reorder-point': 50, 'order-up-to': 10}])), True)
+
+print('{} failures'.format(failures))
+sys.exit(1 if failures > 0 else 0)
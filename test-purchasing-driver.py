@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+""" test driver for market purchases
+Buys against the modeled order book of a small market and checks the slipped cost of each
+buy, the daily budget, the price curve in effect on the day and the bulk buys written out
+"""
+
+import sys
+from clock import Duration, IncrClock, MINUTES_PER_DAY
+from market import Market
+from pricecurve import PriceCurve
+from purchasing import Purchasing
+from ledger import Ledger
+
+MARKET = Market({
+    'IC1': {'currency': 'ICA', 'prices': {
+        'H2O': {'last': 40.0, 'ask': 42.0, 'bid': 38.0, 'avg': 40.0, 'supply': 1000, 'demand': 1000},
+        'SF': {'last': 20.0, 'ask': None, 'bid': 19.0, 'avg': 20.0, 'supply': None, 'demand': 500}
+    }}
+})
+
+failures = 0
+
+def check(label, actual, expected):
+    global failures
+    result = 'ok'
+    if abs(actual - expected) > 1e-6:
+        result = 'FAIL'
+        failures = failures + 1
+    print('{:<44} {:>10.2f} {:>10.2f} {}'.format(label, actual, expected, result))
+
+def slipped(ask, units, supply, slippage=1.0):
+    """ the cost of the day's units, the ask rising by the slippage for each supply's worth bought """
+    return ask * units * (1.0 + slippage * units / (2.0 * supply))
+
+def buy(purchasing, ledger, clock, minute, product, count):
+    clock.jump_to(minute)
+    return purchasing.buy(clock, ledger, Ledger.PURCHASE_INPUT, product, count, count, 0.0,
+                          line=ledger.line_id, bnum=0)
+
+print('{:<44} {:>10} {:>10}'.format('check', 'actual', 'expected'))
+clock = IncrClock(Duration('10:00:00:00'))
+
+# each buy pays for its units on top of the day's volume so far
+purchasing = Purchasing(MARKET, budget=10000.0)
+ledger = Ledger('test', 'BUYER', None, None, MARKET)
+check('first 100 H2O bought', buy(purchasing, ledger, clock, 60, 'H2O', 100), True)
+check('first 100 H2O cost', purchasing.last_cost, slipped(42.0, 100, 1000))
+check('second 100 H2O bought', buy(purchasing, ledger, clock, 120, 'H2O', 100), True)
+check('second 100 H2O cost', purchasing.last_cost, slipped(42.0, 200, 1000) - slipped(42.0, 100, 1000))
+
+# a buy taking the day over the budget is refused, the next day starts afresh
+check('third 100 H2O over the budget', buy(purchasing, ledger, clock, 180, 'H2O', 100), False)
+check('refused', purchasing.refused, 1)
+check('spent on day 0', purchasing.spent, slipped(42.0, 200, 1000))
+check('100 H2O on day 1', buy(purchasing, ledger, clock, MINUTES_PER_DAY + 60, 'H2O', 100), True)
+check('100 H2O cost on day 1', purchasing.last_cost, slipped(42.0, 100, 1000))
+
+# without an ask or a supply the average price is paid over a depth of one unit
+check('2 SF bought', buy(purchasing, ledger, clock, MINUTES_PER_DAY + 90, 'SF', 2), True)
+check('2 SF cost', purchasing.last_cost, slipped(20.0, 2, 1))
+
+# the buys of a day are written to the ledger as one bulk buy per product, at the cost paid
+purchasing.flush()
+bulk = [entry for entry in ledger.entries if entry['type'] == Ledger.PURCHASE_INPUT]
+check('bulk buys', purchasing.bulk_buys, 3)
+check('day 0 bulk H2O count', bulk[0]['count'], 200.0)
+check('H2O bought', ledger.totals[(Ledger.PURCHASE_INPUT, 'H2O')], 300.0)
+check('H2O purchase value (avg)', ledger.valued[(Ledger.PURCHASE_INPUT, 'H2O')].avg,
+      slipped(42.0, 200, 1000) + slipped(42.0, 100, 1000))
+check('total spent', purchasing.total_spent, slipped(42.0, 200, 1000) + slipped(42.0, 100, 1000) + slipped(20.0, 2, 1))
+
+# with a price curve the ask in effect on the day of the buy is paid
+curve = PriceCurve.from_factors(MARKET, {'H2O': [[2, 2.0]]})
+purchasing = Purchasing(MARKET, slippage=0.5, curve=curve)
+buy(purchasing, ledger, clock, MINUTES_PER_DAY, 'H2O', 100)
+check('100 H2O on day 1 at the curve', purchasing.last_cost, slipped(42.0, 100, 1000, 0.5))
+buy(purchasing, ledger, clock, 2 * MINUTES_PER_DAY, 'H2O', 100)
+check('100 H2O on day 2 at the curve', purchasing.last_cost, slipped(84.0, 100, 1000, 0.5))
+
+print('{} failures'.format(failures))
+sys.exit(1 if failures > 0 else 0)
@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+""" test driver for shipping between site inventories
+Runs shipment rules over a small market and checks the counts held at each site, the fuel
+burnt and its cost after each scenario
+"""
+
+import sys
+import heapq
+from clock import Duration, IncrClock
+from market import Market
+from inventory import SiteInventories
+from shipping import Shipping
+from ledger import Ledger
+
+MARKET = Market({
+    'IC1': {'currency': 'ICA', 'prices': {
+        'H2O': {'last': 40.0, 'ask': 42.0, 'bid': 38.0, 'avg': 40.0, 'supply': 1000, 'demand': 1000},
+        'SF': {'last': 20.0, 'ask': 21.0, 'bid': 19.0, 'avg': 20.0, 'supply': 500, 'demand': 500}
+    }}
+})
+
+failures = 0
+
+def check(label, actual, expected):
+    global failures
+    result = 'ok'
+    if abs(actual - expected) > 1e-6:
+        result = 'FAIL'
+        failures = failures + 1
+    print('{:<44} {:>10.2f} {:>10.2f} {}'.format(label, actual, expected, result))
+
+def ship(inventories, rules, duration, strategy='default'):
+    """ runs the shipment rules for the duration, returning the shipping and the site inventories """
+    inventories = SiteInventories(inventories)
+    shipping = Shipping('test', rules, {'inventory': inventories, 'market': MARKET, 'sourcing-strategy': strategy})
+    clock = IncrClock(Duration(duration))
+    events = []
+    for event in shipping.initial_events():
+        heapq.heappush(events, event)
+    while len(events) > 0 and events[0][0] < clock.duration.to_minutes():
+        minute, event_type, num = heapq.heappop(events)
+        clock.jump_to(minute)
+        for event in shipping.process_event(clock, event_type, num)['events']:
+            heapq.heappush(events, event)
+    return shipping, inventories
+
+print('{:<44} {:>10} {:>10}'.format('check', 'actual', 'expected'))
+
+# a rule shipping its own fuel holds the fuel back from the surplus
+shipping, sites = ship({'A': {'H2O': 100}, 'B': {'H2O': 0}},
+    [{'from': 'A', 'to': 'B', 'ticker': 'H2O', 'above': 0, 'transit': '0:01:00:00', 'fuel': {'H2O': 10}}], '1:12:00:00')
+check('own fuel: H2O held at A', sites.balance('A', 'H2O'), 0.0)
+check('own fuel: H2O delivered to B', sites.balance('B', 'H2O'), 90.0)
+check('own fuel: fuel cost (avg)', shipping.rules[0]['fuel-cost'].avg, 10 * 40.0)
+
+# the surplus above the threshold ships, fuel is drawn from the source, delivery after transit
+rule = {'from': 'A', 'to': 'B', 'ticker': 'H2O', 'above': 30, 'transit': '1:00:00:00', 'fuel': {'SF': 10}}
+shipping, sites = ship({'A': {'H2O': 100, 'SF': 50}, 'B': {'H2O': 0}}, [rule], '1:12:00:00')
+check('in transit: H2O held at A', sites.balance('A', 'H2O'), 30.0)
+check('in transit: SF held at A', sites.balance('A', 'SF'), 40.0)
+check('in transit: H2O delivered to B', sites.balance('B', 'H2O'), 0.0)
+check('in transit: shipments in flight', len(shipping.in_flight), 1)
+shipping, sites = ship({'A': {'H2O': 100, 'SF': 50}, 'B': {'H2O': 0}}, [rule], '2:12:00:00')
+check('delivered: H2O delivered to B', sites.balance('B', 'H2O'), 70.0)
+check('delivered: shipments', shipping.rules[0]['shipments'], 1)
+check('delivered: fuel cost (avg)', shipping.rules[0]['fuel-cost'].avg, 10 * 20.0)
+
+# max-count caps each shipment, min-count stops the last small one
+rule = {'from': 'A', 'to': 'B', 'ticker': 'H2O', 'above': 0, 'transit': '0:01:00:00',
+        'max-count': 40, 'min-count': 25, 'fuel': {'SF': 1}}
+shipping, sites = ship({'A': {'H2O': 100, 'SF': 50}, 'B': {'H2O': 0}}, [rule], '5:00:00:00')
+check('capped: shipments', shipping.rules[0]['shipments'], 2)
+check('capped: H2O delivered to B', sites.balance('B', 'H2O'), 80.0)
+check('capped: H2O held at A', sites.balance('A', 'H2O'), 20.0)
+check('capped: SF held at A', sites.balance('A', 'SF'), 48.0)
+
+# without the fuel nothing ships under the default strategy, the market strategy buys it
+rule = {'from': 'A', 'to': 'B', 'ticker': 'H2O', 'above': 0, 'transit': '0:01:00:00', 'fuel': {'SF': 10}}
+shipping, sites = ship({'A': {'H2O': 100, 'SF': 4}, 'B': {'H2O': 0}}, [rule], '1:12:00:00')
+missing = [entry for entry in shipping.ledger.entries if entry['type'] == Ledger.MISSING_INPUT]
+check('no fuel: H2O held at A', sites.balance('A', 'H2O'), 100.0)
+check('no fuel: SF held at A', sites.balance('A', 'SF'), 4.0)
+check('no fuel: missing fuel logged', len(missing), 1)
+shipping, sites = ship({'A': {'H2O': 100, 'SF': 4}, 'B': {'H2O': 0}}, [rule], '1:12:00:00', strategy='market')
+check('bought fuel: H2O delivered to B', sites.balance('B', 'H2O'), 100.0)
+check('bought fuel: SF held at A', sites.balance('A', 'SF'), 0.0)
+check('bought fuel: SF purchased', shipping.ledger.totals.get((Ledger.PURCHASE_INPUT, 'SF'), 0.0), 6.0)
+
+print('{} failures'.format(failures))
+sys.exit(1 if failures > 0 else 0)
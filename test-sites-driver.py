@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+""" test driver for site partitioned inventories
+usage: test-sites-driver.py <run-file> <date>
+Runs a rig at a stocked site next to a food processor at a site that starts with an empty
+inventory, under the default strategies, and checks each site only draws on its own stock
+"""
+
+import os
+import sys
+from datetime import datetime
+from valuestream import ValueStream
+from inventory import SiteInventories
+from runconfig import DataCache, load_run_config
+from configuration import load_yamlfile
+from ledger import Ledger
+
+STOCKED = 'Promitor'
+EMPTY = 'Montem'
+
+RIG = {'line-id': 'RIG.1', 'line-type': 'RIG', 'site-name': STOCKED, 'buildingCount': 2,
+       'queue': [{'recipe': 'H2O.1', 'count': 10}]}
+FP = {'line-id': 'FP.1', 'line-type': 'FP', 'site-name': EMPTY, 'buildingCount': 1,
+      'queue': [{'recipe': 'DW.2', 'count': 4}]}
+SUPPLIES = {'DW': 500.0, 'RAT': 500.0, 'OVE': 100.0, 'COF': 100.0, 'PWO': 100.0}
+
+failures = 0
+
+def check(label, actual, expected):
+    global failures
+    result = 'ok'
+    if abs(actual - expected) > 1e-6:
+        result = 'FAIL'
+        failures = failures + 1
+    print('{:<40} {:>12.2f} {:>12.2f} {}'.format(label, actual, expected, result))
+
+def run_stream(lines, inventories):
+    """ runs the lines for the run file's duration, returning the value stream, its lines and the start inventory """
+    run = dict(load_yamlfile(sys.argv[1]), output=os.devnull)
+    run.pop('snapshot-interval', None)
+    config = load_run_config(run, sys.argv[2], datetime.now(), DataCache(), verbose=False)
+    for strategy in ['sourcing-strategy', 'essentials-strategy', 'non-essentials-strategy']:
+        config[strategy] = 'default'
+    config['valstream'] = {'description': 'sites', 'productionLines': lines}
+    config['inventory'] = SiteInventories(inventories)
+    valuestream = ValueStream(config)
+    start = config['inventory'].snapshot()
+    stream_lines = valuestream._init_lines(config['valstream'])
+    valuestream._run_events(stream_lines)
+    return config['inventory'], stream_lines, start
+
+def produced(lines, product):
+    return sum(line.ledger.totals.get((Ledger.OUTPUT, product), 0.0) for line in lines)
+
+# the rig on its own, with the stocked site alone in the inventory
+alone, alone_lines, alone_start = run_stream([RIG], {STOCKED: dict(SUPPLIES)})
+
+# the rig with a processor at a site holding nothing at all
+both, both_lines, both_start = run_stream([RIG, FP], {STOCKED: dict(SUPPLIES)})
+
+print('{:<40} {:>12} {:>12}'.format('check', 'actual', 'expected'))
+check('H2O produced at {}'.format(STOCKED), produced(both_lines[:1], 'H2O'), produced(alone_lines, 'H2O'))
+check('H2O held at {}'.format(STOCKED), both.balance(STOCKED, 'H2O'), alone.balance(STOCKED, 'H2O'))
+check('DW drawn at {}'.format(STOCKED), both.balance(STOCKED, 'DW'), alone.balance(STOCKED, 'DW'))
+check('DW produced at {}'.format(EMPTY), produced(both_lines[1:], 'DW'), 0.0)
+check('H2O held at {}'.format(EMPTY), both.balance(EMPTY, 'H2O'), 0.0)
+for product in sorted(SUPPLIES.keys()):
+    check('{} held at {}'.format(product, EMPTY), both.balance(EMPTY, product), 0.0)
+missing = [entry for entry in both_lines[1].ledger.entries
+           if entry['type'] == Ledger.MISSING_SUPPLY and entry['ticker'] == 'DW']
+check('DW supply missing at {} (> 0)'.format(EMPTY), float(len(missing) > 0), 1.0)
+
+# diffing against the start snapshot must not add the empty site to it
+net = both.diff(both_start)
+check('sites in the start snapshot', len(both_start.site_names()), 1)
+check('H2O net at {}'.format(STOCKED), net.balance(STOCKED, 'H2O'), both.balance(STOCKED, 'H2O'))
+
+print('{} failures'.format(failures))
+sys.exit(1 if failures > 0 else 0)
@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+""" test driver cross-checking the steady state against the full simulation
+usage: test-steadystate-driver.py <run-file> <date>
+Inputs and supplies are sourced from the market so no line starves, and each per day
+rate must agree within the batches a line can have in flight when the run ends
+"""
+
+import os
+import sys
+from datetime import datetime
+from valuestream import ValueStream
+from steadystate import SteadyState
+from runconfig import DataCache, load_run_config
+from configuration import Buildings, Recipes, Workers, load_yamlfile
+from productionline import calc_worker_needs
+from ledger import Ledger
+
+run = dict(load_yamlfile(sys.argv[1]), output=os.devnull)
+run.pop('snapshot-interval', None)
+config = load_run_config(run, sys.argv[2], datetime.now(), DataCache(), verbose=False)
+for strategy in ['sourcing-strategy', 'essentials-strategy', 'non-essentials-strategy']:
+    config[strategy] = 'market'
+
+state = SteadyState(config).evaluate()
+
+valuestream = ValueStream(config)
+lines = valuestream._init_lines(config['valstream'])
+valuestream._run_events(lines)
+ledger = Ledger(valuestream.stream_id, 'RUN.TOTALS', None, None, config['market'])
+for line in lines:
+    ledger.add_ledger(line.ledger)
+days = config['duration'].to_days()
+
+# slack: a building can finish the run with one queue entry consumed but not produced,
+# or one entry short, and the supplies of one more worker cycle are consumed at the start
+slack = {}
+for line_spec in config['valstream']['productionLines']:
+    for item in line_spec['queue']:
+        recipe = Recipes[item['recipe']]
+        for material in recipe['outputs'] + recipe['inputs']:
+            amount = material['count'] * item['count'] * line_spec['buildingCount']
+            slack[material['id']] = slack.get(material['id'], 0.0) + amount
+    for need in Buildings[line_spec['line-type']]['workers']:
+        worker = Workers[line_spec['site-name']][need['type']]
+        for supply in calc_worker_needs(worker, need['count'] * line_spec['buildingCount']):
+            slack[supply['id']] = slack.get(supply['id'], 0.0) + supply['amount']
+
+failures = 0
+simulated = {}
+for (itemtype, product), count in ledger.totals.items():
+    if itemtype in [Ledger.OUTPUT, Ledger.INPUT]:
+        simulated[(itemtype, product)] = count
+
+steady = {}
+for product, count in state['outputs'].items.items():
+    steady[(Ledger.OUTPUT, product)] = count
+for product, count in list(state['inputs'].items.items()) + list(state['supplies'].items.items()):
+    steady[(Ledger.INPUT, product)] = steady.get((Ledger.INPUT, product), 0.0) + count
+
+print('{:<8} {:<6} {:>12} {:>12} {:>12}'.format('type', 'item', 'simulated', 'steady', 'allowed'))
+for key in sorted(set(simulated.keys()) | set(steady.keys())):
+    itemtype, product = key
+    sim_rate = simulated.get(key, 0.0) / days
+    steady_rate = steady.get(key, 0.0)
+    allowed = slack.get(product, 0.0) / days + 1e-6
+    result = 'ok'
+    if abs(sim_rate - steady_rate) > allowed:
+        result = 'FAIL'
+        failures = failures + 1
+    print('{:<8} {:<6} {:>12.2f} {:>12.2f} {:>12.2f} {}'.format(itemtype, product, sim_rate, steady_rate, allowed, result))
+
+print('net/day simulated {:.2f} steady {:.2f}'.format(ledger.metrics()['net'] / days, state['net'].avg))
+print('{} failures'.format(failures))
+sys.exit(1 if failures > 0 else 0)
@@ -2,12 +2,15 @@
 """
 
 import json
+import heapq
 from datetime import datetime
-from clock import IncrClock
-from inventory import Inventory
+from clock import IncrClock, MINUTES_PER_DAY
 from productionline import ProductionLine
-from market import Price
+from market import PriceAccumulator
 from ledger import Ledger
+from steadystate import SteadyState
+from shipping import Shipping
+from procurement import Procurement
 
 class ValueStream(object):
     """ ValueStream class
@@ -25,6 +28,10 @@ class ValueStream(object):
         self.duration = config['duration']
         self.clock = IncrClock(config['duration'])
         self.streamconfig = config['valstream']
+        self.snapshot_interval = config.get('snapshot-interval')
+        self.snapshotfile = config.get('snapshotfile')
+        self.shipping = None
+        self.procurement = None
 
     def _init_lines(self, streamconfig):
         lines = []
@@ -33,10 +40,24 @@ class ValueStream(object):
             lines.append(pline)
         return lines
 
+    def _init_shipping(self, streamconfig):
+        """ the shipping between sites, None when the value stream has no shipment rules """
+        if len(streamconfig.get('shipments', [])) == 0:
+            return None
+        return Shipping(self.stream_id, streamconfig['shipments'], self.config)
+
+    def _init_procurement(self, streamconfig, lines):
+        """ the procurement of supplies, None when the value stream has no procurement rules """
+        if len(streamconfig.get('procurement', [])) == 0:
+            return None
+        return Procurement(self.stream_id, streamconfig['procurement'], self.config, lines)
+
     def run(self):
-        """ runs the value stream simulation """
-        start_inv = Inventory(json.loads(str(self.inventory)))
+        """ runs the value stream simulation, returning the run summary """
+        start_inv = self.inventory.snapshot()
         lines = self._init_lines(self.streamconfig)
+        self.shipping = self._init_shipping(self.streamconfig)
+        self.procurement = self._init_procurement(self.streamconfig, lines)
 
         print("", file=self.outfile)
         print('{} value stream {} run started'
@@ -44,16 +65,154 @@ class ValueStream(object):
         print('{} description "{}"'
               .format(self.clock, self.streamconfig['description']), file=self.outfile)
 
-        while self.clock.step():
-            for line in lines:
-                line.step(self.clock)
-        for line in lines:
-            line.step(self.clock)
+        self._run_events(lines)
+        self._observe_depth(lines)
 
         print('{} value stream {} run complete'
               .format(self.clock, self.stream_id), file=self.outfile)
-        end_inv = Inventory(json.loads(str(self.inventory)))
-        self.summarize_run(lines, start_inv, end_inv)
+        end_inv = self.inventory.snapshot()
+        return self.summarize_run(lines, start_inv, end_inv)
+
+    def steady_state(self):
+        """ writes the closed-form steady state of the value stream, returning it """
+        print("", file=self.outfile)
+        print('value stream {} steady state'.format(self.stream_id), file=self.outfile)
+        return SteadyState(self.config).output_summary(self.outfile)
+
+    def evaluate(self):
+        """ 
+        runs the value stream simulation without reporting, returning the stream metrics 
+        used when many candidate value streams are compared
+        """
+        lines = self._init_lines(self.streamconfig)
+        self.shipping = self._init_shipping(self.streamconfig)
+        self.procurement = self._init_procurement(self.streamconfig, lines)
+        self._run_events(lines)
+        self._observe_depth(lines)
+        stream_ledger = self._stream_ledger(lines)
+        metrics = stream_ledger.metrics()
+        metrics['fp'] = '-'.join([line.line_identity() for line in lines])
+        metrics['id'] = self.stream_id
+        return metrics
+
+    def _run_events(self, lines):
+        """ 
+        discrete event simulation of the production lines 
+        events are (minute, line, event type, building) tuples processed in the order the 
+        lines and buildings would be stepped each minute, jumping directly between events
+        snapshots are queued after the last line so they see the completed minute,
+        shipping is queued before the first line so deliveries are in stock for the minute,
+        and procurement before shipping so supplies bought are in stock for shipments and lines
+        """
+        end = max(self.duration.to_minutes(), 1)
+        events = []
+        for lnum, line in enumerate(lines):
+            for minute, event_type, bnum in line.initial_events():
+                heapq.heappush(events, (minute, lnum, event_type, bnum))
+        if self.shipping:
+            for minute, event_type, num in self.shipping.initial_events():
+                heapq.heappush(events, (minute, -1, event_type, num))
+        if self.procurement:
+            for minute, event_type, num in self.procurement.initial_events():
+                heapq.heappush(events, (minute, -2, event_type, num))
+        if self.snapshot_interval and self.snapshot_interval.to_minutes() > 0:
+            heapq.heappush(events, (self.snapshot_interval.to_minutes(), len(lines), 0, 0))
+
+        while events and events[0][0] <= end:
+            event = heapq.heappop(events)
+            minute, lnum, event_type, bnum = event
+            self.clock.jump_to(minute)
+            if lnum == len(lines):
+                self._write_snapshot(lines)
+                heapq.heappush(events, (minute + self.snapshot_interval.to_minutes(), lnum, 0, 0))
+                continue
+            if lnum == -2:
+                result = self.procurement.process_event(self.clock, event_type, bnum)
+                restocked = result['restocked']
+            elif lnum == -1:
+                result = self.shipping.process_event(self.clock, event_type, bnum)
+                restocked = result['restocked']
+            else:
+                result = lines[lnum].process_event(self.clock, event_type, bnum)
+                restocked = result['restocked'] and lines[lnum].inventory
+            for next_minute, next_type, next_bnum in result['events']:
+                heapq.heappush(events, (next_minute, lnum, next_type, next_bnum))
+            if not restocked:
+                continue
+            # inventory may have been restocked, give starved buildings drawing from it a chance to start
+            for other_lnum, line in enumerate(lines):
+                if line.inventory is not restocked:
+                    continue
+                for other_bnum in line.waiting_buildings():
+                    retry_minute = minute
+                    if (other_lnum, ProductionLine.RECIPE_EVENT, other_bnum) <= (lnum, event_type, bnum):
+                        # the building has already been stepped this minute
+                        retry_minute = minute + 1
+                    line.schedule_retry(other_bnum, retry_minute)
+                    heapq.heappush(events, (retry_minute, other_lnum, ProductionLine.RECIPE_EVENT, other_bnum))
+
+        self.clock.jump_to(end)
+        if self.config.get('purchasing'):
+            self.config['purchasing'].flush()
+        for line in lines:
+            line.log_activity(end)
+
+    def _ledgers(self, lines):
+        """ the ledgers of every line, the shipping and the procurement """
+        ledgers = [line.ledger for line in lines]
+        if self.shipping:
+            ledgers.append(self.shipping.ledger)
+        if self.procurement:
+            ledgers.append(self.procurement.ledger)
+        return ledgers
+
+    def _stream_ledger(self, lines):
+        """ the running totals of every line, the shipping and the procurement merged into one ledger """
+        stream_ledger = Ledger(self.stream_id, 'RUN.TOTALS', None, None, self.market,
+                               self.config.get('price-curve'), self.config.get('market-depth'))
+        for ledger in self._ledgers(lines):
+            stream_ledger.add_ledger(ledger)
+        return stream_ledger
+
+    def _observe_depth(self, lines):
+        """
+        sets the sell-through of each output from the units the stream produces and consumes per day,
+        outputs are valued at the sell-through so it is observed before any ledger is summarized
+        """
+        depth = self.config.get('market-depth')
+        if depth is None:
+            return
+        days = max(self.clock.to_minutes(), 1) / float(MINUTES_PER_DAY)
+        totals = {}
+        for ledger in self._ledgers(lines):
+            for key, count in ledger.totals.items():
+                if key[0] in [Ledger.OUTPUT, Ledger.INPUT]:
+                    totals[key] = totals.get(key, 0.0) + count
+        outputs = {}
+        inputs = {}
+        for (itemtype, product), count in totals.items():
+            if itemtype == Ledger.OUTPUT:
+                outputs[product] = count / days
+            else:
+                inputs[product] = count / days
+        depth.observe(outputs, inputs)
+
+    def _write_snapshot(self, lines):
+        """ streams the running totals of each line and the stream as one JSON line """
+        if self.config.get('purchasing'):
+            self.config['purchasing'].flush()
+        for line in lines:
+            line.log_activity(self.clock.to_minutes())
+        self._observe_depth(lines)
+        snapshot = {
+            'id': self.stream_id,
+            'clock': str(self.clock),
+            'days': self.clock.to_minutes() / 1440.0,
+            'stream': self._stream_ledger(lines).snapshot(),
+            'lines': [line.ledger.snapshot() for line in lines]
+        }
+        print(json.dumps(snapshot), file=self.snapshotfile)
+        self.snapshotfile.flush()
 
     def log_run(self, summary):
         """ log the run to the run logs file """
@@ -67,9 +226,7 @@ class ValueStream(object):
         print('', file=self.outfile)
 
         print('Value Stream Summary:', file=self.outfile)
-        stream_ledger = Ledger(self.stream_id, 'RUN.TOTALS', None, None, self.market)
-        for line in lines:
-            stream_ledger.add_ledger(line.ledger)
+        stream_ledger = self._stream_ledger(lines)
         stream_summary = stream_ledger.output_summary(self.duration, self.outfile)
 
         print('', file=self.outfile)
@@ -80,6 +237,26 @@ class ValueStream(object):
             line_summary.append(line.line_identity())
             print("", file=self.outfile)
 
+        if self.shipping:
+            print('Shipping Summary:', file=self.outfile)
+            self.shipping.output_summary(self.outfile)
+            print("", file=self.outfile)
+
+        if self.procurement:
+            print('Procurement Summary:', file=self.outfile)
+            self.procurement.output_summary(self.outfile)
+            print("", file=self.outfile)
+
+        if self.config.get('purchasing'):
+            print('Purchasing Summary:', file=self.outfile)
+            self.config['purchasing'].output_summary(self.outfile)
+            print("", file=self.outfile)
+
+        if self.config.get('market-depth'):
+            print('Market Depth Summary:', file=self.outfile)
+            self.config['market-depth'].output_summary(self.outfile)
+            print("", file=self.outfile)
+
         print('Inventory Summaries:', file=self.outfile)
         start_inv.output_summary('Starting Assets', self.market, self.outfile)
         end_inv.output_summary('Ending Assets', self.market, self.outfile)
@@ -95,6 +272,9 @@ class ValueStream(object):
             'cdate': self.config_date,
             'id': self.stream_id
         })
+        stream_summary['fp'] = '-'.join(line_summary)
+        stream_summary['id'] = self.stream_id
+        return stream_summary
 
     def calc_output(self, starting, ending):
         """ calculate valuestream outputs """
@@ -108,7 +288,7 @@ class ValueStream(object):
 
     def calc_mkt_values(self, net_prod):
         """ calculate the market values of the produced outputs """
-        total = Price()
+        total = PriceAccumulator()
         subtotals = {}
         for product in net_prod:
             num_produced = net_prod[product]
@@ -116,6 +296,6 @@ class ValueStream(object):
                 price = self.market.price(product)
                 subtotal = price.multiply(num_produced)
                 subtotals[product] = subtotal
-                total = total.add(subtotal)
-        return {"totals": total, "subtotals": subtotals}
+                total.add(subtotal)
+        return {"totals": total.total(), "subtotals": subtotals}
    
\ No newline at end of file